@@ -27,10 +27,12 @@ export async function POST(req: NextRequest) {
     // burada textSplitter kullanıyoruz (aynı ayarlarla)
     const chunks = await textSplitter.splitText(text);
 
-    // Her chunk'ı işle ve DB'ye kaydet
-    for (const chunk of chunks) {
-      // Chunk'ı embedding modeline gönder (vektöre dönüştür)
-      const emb = await embeddings.embedQuery(chunk);
+    // Tüm chunk'ları toplu embed et (chunk başına ayrı istek yerine)
+    const vectors = await embeddings.embedDocuments(chunks);
+
+    // Her chunk'ı DB'ye kaydet
+    for (const [idx, chunk] of chunks.entries()) {
+      const emb = vectors[idx];
 
       // Veritabanına insert et
       // Fark: Burada embedding direkt array string'i gönderiliyor
@@ -4,6 +4,11 @@ import { NextRequest, NextResponse } from "next/server";
 import { pool } from "@/lib/rag/db";
 import { embeddings, llm } from "@/lib/rag/chain";
 
+// Reranker'a tanınan süre (ms): aşılacaksa sunucu erken 504 döner, vector sırası kullanılır
+const RERANKER_DEADLINE_MS = Number(process.env.RERANKER_DEADLINE_MS || 20000);
+// Tek replika (reranker_server.py) ya da birden fazla replikanın önündeki rerank_router.py
+const RERANKER_URL = process.env.RERANKER_URL || 'http://localhost:8000';
+
 export async function POST(req: NextRequest) {
   try {
     // Request body'den parametreleri oku
@@ -91,24 +96,33 @@ export async function POST(req: NextRequest) {
       const rerankerPayload = {
         query: question,
         documents: result.rows.map(r => r.content),
-        top_k: 10
+        top_k: 10,
+        // Sunucu bu sürede bitiremeyeceğini tahmin ederse hemen 504 döner;
+        // süre dolunca bitmeyen dokümanlar unscored_indices ile gelir
+        deadline_ms: RERANKER_DEADLINE_MS,
+        partial: true
       };
       
       console.log(`  📤 Reranker'a gönderiliyor: ${result.rows.length} dokuman...`);
       
       // Promise.race ile timeout simüle et (AbortSignal.timeout uyumluluk için)
-      const rerankerPromise = fetch('http://localhost:8000/rerank', {
+      // Deadline sunucuda uygulanır; buradaki timeout sadece ağ/sunucu asılı kalırsa devreye girer
+      const rerankerPromise = fetch(`${RERANKER_URL}/rerank`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(rerankerPayload)
       });
       
       const timeoutPromise = new Promise((_, reject) =>
-        setTimeout(() => reject(new Error('Reranker timeout (180s)')), 180000)
+        setTimeout(() => reject(new Error(`Reranker timeout (${RERANKER_DEADLINE_MS + 5000}ms)`)), RERANKER_DEADLINE_MS + 5000)
       );
       
       const rerankerResponse = await Promise.race([rerankerPromise, timeoutPromise]) as Response;
       
+      if (rerankerResponse.status === 504) {
+        const estimatedWait = rerankerResponse.headers.get('X-Estimated-Wait-Ms');
+        throw new Error(`Reranker deadline'a yetişemez (tahmini bekleme: ${estimatedWait ?? '?'}ms)`);
+      }
       if (!rerankerResponse.ok) {
         throw new Error(`Reranker HTTP ${rerankerResponse.status}`);
       }
@@ -116,6 +130,13 @@ export async function POST(req: NextRequest) {
       const rerankerData = await rerankerResponse.json();
       rerankResults = rerankerData.ranked_documents || [];
       
+      // Deadline'a yetişmeyen dokümanlar skorlananların arkasına vector sırasıyla eklenir
+      const unscored: number[] = rerankerData.unscored_indices || [];
+      if (unscored.length > 0) {
+        console.warn(`  ⏱️ ${unscored.length} dokuman deadline'a yetişmedi, vector sırasıyla ekleniyor`);
+        rerankResults = rerankResults.concat(unscored.map((index: number) => ({ index, score: 0 })));
+      }
+      
       console.log(`✅ Qwen reranker başarılı: ${rerankResults.length} ranked dokuman`);
     } catch (rerankerError: any) {
       console.warn(`⚠️ Qwen reranker kullanılamadı: ${rerankerError.message}`);
@@ -45,7 +45,7 @@ if (typeof global !== 'undefined' && !(global as any).DOMMatrix) {
 import { NextRequest, NextResponse } from 'next/server'
 import { PDFLoader } from '@langchain/community/document_loaders/fs/pdf'
 import { RecursiveCharacterTextSplitter } from '@langchain/textsplitters'
-import { OpenAIEmbeddings } from "@langchain/openai"
+import { embeddings } from '@/lib/rag/chain'
 import { pool } from '@/lib/rag/db'
 import fs from 'fs'
 import path from 'path'
@@ -67,13 +67,7 @@ export async function POST(req: NextRequest) {
   console.log('Upload başladı:', { userId, fileCount: files.length })
 
   try {
-    // OpenAI embedding modeli başlat
-    // text-embedding-3-small: Küçük ve hızlı model (1536 boyutlu vektör üretir)
-    const embeddings = new OpenAIEmbeddings({
-      apiKey: process.env.OPENAI_API_KEY!,
-      modelName: "text-embedding-3-small",
-    })
-
+    // Embedding client'ı chain.ts'ten (sorgularla aynı model, aynı boyut: EMBEDDING_BASE_URL / EMBEDDING_DIMENSIONS)
     // Her dosya için ayrı bir veri array'i tutuyoruz (chunk'ları dosya başına sayabilmek için)
     const allDocs: Array<{file: string, doc: any}> = []
 
@@ -113,8 +107,8 @@ export async function POST(req: NextRequest) {
           // 🖼️ VLM ile görselleri ve tabloları analiz et (OPSİYONEL - VLM fail olsa bile devam et)
           console.log(`🔍 VLM analizi başlanıyor...`)
           try {
-            // VLM server'ı check et
-            const healthCheck = await fetch('http://localhost:8001/health')
+            // VLM server'ı check et (model yüklenip ısınana kadar /health/ready 503 döner)
+            const healthCheck = await fetch('http://localhost:8001/health/ready')
               .then(r => r.ok ? true : false)
               .catch(() => false)
             
@@ -123,41 +117,13 @@ export async function POST(req: NextRequest) {
               // VLM fail olsa bile devam et (error throw etme)
             } else {
               console.log(`✅ VLM server sağlıklı, analiz ediliyor...`)
-              // VLM sunucusuna PDF sayfalarını gönder ve tablo/grafikleri çıkart
-              const vlmResults: any[] = []
-              
-              // Her PDF sayfası için VLM'e sor
-              for (let pageIdx = 0; pageIdx < docs.length; pageIdx++) {
-                const page = docs[pageIdx];
-                try {
-                  console.log(`  📄 Sayfa ${pageIdx + 1}/${docs.length} analiz ediliyor...`)
-                  // VLM'e gönder (sadece text-based analiz, görsel parsing PDFLoader'dan)
-                  const vlmResponse = await fetch('http://localhost:8001/analyze', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                      page_content: page.pageContent,
-                      page_number: pageIdx + 1,
-                      file_name: file.name
-                    }),
-                    signal: AbortSignal.timeout(5000) // 5 saniye timeout
-                  }).catch(() => null)
-                  
-                  if (vlmResponse && vlmResponse.ok) {
-                    const vlmData = await vlmResponse.json()
-                    if (vlmData.tables && vlmData.tables.length > 0) {
-                      vlmResults.push({
-                        page: pageIdx + 1,
-                        tables: vlmData.tables,
-                        has_analysis: true
-                      })
-                      console.log(`    ✅ ${vlmData.tables.length} tablo bulundu`)
-                    }
-                  }
-                } catch (pageError) {
-                  console.warn(`  ⚠️ Sayfa ${pageIdx + 1} VLM analizi atlandı`)
-                }
-              }
+              // PDF sayfalarını görsel olarak render edip toplu halde VLM'e gönder,
+              // tablo/grafik/diyagram bulunan sayfaları tut. Analiz upload isteğinin içinde
+              // çalıştığı için ilk VLM_MAX_PAGES sayfa ve toplam VLM_DEADLINE_MS ile sınırlı
+              const { extractContentWithVLM, VLM_MAX_PAGES, VLM_DEADLINE_MS } = await import('@/lib/rag/pdf-vlm-analyzer')
+              const vlmResults = (await extractContentWithVLM(
+                tempPath, Math.min(docs.length, VLM_MAX_PAGES), file.name, 'extract', VLM_DEADLINE_MS
+              )).filter((result) => result.contentType !== 'text')
               
               if (vlmResults.length === 0) {
                 console.log(`ℹ️ VLM: Tablo analizi yapılmadı (belgede tablo yok veya VLM analiz etmedi)`)
@@ -335,6 +301,27 @@ export async function POST(req: NextRequest) {
       nextFileId++  // Sonraki dosya için ID'yi artır
     }
     
+    // Chunk metinlerini temizle: null karakterleri ve kontrol karakterlerini kaldır
+    const cleanContents = splitDocs.map(doc => doc.pageContent
+      .replace(/\u0000/g, '')           // Null karakterleri kaldır
+      .replace(/[\x00-\x1F\x7F]/g, '')  // Kontrol karakterlerini kaldır
+      .replace(/[\uFEFF]/g, '')          // BOM karakterini kaldır
+      .replace(/[^\x20-\x7E\xA0-\xFF]/g, '') // Baskı yapılamayan karakterleri kaldır
+      .trim())
+
+    // Tüm chunk'ları toplu embed et: chunk başına bir istek yerine embedDocuments
+    // metinleri batchSize'lık isteklere böler (lokal embedding server'da da tek forward'da toplanır)
+    // Toplu istek başarısız olursa aşağıdaki döngü o chunk'ları tek tek dener
+    const chunkEmbeddings: (number[] | undefined)[] = new Array(splitDocs.length)
+    const embedIndices = cleanContents.flatMap((content, idx) => content ? [idx] : [])
+    try {
+      const vectors = await embeddings.embedDocuments(embedIndices.map(idx => cleanContents[idx]))
+      embedIndices.forEach((docIndex, k) => { chunkEmbeddings[docIndex] = vectors[k] })
+      console.log(`🧬 ${vectors.length} chunk toplu embed edildi`)
+    } catch (embedErr: any) {
+      console.error('⚠️ Toplu embedding hatası, chunk\'lar tek tek denenecek:', embedErr.message)
+    }
+    
     for (let i = 0; i < splitDocs.length; i++) {
       const doc = splitDocs[i]
       // Metadata'dan bilgiler oku
@@ -349,14 +336,8 @@ export async function POST(req: NextRequest) {
       doc.metadata = { ...baseMeta, chunk: chunkNum, page, lineNumber }
       
       try {
-        // Bu chunk'ı embedding modeline gönder (vektör halinde kodla)
-        // Önce metni temizle: null karakterleri ve kontrol karakterlerini kaldır
-        let cleanContent = doc.pageContent
-          .replace(/\u0000/g, '')           // Null karakterleri kaldır
-          .replace(/[\x00-\x1F\x7F]/g, '')  // Kontrol karakterlerini kaldır
-          .replace(/[\uFEFF]/g, '')          // BOM karakterini kaldır
-          .replace(/[^\x20-\x7E\xA0-\xFF]/g, '') // Baskı yapılamayan karakterleri kaldır
-          .trim();
+        // Temizlenmiş metin ve toplu hesaplanan embedding'i
+        const cleanContent = cleanContents[i]
         
         // Boş metin kontrol et
         if (!cleanContent) {
@@ -364,7 +345,8 @@ export async function POST(req: NextRequest) {
           continue;
         }
         
-        const embedding = await embeddings.embedQuery(cleanContent)
+        // Toplu embedding başarısız olduysa bu chunk'ı tek başına embed et
+        const embedding = chunkEmbeddings[i] ?? (await embeddings.embedDocuments([cleanContent]))[0]
         
         // Embedding başarılı mı kontrol et
         if (!embedding || embedding.length === 0) {
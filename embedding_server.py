@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+🧬 EMBEDDING SERVER
+Lokal çok dilli embedding modeli (varsayılan Qwen/Qwen3-Embedding-0.6B) için
+OpenAI uyumlu /v1/embeddings endpoint'i
+
+- LangChain OpenAIEmbeddings / openai istemcileri sadece baseURL değiştirilerek
+  kullanılır (EMBEDDING_BASE_URL=http://localhost:8003/v1); istekteki model adı
+  yanıtta aynen geri döner, hangi model adı gelirse gelsin lokal model kullanılır
+- Dinamik batching: eşzamanlı isteklerin metinleri ortak forward pass'lerde
+  toplanır (EMBEDDING_MAX_BATCH_SIZE / EMBEDDING_MAX_WAIT_MS)
+- Sorgu cache'i: `input` tek string ise (embedQuery) sorgu sayılır; sorgu
+  talimatı eklenir ve sonuç LRU cache'te tutulur. Liste girdiler
+  (embedDocuments) doküman sayılır, talimatsız embed edilir
+- Boyut: EMBEDDING_DIMENSIONS ya da istekteki `dimensions` ile vektör ilk N
+  boyuta kısaltılıp yeniden normalize edilir (Matryoshka eğitimli modellerde
+  kalite korunur)
+- encoding_format: "float" ya da "base64" (openai-node varsayılanı)
+"""
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List, NamedTuple, Optional, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import logging
+import os
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from transformers import AutoModel, AutoTokenizer
+
+from lib.rag.rerank_precision import apply_precision, load_dtype
+from lib.rag.cpu_placement import placement_from_env
+
+# Logging ayarla
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Embedding Server", version="1.0.0")
+
+# Model ayarları (ortam değişkenleri ile değiştirilebilir)
+# POOLING: "last" (Qwen3-Embedding: son token, sola padding), "mean" (e5), "cls" (bge)
+# DIMENSIONS: Boşsa modelin kendi boyutu; doluysa vektörler bu boyuta kısaltılır
+# QUERY_INSTRUCTION: Sorgulara eklenen talimat (talimatsız modellerde boş bırakılmalı)
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "Qwen/Qwen3-Embedding-0.6B")
+PRECISION = os.environ.get("EMBEDDING_PRECISION", "fp32")
+POOLING = os.environ.get("EMBEDDING_POOLING", "last")
+MAX_LENGTH = int(os.environ.get("EMBEDDING_MAX_LENGTH", "512"))
+DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "0")) or None
+QUERY_INSTRUCTION = os.environ.get(
+    "EMBEDDING_QUERY_INSTRUCTION", "Given a search query, retrieve relevant passages that answer the query"
+)
+PORT = int(os.environ.get("EMBEDDING_PORT", "8003"))
+
+# Dinamik batching ayarları
+MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.environ.get("EMBEDDING_MAX_WAIT_MS", "5"))
+MAX_QUEUE = int(os.environ.get("EMBEDDING_MAX_QUEUE", "8192"))
+# Tek istekte kabul edilen en fazla metin (OpenAI sınırı 2048)
+MAX_INPUTS = int(os.environ.get("EMBEDDING_MAX_INPUTS", "2048"))
+# Sorgu cache'i: kayıt sayısı (0 kapatır)
+CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+
+# Global model ve tokenizer
+model = None
+tokenizer = None
+device = None
+native_dimensions: Optional[int] = None
+cpu_placement = None
+
+# Yükleme durumu: loading → ready (ya da failed)
+PROCESS_STARTED = time.time()
+load_state = "loading"
+load_error: Optional[str] = None
+time_to_ready: Optional[float] = None
+load_task: Optional[asyncio.Task] = None
+
+
+class EmbeddingRequest(BaseModel):
+    """OpenAI /v1/embeddings isteği"""
+    input: Union[str, List[str], List[int], List[List[int]]]
+    model: str = MODEL_NAME
+    dimensions: Optional[int] = None
+    encoding_format: str = "float"  # "float" | "base64"
+    user: Optional[str] = None
+
+
+class QueueFullError(Exception):
+    """Kuyruk dolu: istek sıraya alınamadı"""
+
+
+class Embedding(NamedTuple):
+    """Tek metnin vektörü ve forward pass'teki (truncation sonrası) token sayısı"""
+    vector: np.ndarray
+    tokens: int
+
+
+class QueryCache:
+    """Sorgu metni → tam boyutlu normalize vektör + token sayısı (LRU)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Embedding]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[Embedding]:
+        embedding = self._entries.get(text)
+        if embedding is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(text)
+        self.hits += 1
+        return embedding
+
+    def put(self, text: str, embedding: Embedding):
+        if self.max_entries <= 0:
+            return
+        self._entries[text] = embedding
+        self._entries.move_to_end(text)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class EmbeddingBatcher:
+    """
+    Eşzamanlı isteklerin metinlerini ortak forward pass'lerde toplar
+
+    reranker_server.MicroBatchScheduler ile aynı düzen: ilk metin geldiğinde en
+    fazla max_wait_ms beklenir, max_batch_size'a kadar metin toplanır ve tek
+    thread'lik executor'da embed edilir. Batch içinde metinler uzunluğa göre
+    sıralanır (benzer uzunluklar aynı forward'da: daha az padding).
+    """
+
+    THROUGHPUT_ALPHA = 0.2
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float, max_queue: int):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue = max(1, max_queue)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self._executor = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.batches = 0
+        self.texts_per_second: Optional[float] = None
+
+    def start(self):
+        if self._task is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-inference")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, texts: List[str]) -> List[Embedding]:
+        """Metinleri kuyruğa ekle ve vektörlerini (token sayılarıyla) aynı sırayla döndür"""
+        if self.queue_size + len(texts) > self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Kuyruk dolu ({self.queue_size}/{self.max_queue} metin bekliyor)")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = [item for item in await self._collect_batch() if not item[1].done()]
+            if not batch:
+                continue
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            self.in_flight = len(batch)
+            try:
+                embeddings = await loop.run_in_executor(self._executor, embed_texts, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.in_flight = 0
+            self.batches += 1
+            elapsed = loop.time() - started
+            if elapsed > 0:
+                throughput = len(batch) / elapsed
+                if self.texts_per_second is None:
+                    self.texts_per_second = throughput
+                else:
+                    self.texts_per_second += self.THROUGHPUT_ALPHA * (throughput - self.texts_per_second)
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+
+batcher = EmbeddingBatcher(MAX_BATCH_SIZE, MAX_WAIT_MS, MAX_QUEUE)
+query_cache = QueryCache(CACHE_SIZE)
+
+
+def _pool(hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Token vektörlerinden metin vektörü"""
+    if POOLING == "cls":
+        return hidden[:, 0]
+    if POOLING == "mean":
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        return (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    # last: sola padding'de son pozisyon her zaman son gerçek token
+    return hidden[:, -1]
+
+
+@torch.inference_mode()
+def embed_texts(texts: List[str]) -> List[Embedding]:
+    """
+    Metinleri embed et (inference thread'inde çalışır); tam boyutlu, L2 normalize
+
+    Token sayıları attention mask'ten gelir: usage için metinler event loop'ta
+    yeniden tokenize edilmez.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    inputs = tokenizer(
+        [texts[i] for i in order], padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt"
+    ).to(device)
+    hidden = model(**inputs).last_hidden_state
+    pooled = F.normalize(_pool(hidden, inputs["attention_mask"]).float(), p=2, dim=1).cpu().numpy()
+    lengths = inputs["attention_mask"].sum(dim=1).tolist()
+    embeddings: List[Optional[Embedding]] = [None] * len(texts)
+    for position, index in enumerate(order):
+        embeddings[index] = Embedding(pooled[position], int(lengths[position]))
+    return embeddings
+
+
+def _truncate(vector: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """Matryoshka kısaltma: ilk N boyut + yeniden normalize"""
+    if not dimensions or dimensions >= vector.shape[0]:
+        return vector
+    head = vector[:dimensions]
+    norm = float(np.linalg.norm(head))
+    return head / norm if norm > 0 else head
+
+
+def _encode(vector: np.ndarray, encoding_format: str):
+    if encoding_format == "base64":
+        # OpenAI biçimi: little-endian float32 byte'ları
+        return base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+    return vector.tolist()
+
+
+def _load_model_sync():
+    """Model ve tokenizer'ı yükle (event loop'u bloklamamak için ayrı thread'de çalışır)"""
+    global model, tokenizer, device, native_dimensions, cpu_placement
+
+    cpu_placement = placement_from_env("EMBEDDING")
+    logger.info(f"🤖 {MODEL_NAME} embedding modeli yükleniyor...")
+    started = time.perf_counter()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, trust_remote_code=True)
+    # Son token pooling'inde son pozisyon gerçek token olmalı
+    tokenizer.padding_side = "left" if POOLING == "last" else "right"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    loaded = AutoModel.from_pretrained(MODEL_NAME, torch_dtype=load_dtype(PRECISION), trust_remote_code=True)
+    if device.type != "cpu":
+        loaded = loaded.to(device)
+    model = apply_precision(loaded, PRECISION).eval()
+    native_dimensions = int(embed_texts(["ısınma"])[0].vector.shape[0])
+    if DIMENSIONS and DIMENSIONS > native_dimensions:
+        raise ValueError(f"EMBEDDING_DIMENSIONS={DIMENSIONS} modelin boyutundan ({native_dimensions}) büyük")
+    logger.info(
+        f"✅ Model yüklendi ({time.perf_counter() - started:.1f}s, device={device}, "
+        f"boyut={DIMENSIONS or native_dimensions}/{native_dimensions}, pooling={POOLING})"
+    )
+
+
+async def load_model():
+    """Modeli arka planda yükle; bitince batcher başlar ve sunucu hazır olur"""
+    global load_state, load_error, time_to_ready
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _load_model_sync)
+    except Exception as e:
+        load_state = "failed"
+        load_error = str(e)
+        logger.error(f"❌ Model yükleme hatası: {e}")
+        return
+    batcher.start()
+    time_to_ready = time.time() - PROCESS_STARTED
+    load_state = "ready"
+    logger.info(f"🟢 Embedding server hazır ({time_to_ready:.1f}s)")
+
+
+@app.on_event("startup")
+async def start_loading():
+    global load_task
+    load_task = asyncio.create_task(load_model())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await batcher.stop()
+
+
+def _require_ready():
+    if load_state == "failed":
+        raise HTTPException(status_code=500, detail=f"Model yüklenemedi: {load_error}")
+    if load_state != "ready":
+        raise HTTPException(status_code=503, detail="Model henüz hazır değil", headers={"Retry-After": "5"})
+
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: EmbeddingRequest):
+    """OpenAI uyumlu embedding: tek string sorgu (talimat + cache), liste doküman sayılır"""
+    _require_ready()
+
+    if request.encoding_format not in ("float", "base64"):
+        raise HTTPException(status_code=400, detail="encoding_format 'float' ya da 'base64' olmalı")
+    dimensions = request.dimensions or DIMENSIONS
+    if dimensions is not None and not 0 < dimensions <= native_dimensions:
+        raise HTTPException(status_code=400, detail=f"dimensions 1-{native_dimensions} arasında olmalı")
+
+    is_query = isinstance(request.input, str)
+    texts = [request.input] if is_query else request.input
+    if not texts:
+        raise HTTPException(status_code=400, detail="input boş olamaz")
+    if not all(isinstance(text, str) for text in texts):
+        raise HTTPException(status_code=400, detail="Token id girdisi desteklenmiyor; metin gönderin")
+    if len(texts) > MAX_INPUTS:
+        raise HTTPException(status_code=400, detail=f"Tek istekte en fazla {MAX_INPUTS} metin")
+
+    try:
+        if is_query:
+            text = f"Instruct: {QUERY_INSTRUCTION}\nQuery:{texts[0]}" if QUERY_INSTRUCTION else texts[0]
+            embedding = query_cache.get(text)
+            if embedding is None:
+                embedding = (await batcher.submit([text]))[0]
+                query_cache.put(text, embedding)
+            embeddings = [embedding]
+        else:
+            embeddings = await batcher.submit(texts)
+    except QueueFullError as e:
+        logger.warning(f"⏳ İstek reddedildi: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"❌ Embedding hatası: {e}")
+        raise HTTPException(status_code=500, detail=f"Embedding hatası: {e}")
+
+    # usage için token sayısı (OpenAI istemcileri bekliyor): forward pass'in attention mask'inden
+    prompt_tokens = sum(embedding.tokens for embedding in embeddings)
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i,
+             "embedding": _encode(_truncate(embedding.vector, dimensions), request.encoding_format)}
+            for i, embedding in enumerate(embeddings)
+        ],
+        "model": request.model,
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+    }
+
+
+@app.get("/v1/models")
+async def list_models():
+    """OpenAI istemcilerinin model listesi (tek lokal model)"""
+    return {"object": "list", "data": [{"id": MODEL_NAME, "object": "model", "owned_by": "local"}]}
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    if load_state == "ready":
+        return {"status": "ready", "time_to_ready_s": round(time_to_ready, 2)}
+    if load_state == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": load_error})
+    return JSONResponse(status_code=503, content={"status": load_state}, headers={"Retry-After": "5"})
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "healthy" if load_state == "ready" else load_state,
+        "model": MODEL_NAME,
+        "device": str(device),
+        "precision": PRECISION,
+        "pooling": POOLING,
+        "dimensions": DIMENSIONS or native_dimensions,
+        "native_dimensions": native_dimensions,
+        "max_length": MAX_LENGTH,
+        "max_batch_size": MAX_BATCH_SIZE,
+        "max_wait_ms": MAX_WAIT_MS,
+        "queue_size": batcher.queue_size,
+        "batches": batcher.batches,
+        "rejected": batcher.rejected,
+        "texts_per_second": round(batcher.texts_per_second, 2) if batcher.texts_per_second else None,
+        "query_cache": query_cache.stats(),
+        "placement": cpu_placement.report() if cpu_placement is not None else None,
+        "time_to_ready_s": round(time_to_ready, 2) if time_to_ready is not None else None,
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
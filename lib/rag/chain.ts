@@ -44,9 +44,17 @@ import { Document } from "@langchain/core/documents";
 // ✅ Dimension'ı kontrol et (ALTER TABLE documents ALTER COLUMN embedding TYPE vector(3072))
 // ✅ Env variable'ı set et (OPENAI_API_KEY)
 //
+// LOKAL EMBEDDING (embedding_server.py):
+// - EMBEDDING_BASE_URL=http://localhost:8003/v1 → istekler OpenAI yerine lokal modele gider
+// - EMBEDDING_DIMENSIONS: Vektör boyutu (pgvector kolonu ile aynı olmalı)
+// - Model değişince tüm dokümanlar yeniden embed edilmeli (farklı vektör uzayı)
+//
 export const embeddings = new OpenAIEmbeddings({
-  apiKey: process.env.OPENAI_API_KEY!,
-  modelName: "text-embedding-3-small", // ⭐ Hızlı ve ekonomik seçenek
+  apiKey: process.env.OPENAI_API_KEY || "local",
+  modelName: "text-embedding-3-small", // ⭐ Hızlı ve ekonomik seçenek (lokal server'da sadece etiket)
+  dimensions: process.env.EMBEDDING_DIMENSIONS ? Number(process.env.EMBEDDING_DIMENSIONS) : undefined,
+  batchSize: Number(process.env.EMBEDDING_BATCH_SIZE || 256), // embedDocuments'ın istek başına metin sayısı
+  configuration: process.env.EMBEDDING_BASE_URL ? { baseURL: process.env.EMBEDDING_BASE_URL } : undefined,
 });
 
 // ═══════════════════════════════════════════════════════════════════════════
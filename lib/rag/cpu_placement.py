@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+🧭 CPU YERLEŞİMİ (çekirdek / NUMA pinning)
+reranker_server.py ve vlm_transformers_server.py worker'larını CPU topolojisine
+göre çekirdek kümelerine sabitler ve torch thread sayılarını bu kümeye eşitler.
+
+Topoloji /sys/devices/system'den okunur (NUMA node'ları, fiziksel çekirdekler,
+hyperthread kardeşleri) ve process'in izinli CPU'larıyla (cgroup cpuset /
+taskset) kesiştirilir.
+
+Ayarlar (PREFIX = RERANKER / VLM):
+- <PREFIX>_CPUS: Boş = pinning yok (torch varsayılanları)
+                 "auto" = izinli tüm CPU'lar, "node1" = NUMA node 1,
+                 "0-15,32-47" = açık CPU listesi
+- <PREFIX>_CPU_RESERVE: Kümenin başından boş bırakılan fiziksel çekirdek sayısı
+                        (Next.js, OS kesmeleri, diğer sunucu)
+- <PREFIX>_SMT: 1 ise hyperthread kardeşleri de kullanılır (varsayılan: çekirdek
+                başına tek mantıksal CPU - GEMM ağırlıklı yükte kardeşler hızlandırmaz)
+
+Worker'lar NUMA node'larına dengeli dağıtılır; bir worker mümkünse tek node
+içinde kalır (bellek erişimi lokal). Çoklu worker modunda her worker ortak bir
+dizindeki slot dosyalarından birini flock ile alır - ölen worker'ın yerine
+gelen worker aynı çekirdekleri devralır.
+
+Planı görmek için (pinning uygulamadan):
+  python lib/rag/cpu_placement.py --cpus auto --workers 4 --reserve 2
+"""
+
+import argparse
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SYSFS_ROOT = "/sys/devices/system"
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Linux CPU listesi ("0-3,8,10-11") → [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    """[0, 1, 2, 3, 8] → "0-3,8" """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+@dataclass
+class CpuTopology:
+    """İzinli CPU'ların NUMA node / fiziksel çekirdek yapısı"""
+    allowed: List[int]  # Process'in çalışabildiği mantıksal CPU'lar
+    nodes: Dict[int, List[int]]  # NUMA node → izinli mantıksal CPU'lar
+    cores: Dict[int, List[int]]  # Çekirdeğin ilk mantıksal CPU'su → hyperthread kardeşleri (izinliler)
+
+    def core_node(self, core: int) -> int:
+        for node, cpus in self.nodes.items():
+            if core in cpus:
+                return node
+        return 0
+
+    def summary(self) -> dict:
+        return {
+            "logical_cpus": len(self.allowed),
+            "physical_cores": len(self.cores),
+            "numa_nodes": {node: format_cpu_list(cpus) for node, cpus in sorted(self.nodes.items())},
+            "smt": any(len(siblings) > 1 for siblings in self.cores.values()),
+        }
+
+
+def read_topology(sysfs_root: str = SYSFS_ROOT) -> CpuTopology:
+    """sysfs'ten topolojiyi oku (okunamayan kısımlarda tek node / CPU başına çekirdek varsayılır)"""
+    allowed = sorted(os.sched_getaffinity(0))
+    allowed_set = set(allowed)
+
+    nodes: Dict[int, List[int]] = {}
+    for path in glob.glob(os.path.join(sysfs_root, "node", "node[0-9]*")):
+        cpulist = _read(os.path.join(path, "cpulist"))
+        cpus = [cpu for cpu in parse_cpu_list(cpulist or "") if cpu in allowed_set]
+        if cpus:
+            nodes[int(re.sub(r"\D", "", os.path.basename(path)))] = cpus
+    if not nodes:
+        nodes = {0: list(allowed)}
+
+    cores: Dict[int, List[int]] = {}
+    seen = set()
+    for cpu in allowed:
+        if cpu in seen:
+            continue
+        siblings_text = _read(os.path.join(sysfs_root, "cpu", f"cpu{cpu}", "topology", "thread_siblings_list"))
+        siblings = [s for s in parse_cpu_list(siblings_text or str(cpu)) if s in allowed_set] or [cpu]
+        cores[siblings[0]] = siblings
+        seen.update(siblings)
+    return CpuTopology(allowed=allowed, nodes=nodes, cores=cores)
+
+
+@dataclass
+class WorkerPlacement:
+    """Bir worker'a düşen CPU kümesi ve thread sayıları"""
+    worker: int
+    cpus: List[int]
+    numa_nodes: List[int]
+    physical_cores: int
+    intra_op_threads: int
+    interop_threads: int = 1
+    applied: Dict[str, object] = field(default_factory=dict)
+
+    def report(self) -> dict:
+        entry = asdict(self)
+        entry["cpus"] = format_cpu_list(self.cpus)
+        return entry
+
+
+def select_cpus(topology: CpuTopology, spec: str) -> List[int]:
+    """<PREFIX>_CPUS değerini izinli CPU listesine çevir"""
+    spec = spec.strip().lower()
+    if spec == "auto":
+        return list(topology.allowed)
+    if spec.startswith("node"):
+        selected = []
+        for node in parse_cpu_list(spec[4:]):
+            if node not in topology.nodes:
+                raise ValueError(f"NUMA node {node} yok ya da izinli CPU'su yok (mevcut: {sorted(topology.nodes)})")
+            selected.extend(topology.nodes[node])
+        return sorted(selected)
+    selected = [cpu for cpu in parse_cpu_list(spec) if cpu in set(topology.allowed)]
+    if not selected:
+        raise ValueError(f"'{spec}' listesindeki CPU'ların hiçbiri izinli değil (izinli: {format_cpu_list(topology.allowed)})")
+    return selected
+
+
+def plan_placement(topology: CpuTopology, spec: str, workers: int = 1, reserve: int = 0,
+                   smt: bool = False, interop_threads: int = 1) -> List[WorkerPlacement]:
+    """
+    Seçilen CPU'ları worker'lara böl
+
+    Çekirdekler NUMA node'larına göre gruplanır, ilk `reserve` çekirdek boş
+    bırakılır. Worker'lar node'lara çekirdek sayısıyla orantılı dağıtılır;
+    her node'un çekirdekleri kendi worker'ları arasında ardışık bloklara bölünür.
+    Node sayısından az worker varsa bir worker birden fazla node alır.
+    """
+    selected = set(select_cpus(topology, spec))
+    node_cores: Dict[int, List[List[int]]] = defaultdict(list)
+    for first, siblings in sorted(topology.cores.items()):
+        usable = [cpu for cpu in siblings if cpu in selected]
+        if usable:
+            node_cores[topology.core_node(first)].append(usable)
+
+    # Rezerv: kümenin başındaki çekirdekler (cpu0 kesmeleri ve diğer process'ler için)
+    for node in sorted(node_cores):
+        taken = min(reserve, len(node_cores[node]))
+        node_cores[node] = node_cores[node][taken:]
+        reserve -= taken
+    node_cores = {node: cores for node, cores in node_cores.items() if cores}
+    total_cores = sum(len(cores) for cores in node_cores.values())
+    if total_cores < workers:
+        raise ValueError(f"{workers} worker için yeterli çekirdek yok ({total_cores} çekirdek, rezerv sonrası)")
+
+    # Worker'ları node'lara çekirdek sayısıyla orantılı dağıt (her node'a en fazla çekirdek sayısı kadar)
+    if workers >= len(node_cores):
+        shares = {node: max(1, workers * len(cores) // total_cores) for node, cores in node_cores.items()}
+        while sum(shares.values()) > workers:
+            node = max(shares, key=lambda n: (shares[n], -len(node_cores[n])))
+            shares[node] -= 1
+        while sum(shares.values()) < workers:
+            node = max(shares, key=lambda n: len(node_cores[n]) / (shares[n] + 1))
+            shares[node] += 1
+        groups = []
+        for node in sorted(node_cores):
+            cores = node_cores[node]
+            count = shares[node]
+            for i in range(count):
+                groups.append(cores[i * len(cores) // count:(i + 1) * len(cores) // count])
+    else:
+        # Node'dan az worker: node'ları sırayla worker'lara ver
+        ordered = sorted(node_cores)
+        groups = [[] for _ in range(workers)]
+        for i, node in enumerate(ordered):
+            groups[i * workers // len(ordered)].extend(node_cores[node])
+
+    placements = []
+    for index, cores in enumerate(groups):
+        cpus = sorted(cpu for siblings in cores for cpu in (siblings if smt else siblings[:1]))
+        placements.append(WorkerPlacement(
+            worker=index,
+            cpus=cpus,
+            numa_nodes=sorted({topology.core_node(siblings[0]) for siblings in cores}),
+            physical_cores=len(cores),
+            intra_op_threads=len(cpus),
+            interop_threads=interop_threads,
+        ))
+    return placements
+
+
+def claim_slot(directory: str, count: int) -> int:
+    """
+    Ortak dizinde boş bir worker slot'u al (flock process ömrü boyunca tutulur)
+
+    Ölen worker'ın kilidi çekirdek tarafından bırakılır; yerine başlatılan
+    worker aynı slot'u (aynı çekirdekleri) alır.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        fd = os.open(os.path.join(directory, f"slot{index}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return index  # fd bilerek açık bırakılır
+    raise RuntimeError(f"{directory} altında boş worker slot'u yok ({count} slot dolu)")
+
+
+def _pin_process(cpus: List[int]):
+    """Process'in tüm thread'lerini CPU kümesine sabitle (sched_setaffinity(0) sadece çağıran thread'i etkiler)"""
+    for task in os.listdir("/proc/self/task"):
+        try:
+            os.sched_setaffinity(int(task), cpus)
+        except OSError:
+            pass  # Bu arada sonlanmış thread
+
+
+def apply_placement(placement: WorkerPlacement) -> WorkerPlacement:
+    """Affinity ve torch thread sayılarını uygula; uygulanan değerler placement.applied'a yazılır"""
+    import torch
+
+    _pin_process(placement.cpus)
+    torch.set_num_threads(placement.intra_op_threads)
+    try:
+        torch.set_num_interop_threads(placement.interop_threads)
+    except RuntimeError:
+        # Paralel iş başladıktan sonra değiştirilemez (ör. import sırasında torch op çalıştıysa)
+        pass
+    placement.applied = {
+        "pid": os.getpid(),
+        "affinity": format_cpu_list(sorted(os.sched_getaffinity(0))),
+        "torch_threads": torch.get_num_threads(),
+        "torch_interop_threads": torch.get_num_interop_threads(),
+    }
+    return placement
+
+
+def placement_from_env(prefix: str, workers: int = 1, interop_threads: int = 1) -> Optional[WorkerPlacement]:
+    """
+    <PREFIX>_CPUS ayarlıysa bu process'in yerleşimini seç ve uygula
+
+    workers > 1 iken slot <PREFIX>_PLACEMENT_DIR'deki kilit dosyalarından alınır
+    (ana process worker'ları başlatmadan önce dizini ayarlar).
+    """
+    spec = os.environ.get(f"{prefix}_CPUS", "")
+    if not spec:
+        return None
+    topology = read_topology()
+    placements = plan_placement(
+        topology, spec, workers,
+        reserve=int(os.environ.get(f"{prefix}_CPU_RESERVE", "0")),
+        smt=os.environ.get(f"{prefix}_SMT", "0") == "1",
+        interop_threads=interop_threads,
+    )
+    index = 0
+    if workers > 1:
+        index = claim_slot(os.environ[f"{prefix}_PLACEMENT_DIR"], workers)
+    placement = apply_placement(placements[index])
+    logger.info(
+        f"🧭 Worker {placement.worker} (pid={os.getpid()}): CPU {format_cpu_list(placement.cpus)}, "
+        f"NUMA {placement.numa_nodes}, {placement.intra_op_threads} torch thread"
+    )
+    return placement
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="CPU topolojisini ve worker yerleşim planını göster")
+    parser.add_argument("--cpus", default="auto", help='"auto", "nodeN" ya da CPU listesi ("0-15,32-47")')
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--reserve", type=int, default=0, help="Boş bırakılacak fiziksel çekirdek sayısı")
+    parser.add_argument("--smt", action="store_true", help="Hyperthread kardeşlerini de kullan")
+    args = parser.parse_args()
+
+    topology = read_topology()
+    plan = plan_placement(topology, args.cpus, args.workers, args.reserve, args.smt)
+    print(json.dumps({
+        "topology": topology.summary(),
+        "workers": [placement.report() for placement in plan],
+    }, indent=2, ensure_ascii=False))
@@ -86,6 +86,9 @@ export async function renderPdfPageToBase64(
   }
 }
 
+// VLM meşgulken (429 / 503) bir görsel için en fazla deneme sayısı
+const VLM_MAX_ATTEMPTS = 5;
+
 /**
  * VLM Server'a görsel gönder ve analiz al
  */
@@ -98,15 +101,25 @@ export async function analyzeImageWithVLM(
   confidence: number;
 }> {
   try {
-    const response = await fetch("http://localhost:8001/analyze", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        image_base64: imageBase64,
-        task: task,
-        language: "turkish",
-      }),
-    });
+    // Kuyruk doluysa (429) ya da model hazır değilse (503) Retry-After kadar bekleyip tekrar dene
+    let response: Response;
+    for (let attempt = 1; ; attempt++) {
+      response = await fetch("http://localhost:8001/analyze", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          image_base64: imageBase64,
+          task: task,
+          language: "turkish",
+        }),
+      });
+      if ((response.status !== 429 && response.status !== 503) || attempt >= VLM_MAX_ATTEMPTS) {
+        break;
+      }
+      const retryAfterS = Number(response.headers.get("Retry-After") || 5);
+      console.log(`   🕒 VLM meşgul (${response.status}), ${retryAfterS}s sonra tekrar denenecek...`);
+      await new Promise((resolve) => setTimeout(resolve, retryAfterS * 1000));
+    }
 
     if (!response.ok) {
       throw new Error(`VLM API hatası: ${response.status}`);
@@ -124,14 +137,88 @@ export async function analyzeImageWithVLM(
   }
 }
 
+// Tek /analyze/batch isteğinde gönderilen sayfa sayısı (sunucu bunları pad'lenmiş batch'lerle generate eder)
+const VLM_BATCH_PAGES = Number(process.env.VLM_BATCH_PAGES || 4);
+
+// Bir PDF'te analiz edilecek en fazla sayfa (ilk N sayfa)
+export const VLM_MAX_PAGES = Number(process.env.VLM_MAX_PAGES || 20);
+
+// Bir PDF'in VLM analizi için toplam süre; dolunca kalan sayfalar atlanır ve o ana
+// kadarki sonuçlar döner (upload isteği dakikalarca bloklanmasın)
+export const VLM_DEADLINE_MS = Number(process.env.VLM_DEADLINE_MS || 120000);
+
+/**
+ * Birden çok görseli tek istekle VLM Server'a gönder (/analyze/batch)
+ * Sonuçlar istek sırasıyla döner; başarısız öğelerde error dolu, diğerleri etkilenmez
+ */
+export async function analyzeImagesWithVLM(
+  items: Array<{ imageBase64: string; task?: string }>,
+  signal?: AbortSignal
+): Promise<
+  Array<{
+    analysis?: string;
+    contentType?: string;
+    confidence?: number;
+    error?: string;
+  }>
+> {
+  try {
+    // Kuyrukta tüm öğelere yer yoksa (429) ya da model hazır değilse (503) Retry-After kadar bekle
+    let response: Response;
+    for (let attempt = 1; ; attempt++) {
+      response = await fetch("http://localhost:8001/analyze/batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          items: items.map((item) => ({
+            image_base64: item.imageBase64,
+            task: item.task || "extract",
+            language: "turkish",
+          })),
+        }),
+        signal,
+      });
+      if ((response.status !== 429 && response.status !== 503) || attempt >= VLM_MAX_ATTEMPTS) {
+        break;
+      }
+      const retryAfterS = Number(response.headers.get("Retry-After") || 5);
+      console.log(`   🕒 VLM meşgul (${response.status}), ${retryAfterS}s sonra tekrar denenecek...`);
+      await new Promise((resolve) => setTimeout(resolve, retryAfterS * 1000));
+      signal?.throwIfAborted();
+    }
+
+    if (!response.ok) {
+      throw new Error(`VLM API hatası: ${response.status}`);
+    }
+
+    const batch = await response.json();
+    return batch.results.map((item: any) =>
+      item.result
+        ? {
+            analysis: item.result.analysis,
+            contentType: item.result.content_type,
+            confidence: item.result.confidence,
+          }
+        : { error: item.error || `VLM öğe hatası: ${item.status}` }
+    );
+  } catch (error: any) {
+    console.error("❌ VLM toplu analiz hatası:", error.message);
+    throw error;
+  }
+}
+
 /**
  * PDF'den VLM analizi ile içerik çıkar
- * Sayfaları render et → VLM ile analiz et → Chunks oluştur
+ * Sayfaları render et → VLM ile toplu analiz et → Chunks oluştur
+ * Sayfalar VLM_BATCH_PAGES'lik gruplar halinde gönderilir; bir grup analiz edilirken
+ * sonraki grup render edilir. deadlineMs dolunca kalan sayfalar atlanır
  */
 export async function extractContentWithVLM(
   pdfPath: string,
-  maxPages: number = 20,
-  sourceFile: string = "unknown"
+  maxPages: number = VLM_MAX_PAGES,
+  sourceFile: string = "unknown",
+  task: string = "extract",
+  deadlineMs: number = VLM_DEADLINE_MS
 ): Promise<
   Array<{
     pageNum: number;
@@ -158,35 +245,64 @@ export async function extractContentWithVLM(
 
     // İlk maxPages sayfa analiz et
     const pagesToAnalyze = Math.min(maxPages, totalPages);
+    const deadline = Date.now() + deadlineMs;
 
-    for (let i = 1; i <= pagesToAnalyze; i++) {
-      try {
-        console.log(`   📖 Sayfa ${i}/${pagesToAnalyze} render ediliyor...`);
-
-        // Sayfayı görsele dönüştür
-        const base64 = await renderPdfPageToBase64(pdfPath, i);
-
-        console.log(`   🔍 VLM analizi yapılıyor...`);
-
-        // VLM ile analiz et
-        const analysis = await analyzeImageWithVLM(base64, "extract");
+    // Bir grup sayfayı render et (render edilemeyen sayfa atlanır)
+    const renderGroup = async (firstPage: number) => {
+      const pages: Array<{ pageNum: number; base64: string }> = [];
+      const lastPage = Math.min(firstPage + VLM_BATCH_PAGES - 1, pagesToAnalyze);
+      for (let i = firstPage; i <= lastPage; i++) {
+        try {
+          console.log(`   📖 Sayfa ${i}/${pagesToAnalyze} render ediliyor...`);
+          pages.push({ pageNum: i, base64: await renderPdfPageToBase64(pdfPath, i) });
+        } catch (pageError: any) {
+          console.warn(`   ⚠️ Sayfa ${i} render edilemedi: ${pageError.message}`);
+        }
+      }
+      return pages;
+    };
 
-        results.push({
-          pageNum: i,
-          contentType: analysis.contentType,
-          analysis: analysis.analysis,
-          confidence: analysis.confidence,
-        });
+    let nextGroup = pagesToAnalyze > 0 ? renderGroup(1) : null;
+    for (let first = 1; nextGroup; first += VLM_BATCH_PAGES) {
+      const pages = await nextGroup;
+      // Sonraki grubu, bu grup VLM'de analiz edilirken render et
+      nextGroup = first + VLM_BATCH_PAGES <= pagesToAnalyze ? renderGroup(first + VLM_BATCH_PAGES) : null;
+      if (pages.length === 0) {
+        continue;
+      }
+      const remainingMs = deadline - Date.now();
+      if (remainingMs <= 0) {
+        console.warn(
+          `   ⏱️ VLM süresi (${deadlineMs}ms) doldu: sayfa ${pages[0].pageNum}-${pagesToAnalyze} atlandı`
+        );
+        break;
+      }
 
-        console.log(
-          `   ✅ Sayfa ${i} analiz edildi (type=${analysis.contentType})`
+      console.log(`   🔍 VLM analizi yapılıyor (${pages.length} sayfa)...`);
+      try {
+        const analyses = await analyzeImagesWithVLM(
+          pages.map((page) => ({ imageBase64: page.base64, task })),
+          AbortSignal.timeout(remainingMs)
         );
-      } catch (pageError: any) {
+        analyses.forEach((analysis, index) => {
+          const pageNum = pages[index].pageNum;
+          if (analysis.error) {
+            console.warn(`   ⚠️ Sayfa ${pageNum} analiz başarısız: ${analysis.error}`);
+            return;
+          }
+          results.push({
+            pageNum,
+            contentType: analysis.contentType!,
+            analysis: analysis.analysis!,
+            confidence: analysis.confidence!,
+          });
+          console.log(`   ✅ Sayfa ${pageNum} analiz edildi (type=${analysis.contentType})`);
+        });
+      } catch (batchError: any) {
         console.warn(
-          `   ⚠️ Sayfa ${i} analiz başarısız: ${pageError.message}`
+          `   ⚠️ Sayfa ${pages[0].pageNum}-${pages[pages.length - 1].pageNum} analiz başarısız: ${batchError.message}`
         );
         // Devam et, diğer sayfaları analiz et
-        continue;
       }
     }
 
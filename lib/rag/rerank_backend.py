@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+⚙️ RERANKER INFERENCE BACKEND'LERİ
+Sınıflandırıcı modelin forward pass'ini çalıştıran backend'ler:
+
+- eager: Normal PyTorch (varsayılan)
+- compile: torch.compile(dynamic=True); inductor'ın derlenmiş kernel cache'i
+  artifact dizininde tutulur, yeniden başlatmada derleme cache'ten gelir
+- onnx: Model bir kez ONNX'e export edilir, ONNX Runtime ile çalıştırılır;
+  export edilen ve ORT'nin optimize ettiği graph artifact dizininde tutulur
+
+Artifact dizini model revizyonu + hassasiyet + backend + kütüphane sürümüyle
+anahtarlanır: model veya kütüphane güncellenince eski artifact kullanılmaz.
+
+Her backend aynı çağrı sözleşmesini uygular:
+  backend({"input_ids": ..., "attention_mask": ...}) -> logits (torch.Tensor)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "compile", "onnx")
+ONNX_MODEL = "model.onnx"
+ONNX_OPTIMIZED = "model.opt.onnx"
+ARTIFACT_META = "artifact.json"
+
+
+def model_revision(model_name: str, model) -> str:
+    """
+    Modelin revizyonu: HF commit hash'i, yoksa lokal dizindeki dosyaların
+    (ad, boyut, mtime) parmak izi
+    """
+    commit = getattr(model.config, "_commit_hash", None)
+    if commit:
+        return commit[:16]
+
+    digest = hashlib.sha256(model.config.to_json_string().encode("utf-8"))
+    if os.path.isdir(model_name):
+        for name in sorted(os.listdir(model_name)):
+            stat = os.stat(os.path.join(model_name, name))
+            digest.update(f"{name}:{stat.st_size}:{int(stat.st_mtime)}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def artifact_dir_for(root: str, model_name: str, revision: str, backend: str, precision: str) -> str:
+    """Artifact dizini (ör. reranker_artifacts/Qwen--Qwen3-Reranker-4B/<revizyon>-fp32-onnx-ort1.20.1)"""
+    if backend == "onnx":
+        import onnxruntime
+        runtime = f"ort{onnxruntime.__version__}"
+    else:
+        runtime = f"torch{torch.__version__.split('+')[0]}"
+    return os.path.join(
+        root, model_name.strip("/").replace("/", "--"), f"{revision}-{precision}-{backend}-{runtime}"
+    )
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Export/derleme için sadece logits döndüren sarmalayıcı (KV cache kapalı)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self.model(**inputs).logits
+
+
+class CompiledBackend:
+    """
+    torch.compile backend'i
+
+    Bucket'lanmış batch'lerin (batch, uzunluk) şekilleri değiştiği için dynamic=True:
+    her yeni şekil için yeniden derleme yapılmaz.
+    """
+    name = "compile"
+
+    def __init__(self, model, artifact_dir: str):
+        os.makedirs(artifact_dir, exist_ok=True)
+        # Inductor'ın FX graph / kernel cache'i bu dizine yazılır
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = artifact_dir
+        self.artifact_dir = artifact_dir
+        self.model = torch.compile(_LogitsOnly(model), dynamic=True)
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self.model(inputs["input_ids"], inputs["attention_mask"])
+
+
+class OnnxBackend:
+    """ONNX Runtime backend'i (artifact yoksa model bir kez export edilir)"""
+    name = "onnx"
+
+    def __init__(self, model, artifact_dir: str, device: torch.device, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        model_path = os.path.join(artifact_dir, ONNX_MODEL)
+        optimized_path = os.path.join(artifact_dir, ONNX_OPTIMIZED)
+        if not os.path.exists(os.path.join(artifact_dir, ARTIFACT_META)):
+            export_onnx(model, artifact_dir)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        if os.path.exists(optimized_path):
+            # ORT optimizasyonları önceki çalıştırmada yapılıp kaydedildi
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            session_path = optimized_path
+        else:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.optimized_model_filepath = optimized_path
+            # 4B model protobuf'ın 2 GB sınırını aşar: ağırlıklar ayrı dosyaya yazılır
+            options.add_session_config_entry(
+                "session.optimized_model_external_initializers_file_name", f"{ONNX_OPTIMIZED}.data"
+            )
+            options.add_session_config_entry(
+                "session.optimized_model_external_initializers_min_size_in_bytes", "1024"
+            )
+            session_path = model_path
+
+        providers = ["CPUExecutionProvider"]
+        if device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(session_path, options, providers=providers)
+        self.artifact_dir = artifact_dir
+
+    def __call__(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        logits = self.session.run(["logits"], {
+            "input_ids": inputs["input_ids"].cpu().numpy(),
+            "attention_mask": inputs["attention_mask"].cpu().numpy(),
+        })[0]
+        return torch.from_numpy(logits)
+
+
+def export_onnx(model, artifact_dir: str) -> str:
+    """
+    Modeli dinamik (batch, uzunluk) eksenleriyle ONNX'e export et
+
+    Yazma önce geçici dizine yapılır, bitince rename edilir: yarım kalan export
+    asla geçerli artifact gibi görünmez.
+    """
+    started = time.time()
+    logger.info(f"📦 ONNX export başlıyor: {artifact_dir}")
+    tmp_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # Örnek girdi: şekiller dinamik olduğu için değerler önemsiz
+    input_ids = torch.ones((2, 16), dtype=torch.long, device=model.device)
+    attention_mask = torch.ones((2, 16), dtype=torch.long, device=model.device)
+    batch = torch.export.Dim("batch", min=1, max=4096)
+    length = torch.export.Dim("length", min=2, max=32768)
+    with torch.no_grad():
+        torch.onnx.export(
+            _LogitsOnly(model),
+            (input_ids, attention_mask),
+            os.path.join(tmp_dir, ONNX_MODEL),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_shapes={"input_ids": {0: batch, 1: length}, "attention_mask": {0: batch, 1: length}},
+            dynamo=True,
+        )
+
+    with open(os.path.join(tmp_dir, ARTIFACT_META), "w", encoding="utf-8") as f:
+        json.dump({"torch": torch.__version__, "created_at": time.time()}, f, indent=2)
+
+    shutil.rmtree(artifact_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(artifact_dir)), exist_ok=True)
+    os.replace(tmp_dir, artifact_dir)
+    logger.info(f"✅ ONNX export tamamlandı ({time.time() - started:.1f}s)")
+    return artifact_dir
+
+
+def build_backend(name: str, model, model_name: str, precision: str, device: torch.device,
+                  artifact_root: str, threads: Optional[int] = None, revision: Optional[str] = None):
+    """
+    Seçilen backend'i kur; compile/onnx artifact'ları artifact_root altında cache'lenir
+
+    revision: Bilinen model revizyonu (ör. snapshot metadata'sından); verilmezse
+    model_revision() ile bulunur
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Geçersiz backend: {name} (seçenekler: {', '.join(BACKENDS)})")
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "onnx" and precision != "fp32":
+        # Dinamik quantize edilmiş / bf16 Linear'lar ORT CPU'da export edilemiyor ya da hızlanmıyor
+        raise ValueError(f"onnx backend'i sadece fp32 ile kullanılabilir (RERANKER_DTYPE={precision})")
+
+    revision = (revision or model_revision(model_name, model))[:16]
+    artifact_dir = artifact_dir_for(artifact_root, model_name, revision, name, precision)
+    logger.info(f"⚙️ Backend: {name} (artifact: {artifact_dir})")
+    if name == "compile":
+        return CompiledBackend(model, artifact_dir)
+    return OnnxBackend(model, artifact_dir, device, threads)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+📊 RERANKER THROUGHPUT BENCHMARK'I
+Sentetik Türkçe sorgu/chunk iş yüküyle batch boyutu, max_length, hassasiyet,
+backend ve torch thread sayısı kombinasyonlarını tarar; sonuçları makinece
+okunabilir (JSON / CSV) yazar
+
+Her nokta için:
+- pairs_per_sec: Toplam çift / toplam süre (tokenization + forward + softmax)
+- latency_ms: Scheduler batch'i başına gecikme (p50 / p90 / p99 / ortalama)
+- padding_ratio: Forward'lardaki pad token oranı
+- peak_rss_mb: Noktanın ölçümü sırasındaki en yüksek RSS (Linux'ta nokta başına
+  sıfırlanır; diğer platformlarda process ömrü boyunca en yüksek değer)
+
+Her (hassasiyet, backend, thread) grubu ayrı process'te çalışır: yüklenen
+modeller, thread ayarları ve bellek ölçümleri birbirine karışmaz.
+
+Kullanım:
+  # İnternetsiz: küçük rastgele bir test modeli oluştur ve onunla ölç
+  python lib/rag/rerank_benchmark.py --create-test-model reranker_test_model
+  python lib/rag/rerank_benchmark.py --model reranker_test_model --batch-sizes 1,4,16 \\
+      --max-lengths 128,256 --dtypes fp32,int8 --threads 1,4 --output benchmark.json
+
+  # Gerçek model, sunucunun ayarlarıyla
+  python lib/rag/rerank_benchmark.py --model Qwen/Qwen3-Reranker-4B --batch-sizes 4,8,16 --output benchmark.csv
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+
+try:
+    from lib.rag.rerank_backend import BACKENDS, build_backend
+    from lib.rag.rerank_precision import PRECISION_MODES, load_model
+    from lib.rag.rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_PAD_TOKEN, tokenize_in_buckets
+    from lib.rag.traffic_capture import percentile
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında (python lib/rag/rerank_benchmark.py)
+    from rerank_backend import BACKENDS, build_backend
+    from rerank_precision import PRECISION_MODES, load_model
+    from rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_PAD_TOKEN, tokenize_in_buckets
+    from traffic_capture import percentile
+
+logger = logging.getLogger(__name__)
+
+# Sentetik iş yükünün kelime havuzu: OKR dokümanlarına benzeyen Türkçe metin
+TEAMS = ["satış", "pazarlama", "ürün", "destek", "finans", "insan kaynakları", "mühendislik", "operasyon"]
+PERIODS = ["bu çeyrekteki", "Q1", "Q2", "Q3", "Q4", "yıllık", "ilk yarıdaki", "geçen çeyrekteki"]
+TOPICS = ["anahtar sonuçları", "hedefleri", "bütçe planı", "müşteri memnuniyeti hedefi", "yanıt süresi hedefi",
+          "işe alım planı", "gelir hedefi", "sürüm takvimi", "risk listesi", "performans göstergeleri"]
+QUERY_TEMPLATES = [
+    "{team} ekibinin {period} {topic} neler?",
+    "{period} {team} {topic} nedir?",
+    "{team} ekibi {topic} için hangi adımları atacak?",
+    "{topic} {team} ekibinde kim tarafından izleniyor?",
+]
+CHUNK_WORDS = (
+    "hedef anahtar sonuç çeyrek müşteri satış ekip yeni artırmak azaltmak oranı yüzde sözleşme değeri "
+    "raporlar haftalık yönetici tarafından izlenir bütçe revizyonu sunacak mobil uygulama sürümü yayınlayacak "
+    "memnuniyet puanı anket çalışan kurumsal pazar payı gelir büyüme maliyet verimlilik süreç iyileştirme "
+    "destek talebi ilk yanıt süresi saat altına indirmek kampanya dönüşüm etkileşim sosyal medya ofis taşınma "
+    "Ekim Kasım Aralık Ocak TL milyon bin proje teslim tarihi kalite güvence test otomasyon altyapı bulut"
+).split()
+
+
+def generate_workload(queries: int = 16, docs_per_query: int = 10, min_words: int = 20, max_words: int = 200,
+                      seed: int = 0) -> List[Tuple[str, List[str]]]:
+    """
+    Sentetik (sorgu, chunk listesi) grupları
+
+    Chunk uzunlukları [min_words, max_words] aralığında rastgele seçilir: kısa
+    chunk'lar ve max_length'te kesilen uzun chunk'lar aynı iş yükünde bulunur.
+    Aynı seed her çalıştırmada aynı iş yükünü üretir.
+    """
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(queries):
+        query = rng.choice(QUERY_TEMPLATES).format(
+            team=rng.choice(TEAMS), period=rng.choice(PERIODS), topic=rng.choice(TOPICS)
+        )
+        query = query[0].upper() + query[1:]
+        documents = []
+        for _ in range(docs_per_query):
+            words = [rng.choice(CHUNK_WORDS) for _ in range(rng.randint(min_words, max_words))]
+            # Chunk'ların bir kısmı sorgudaki ekip/konu ile ilgili olsun
+            if rng.random() < 0.3:
+                words[:0] = query.rstrip("?").split()
+            documents.append(" ".join(words).capitalize() + ".")
+        workload.append((query, documents))
+    return workload
+
+
+def create_test_model(path: str, seed: int = 0) -> str:
+    """
+    İnternetsiz benchmark için küçük rastgele bir Qwen2 sınıflandırıcı + BPE tokenizer
+
+    Tokenizer sentetik iş yükü üzerinde eğitilir. Skorlar anlamsızdır; model
+    sadece pipeline'ın (tokenization, bucket'lama, backend'ler) hızını ölçmek içindir.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForSequenceClassification
+
+    torch.manual_seed(seed)
+    corpus = [text for query, documents in generate_workload(queries=200, seed=seed) for text in [query, *documents]]
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=2000,
+        special_tokens=[DEFAULT_PAD_TOKEN, "<|im_start|>", "<|im_end|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    ))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, pad_token=DEFAULT_PAD_TOKEN, eos_token="<|im_end|>")
+
+    config = Qwen2Config(
+        vocab_size=bpe.get_vocab_size(), hidden_size=128, intermediate_size=384, num_hidden_layers=4,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096, num_labels=2,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    tokenizer.save_pretrained(path)
+    Qwen2ForSequenceClassification(config).save_pretrained(path)
+    logger.info(f"🧪 Test modeli oluşturuldu: {path}")
+    return path
+
+
+def _reset_peak_rss():
+    """Linux'ta process'in en yüksek RSS (VmHWM) değerini sıfırla"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    """En yüksek RSS (MB): Linux'ta VmHWM, diğer platformlarda ru_maxrss"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS byte, Linux KB döndürür
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure_point(backend, tokenizer, pairs: Sequence[Tuple[str, str]], batch_size: int, max_length: int,
+                   repeats: int, warmup_batches: int) -> dict:
+    """
+    Bir (batch_size, max_length) noktasını ölç
+
+    Çiftler sunucudaki scheduler gibi batch_size'lık gruplar halinde işlenir;
+    her grup bucket'lanır (token bütçesi = batch_size x max_length) ve skorlanır.
+    """
+    groups = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+
+    def run_group(group) -> Tuple[int, int]:
+        batches, stats = tokenize_in_buckets(tokenizer, group, max_length, batch_size * max_length, batch_size)
+        for batch in batches:
+            logits = backend(batch.inputs)
+            F.softmax(logits.float(), dim=-1)[:, 1].cpu()
+        return stats.real_tokens, stats.padded_tokens
+
+    with torch.no_grad():
+        # İlk çağrı maliyeti (allocator, kernel seçimi) ölçüme karışmasın
+        for group in groups[:warmup_batches]:
+            run_group(group)
+
+        _reset_peak_rss()
+        latencies = []
+        real_tokens = padded_tokens = 0
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for group in groups:
+                group_started = time.perf_counter()
+                real, padded = run_group(group)
+                latencies.append((time.perf_counter() - group_started) * 1000)
+                real_tokens += real
+                padded_tokens += padded
+        elapsed = time.perf_counter() - started
+
+    total_pairs = len(pairs) * repeats
+    return {
+        "batch_size": batch_size,
+        "max_length": max_length,
+        "pairs": total_pairs,
+        "batches": len(latencies),
+        "pairs_per_sec": round(total_pairs / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        },
+        "padding_ratio": round(1 - real_tokens / padded_tokens, 4) if padded_tokens else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def run_group(model_name: str, dtype: str, backend_name: str, threads: int, batch_sizes: Sequence[int],
+              max_lengths: Sequence[int], pairs: Sequence[Tuple[str, str]], repeats: int, warmup_batches: int,
+              artifact_root: str) -> List[dict]:
+    """Bir (hassasiyet, backend, thread) grubunu yükle ve tüm (batch_size, max_length) noktalarını ölç"""
+    logging.basicConfig(level=logging.INFO)
+    torch.set_num_threads(threads)
+    group = {"dtype": dtype, "backend": backend_name, "threads": threads}
+
+    started = time.perf_counter()
+    try:
+        model, tokenizer = load_model(model_name, dtype)
+        backend = build_backend(backend_name, model, model_name, dtype, torch.device("cpu"), artifact_root, threads)
+    except (ValueError, ImportError) as e:
+        # Desteklenmeyen kombinasyon (ör. onnx + int8) ya da kurulu olmayan backend
+        logger.warning(f"⏭️ {group} atlandı: {e}")
+        return [{**group, "skipped": str(e)}]
+    load_s = round(time.perf_counter() - started, 2)
+
+    results = []
+    for max_length in max_lengths:
+        for batch_size in batch_sizes:
+            point = _measure_point(backend, tokenizer, pairs, batch_size, max_length, repeats, warmup_batches)
+            results.append({**group, **point, "load_s": load_s})
+            logger.info(
+                f"   {dtype}/{backend_name}/{threads}t bs={batch_size} len={max_length}: "
+                f"{point['pairs_per_sec']} çift/s, p99={point['latency_ms']['p99']}ms"
+            )
+    return results
+
+
+def run_benchmark(model_name: str, batch_sizes: Sequence[int] = (1, 4, 8, 16),
+                  max_lengths: Sequence[int] = (DEFAULT_MAX_LENGTH,), dtypes: Sequence[str] = ("fp32",),
+                  backends: Sequence[str] = ("eager",), threads: Sequence[int] = (torch.get_num_threads(),),
+                  queries: int = 16, docs_per_query: int = 10, repeats: int = 3, warmup_batches: int = 2,
+                  seed: int = 0, artifact_root: str = "reranker_artifacts") -> dict:
+    """
+    Tüm kombinasyonları ölç
+
+    Returns:
+        {"environment": {...}, "workload": {...}, "results": [nokta, ...]}
+    """
+    workload = generate_workload(queries, docs_per_query, seed=seed)
+    pairs = [(query, document) for query, documents in workload for document in documents]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for dtype in dtypes:
+        for backend_name in backends:
+            for thread_count in threads:
+                logger.info(f"📊 {dtype} / {backend_name} / {thread_count} thread ölçülüyor...")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    results.extend(executor.submit(
+                        run_group, model_name, dtype, backend_name, thread_count, batch_sizes, max_lengths,
+                        pairs, repeats, warmup_batches, artifact_root,
+                    ).result())
+
+    return {
+        "environment": {
+            "model": model_name,
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "created_at": time.time(),
+        },
+        "workload": {
+            "queries": queries, "docs_per_query": docs_per_query, "pairs": len(pairs),
+            "repeats": repeats, "warmup_batches": warmup_batches, "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def best_points(report: dict) -> List[dict]:
+    """Her (hassasiyet, backend) için en yüksek throughput'lu nokta"""
+    best: Dict[Tuple[str, str], dict] = {}
+    for point in report["results"]:
+        if "skipped" in point:
+            continue
+        key = (point["dtype"], point["backend"])
+        if key not in best or point["pairs_per_sec"] > best[key]["pairs_per_sec"]:
+            best[key] = point
+    return list(best.values())
+
+
+def write_report(report: dict, path: Optional[str]):
+    """Raporu yaz: .csv uzantısında düz tablo, aksi halde JSON (path yoksa stdout)"""
+    if path and path.endswith(".csv"):
+        fields = ["dtype", "backend", "threads", "batch_size", "max_length", "pairs", "batches", "pairs_per_sec",
+                  "p50_ms", "p90_ms", "p99_ms", "mean_ms", "padding_ratio", "peak_rss_mb", "load_s", "skipped"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            for point in report["results"]:
+                latency = point.get("latency_ms", {})
+                writer.writerow({**point, **{f"{name}_ms": value for name, value in latency.items()}})
+        return
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _str_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Reranker throughput benchmark'ı (sentetik Türkçe iş yükü)")
+    parser.add_argument("--model", default=os.environ.get("RERANKER_MODEL", "Qwen/Qwen3-Reranker-4B"))
+    parser.add_argument("--create-test-model", metavar="DIZIN",
+                        help="Küçük rastgele test modelini bu dizine oluştur ve çık (internet gerekmez)")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 4, 8, 16])
+    parser.add_argument("--max-lengths", type=_int_list, default=[DEFAULT_MAX_LENGTH])
+    parser.add_argument("--dtypes", type=_str_list, default=["fp32"], help=f"Seçenekler: {','.join(PRECISION_MODES)}")
+    parser.add_argument("--backends", type=_str_list, default=["eager"], help=f"Seçenekler: {','.join(BACKENDS)}")
+    parser.add_argument("--threads", type=_int_list, default=[torch.get_num_threads()])
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--docs-per-query", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warmup-batches", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--artifact-root", default=os.environ.get("RERANKER_ARTIFACT_ROOT", "reranker_artifacts"))
+    parser.add_argument("--output", help="Sonuç dosyası (.json ya da .csv); verilmezse JSON stdout'a yazılır")
+    args = parser.parse_args()
+
+    if args.create_test_model:
+        create_test_model(args.create_test_model, args.seed)
+        sys.exit(0)
+
+    # Geçersiz seçenekleri model yüklemeden önce yakala
+    for mode in args.dtypes:
+        if mode not in PRECISION_MODES:
+            parser.error(f"Geçersiz hassasiyet modu: {mode} (seçenekler: {', '.join(PRECISION_MODES)})")
+    for name in args.backends:
+        if name not in BACKENDS:
+            parser.error(f"Geçersiz backend: {name} (seçenekler: {', '.join(BACKENDS)})")
+
+    report = run_benchmark(
+        args.model, args.batch_sizes, args.max_lengths, args.dtypes, args.backends, args.threads,
+        args.queries, args.docs_per_query, args.repeats, args.warmup_batches, args.seed, args.artifact_root,
+    )
+    write_report(report, args.output)
+
+    for point in best_points(report):
+        logger.info(
+            f"🏆 {point['dtype']}/{point['backend']}: en iyi bs={point['batch_size']} len={point['max_length']} "
+            f"threads={point['threads']} → {point['pairs_per_sec']} çift/s (p99 {point['latency_ms']['p99']}ms, "
+            f"RSS {point['peak_rss_mb']} MB)"
+        )
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+🪜 RERANKER CASCADE İLK AŞAMASI
+Aday dokümanları ucuz bir lexical skorla (BM25) eleyip sadece en iyi N tanesini
+cross-encoder'a gönderir
+
+IDF istatistikleri sadece o isteğin aday kümesinden hesaplanır - ayrı bir indeks
+gerekmez. Skoru eşit olan adaylar orijinal sıralarını korur; pgvector'den gelen
+benzerlik sırası böylece eşitlik bozucu olarak kullanılır.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Hashable, List, Sequence
+
+# Okapi BM25 parametreleri
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Türkçe'ye uygun küçük harfe çevirip kelimelere böl (İ → i, I → ı)"""
+    return _TOKEN_PATTERN.findall(text.replace("İ", "i").replace("I", "ı").lower())
+
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> List[float]:
+    """Her doküman için sorguya göre BM25 skoru (IDF aday kümesinden)"""
+    return bm25_scores_terms(tokenize(query), [tokenize(doc) for doc in documents], k1, b)
+
+
+def bm25_scores_terms(query_terms: Sequence[Hashable], documents: Sequence[Sequence[Hashable]],
+                      k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> List[float]:
+    """
+    Önceden terimlere bölünmüş sorgu/dokümanlarla BM25
+
+    Terimler kelime olmak zorunda değil: token store'dan gelen dokümanlar için
+    tokenizer token id'leri terim olarak kullanılır.
+    """
+    if not documents:
+        return []
+
+    n_docs = len(documents)
+    avg_length = sum(len(tokens) for tokens in documents) / n_docs or 1.0
+    doc_freq = Counter(term for tokens in documents for term in set(tokens))
+    query_terms = set(query_terms)
+
+    idf = {
+        term: math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+        for term in query_terms if doc_freq[term]
+    }
+
+    scores = []
+    for tokens in documents:
+        counts = Counter(tokens)
+        norm = k1 * (1 - b + b * len(tokens) / avg_length)
+        scores.append(sum(
+            weight * counts[term] * (k1 + 1) / (counts[term] + norm)
+            for term, weight in idf.items() if counts[term]
+        ))
+    return scores
+
+
+def select_survivors(scores: Sequence[float], top_n: int) -> List[int]:
+    """En yüksek skorlu top_n adayın indeksleri (eşitlikte orijinal sıra korunur)"""
+    order = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+    return order[:max(0, top_n)]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+📈 RERANKER PROMETHEUS METRİKLERİ
+reranker_server.py'nin /metrics endpoint'inin yayınladığı metrikler
+
+Aşamalar (reranker_stage_seconds{stage=...}):
+- queue_wait: Çiftin kuyruğa girmesinden batch'e alınmasına kadar
+- tokenize: Tokenization + bucket'lama + padding (scheduler batch'i başına)
+- forward: Model forward pass (forward batch'i başına)
+- softmax: Softmax + skorların CPU'ya alınması (forward batch'i başına)
+- topk: Skorların sıralanıp top_k seçilmesi (istek başına)
+- serialize: Yanıtın JSON'a çevrilmesi (istek başına)
+
+Çoklu worker: PROMETHEUS_MULTIPROC_DIR ayarlıysa tüm worker'ların metrikleri
+bu dizin üzerinden birleştirilir (prometheus_client multiprocess modu).
+"""
+
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client import REGISTRY
+
+# CPU'da tek istek onlarca ms ile dakikalar arasında sürebilir
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 128)
+RATIO_BUCKETS = (0.0, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+REQUEST_SECONDS = Histogram(
+    "reranker_request_seconds", "Endpoint başına istek süresi", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    "reranker_requests_total", "Endpoint ve sonuç başına istek sayısı", ["endpoint", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "reranker_stage_seconds", "Aşama başına süre", ["stage"], buckets=STAGE_BUCKETS
+)
+PAIRS = Counter(
+    "reranker_pairs_total", "Skorlanan çiftler (kaynağa göre: cache, coalesced, computed)", ["source"]
+)
+BATCH_PAIRS = Histogram(
+    "reranker_batch_pairs", "Scheduler batch'i başına çift sayısı (batch doluluğu)", buckets=BATCH_SIZE_BUCKETS
+)
+BATCH_PAIRS_PER_SECOND = Histogram(
+    "reranker_batch_pairs_per_second", "Scheduler batch'i başına inference throughput'u", buckets=THROUGHPUT_BUCKETS
+)
+PADDING_RATIO = Histogram(
+    "reranker_padding_ratio", "Forward batch'i başına pad token oranı", buckets=RATIO_BUCKETS
+)
+QUEUE_PAIRS = Gauge(
+    "reranker_queue_pairs", "Kuyrukta bekleyen çift sayısı", multiprocess_mode="livesum"
+)
+IN_FLIGHT_PAIRS = Gauge(
+    "reranker_in_flight_pairs", "Şu an inference'ta olan çift sayısı", multiprocess_mode="livesum"
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "reranker_model_load_seconds", "Model yükleme süresi", multiprocess_mode="max"
+)
+WARMUP_SECONDS = Gauge(
+    "reranker_warmup_seconds", "Yükleme sonrası ısınma (warmup) süresi", multiprocess_mode="max"
+)
+TIME_TO_READY_SECONDS = Gauge(
+    "reranker_time_to_ready_seconds", "Process başlangıcından /health/ready'nin 200 dönmesine kadar geçen süre",
+    multiprocess_mode="max"
+)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus text formatında metrikler (multiprocess modunda tüm worker'lar)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """Kapanan worker'ın canlı gauge değerlerini multiprocess dizininden düş"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
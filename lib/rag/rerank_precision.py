@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+🎚️ RERANKER HASSASİYET MODLARI
+fp32 / bf16 / int8 (dinamik quantization) modlarını uygular ve bir örnek set
+üzerinde sıralamanın fp32'ye göre ne kadar korunduğunu ölçer
+
+Ölçümler (sorgu başına, sonra ortalama):
+- top-k overlap: fp32 top-k ile moddaki top-k'nın kesişim oranı
+- Kendall tau: tüm dokümanların sıralama uyumu (1.0 = aynı sıra)
+
+Kullanım:
+  python lib/rag/rerank_precision.py --model Qwen/Qwen3-Reranker-4B --modes fp32,bf16,int8
+  python lib/rag/rerank_precision.py --samples ornekler.jsonl   # {"query": "...", "documents": [...]}
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+try:
+    from lib.rag.rerank_tokenization import (
+        DEFAULT_MAX_LENGTH, DEFAULT_PAD_TOKEN, DEFAULT_TOKEN_BUDGET, tokenize_in_buckets,
+    )
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında (python lib/rag/rerank_precision.py)
+    from rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_PAD_TOKEN, DEFAULT_TOKEN_BUDGET, tokenize_in_buckets
+
+logger = logging.getLogger(__name__)
+
+PRECISION_MODES = ("fp32", "bf16", "int8")
+
+# Dahili örnek set: OKR dokümanlarına benzeyen kısa Türkçe sorgu/chunk grupları
+SAMPLE_SET = [
+    {
+        "query": "Satış ekibinin bu çeyrekteki anahtar sonuçları neler?",
+        "documents": [
+            "Satış ekibi Q3 hedefi: yeni müşteri sayısını %20 artırmak. Anahtar sonuç 1: 150 yeni kurumsal müşteri.",
+            "Pazarlama ekibi sosyal medya etkileşimini iki katına çıkarmayı hedefliyor.",
+            "Q3 satış anahtar sonucu 2: ortalama sözleşme değerini 45.000 TL'ye yükseltmek.",
+            "Ofis taşınması Ekim ayının ikinci haftasında tamamlanacak.",
+            "Müşteri kaybı oranını %5'in altına indirmek satış ekibinin üçüncü anahtar sonucudur.",
+            "İnsan kaynakları yıllık çalışan memnuniyeti anketini Kasım'da yapacak.",
+        ],
+    },
+    {
+        "query": "Türkiye'nin başkenti neresi?",
+        "documents": [
+            "Ankara, Türkiye'nin başkenti. Ankara, Anadolu'nun ortasında yer alır.",
+            "İstanbul, Türkiye'nin en büyük şehridir.",
+            "İzmir Ege bölgesinin en kalabalık şehridir.",
+            "Türkiye Cumhuriyeti 1923 yılında kuruldu ve başkent Ankara oldu.",
+            "Kapadokya peri bacalarıyla ünlüdür.",
+        ],
+    },
+    {
+        "query": "Müşteri destek ekibinin yanıt süresi hedefi nedir?",
+        "documents": [
+            "Destek ekibi OKR: ilk yanıt süresini 2 saatin altına indirmek.",
+            "Destek talepleri Zendesk üzerinden takip edilir.",
+            "Ürün ekibi mobil uygulamanın 3.0 sürümünü yayınlayacak.",
+            "Müşteri memnuniyet puanı (CSAT) hedefi 4.5/5 olarak belirlendi.",
+            "Yanıt süresi hedefi haftalık raporlarda destek yöneticisi tarafından izlenir.",
+            "Finans ekibi bütçe revizyonunu çeyrek sonunda sunacak.",
+        ],
+    },
+]
+
+
+def load_dtype(mode: str) -> torch.dtype:
+    """from_pretrained'e verilecek dtype (int8 fp32 yüklenip sonra quantize edilir)"""
+    if mode not in PRECISION_MODES:
+        raise ValueError(f"Geçersiz hassasiyet modu: {mode} (seçenekler: {', '.join(PRECISION_MODES)})")
+    return torch.bfloat16 if mode == "bf16" else torch.float32
+
+
+def apply_precision(model, mode: str):
+    """
+    Yüklenmiş modele hassasiyet modunu uygula
+
+    int8: Gövdedeki (base model) Linear katmanlar dinamik quantize edilir; ağırlıklar
+    int8 tutulur, aktivasyonlar her çağrıda quantize edilir. 2 sınıflı skor katmanı
+    fp32 kalır.
+    """
+    dtype = load_dtype(mode)
+    if mode == "int8":
+        base = getattr(model, model.base_model_prefix, None)
+        # inplace: fp32 gövdenin kopyası çıkarılmaz (4B modelde ~16 GB) ve mmap'li
+        # snapshot'ın paylaşılan sayfaları worker başına özel belleğe kopyalanmaz
+        torch.ao.quantization.quantize_dynamic(
+            base if base is not None else model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        return model
+    if next(model.parameters()).dtype != dtype:
+        model = model.to(dtype)
+    return model
+
+
+def load_model(model_name: str, mode: str = "fp32", device: torch.device = torch.device("cpu")):
+    """Model + tokenizer'ı istenen hassasiyet modunda yükle"""
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = DEFAULT_PAD_TOKEN
+
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        torch_dtype=load_dtype(mode),
+        pad_token_id=tokenizer.pad_token_id,
+    ).to(device)
+    model.eval()
+    return apply_precision(model, mode), tokenizer
+
+
+def score_pairs(model, tokenizer, pairs: Sequence[Tuple[str, str]], device: torch.device = torch.device("cpu"),
+                max_length: int = DEFAULT_MAX_LENGTH, token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[float]:
+    """Çiftleri bucket'lı batch'lerle skorla (relevant sınıfın olasılığı)"""
+    scores = [0.0] * len(pairs)
+    batches, _ = tokenize_in_buckets(tokenizer, pairs, max_length, token_budget)
+    with torch.no_grad():
+        for batch in batches:
+            outputs = model(**{name: tensor.to(device) for name, tensor in batch.inputs.items()})
+            probs = F.softmax(outputs.logits.float(), dim=-1)
+            for idx, score in zip(batch.indices, probs[:, 1].cpu().tolist()):
+                scores[idx] = score
+    return scores
+
+
+def kendall_tau(a: Sequence[float], b: Sequence[float]) -> float:
+    """İki skor listesinin Kendall tau-a uyumu (eşit skorlu çiftler uyumsuz sayılmaz)"""
+    n = len(a)
+    if n < 2:
+        return 1.0
+    concordant = discordant = 0
+    for i in range(n):
+        for j in range(i + 1, n):
+            sign = (a[i] - a[j]) * (b[i] - b[j])
+            if sign > 0:
+                concordant += 1
+            elif sign < 0:
+                discordant += 1
+    return (concordant - discordant) / (n * (n - 1) / 2)
+
+
+def topk_overlap(a: Sequence[float], b: Sequence[float], k: int) -> float:
+    """İki skor listesinin top-k indeks kümelerinin kesişim oranı"""
+    k = min(k, len(a))
+    if k == 0:
+        return 1.0
+    top_a = set(sorted(range(len(a)), key=lambda i: a[i], reverse=True)[:k])
+    top_b = set(sorted(range(len(b)), key=lambda i: b[i], reverse=True)[:k])
+    return len(top_a & top_b) / k
+
+
+def compare_precision_modes(model_name: str, modes: Sequence[str] = PRECISION_MODES,
+                            samples: Sequence[dict] = SAMPLE_SET, top_k: int = 3,
+                            device: torch.device = torch.device("cpu")) -> Dict[str, dict]:
+    """
+    Her modu örnek sette çalıştır ve fp32 referansına göre sıralama uyumunu ölç
+
+    Returns:
+        {mode: {"topk_overlap": ..., "kendall_tau": ..., "pairs_per_sec": ..., "load_s": ...}}
+    """
+    pairs_per_sample = [[(s["query"], doc) for doc in s["documents"]] for s in samples]
+    total_pairs = sum(len(p) for p in pairs_per_sample)
+    reference = None
+    results: Dict[str, dict] = {}
+
+    # fp32 her zaman referans olarak önce çalışır
+    ordered_modes = ["fp32"] + [m for m in modes if m != "fp32"]
+    for mode in ordered_modes:
+        logger.info(f"🎚️ {mode} yükleniyor...")
+        started = time.perf_counter()
+        model, tokenizer = load_model(model_name, mode, device)
+        load_s = time.perf_counter() - started
+
+        # İlk çağrı maliyeti ölçüme karışmasın
+        score_pairs(model, tokenizer, pairs_per_sample[0][:1], device)
+
+        started = time.perf_counter()
+        scores = [score_pairs(model, tokenizer, pairs, device) for pairs in pairs_per_sample]
+        elapsed = time.perf_counter() - started
+
+        if reference is None:
+            reference = scores
+        results[mode] = {
+            "topk_overlap": round(sum(topk_overlap(r, s, top_k) for r, s in zip(reference, scores)) / len(scores), 4),
+            "kendall_tau": round(sum(kendall_tau(r, s) for r, s in zip(reference, scores)) / len(scores), 4),
+            "pairs_per_sec": round(total_pairs / elapsed, 2) if elapsed > 0 else 0.0,
+            "load_s": round(load_s, 2),
+        }
+        logger.info(f"   {mode}: {results[mode]}")
+
+        del model
+    return {mode: results[mode] for mode in ordered_modes if mode in modes}
+
+
+def recommend_mode(results: Dict[str, dict], min_overlap: float = 1.0, min_tau: float = 0.9) -> str:
+    """Sıralamayı eşiklerin üstünde tutan en hızlı modu seç"""
+    stable = [
+        mode for mode, r in results.items()
+        if r["topk_overlap"] >= min_overlap and r["kendall_tau"] >= min_tau
+    ]
+    if not stable:
+        return "fp32"
+    return max(stable, key=lambda mode: results[mode]["pairs_per_sec"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Reranker hassasiyet modlarını fp32'ye göre karşılaştır")
+    parser.add_argument("--model", default="Qwen/Qwen3-Reranker-4B")
+    parser.add_argument("--modes", default=",".join(PRECISION_MODES))
+    parser.add_argument("--samples", help="JSONL: her satır {\"query\": ..., \"documents\": [...]}")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--min-overlap", type=float, default=1.0)
+    parser.add_argument("--min-tau", type=float, default=0.9)
+    args = parser.parse_args()
+
+    samples = SAMPLE_SET
+    if args.samples:
+        with open(args.samples, "r", encoding="utf-8") as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    for mode in modes:
+        load_dtype(mode)  # Geçersiz modu yüklemeden önce yakala
+
+    results = compare_precision_modes(args.model, modes, samples, args.top_k)
+    print(json.dumps({
+        "model": args.model,
+        "results": results,
+        "recommended": recommend_mode(results, args.min_overlap, args.min_tau),
+    }, indent=2, ensure_ascii=False))
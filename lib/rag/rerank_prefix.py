@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+🧠 QWEN3-RERANKER PREFIX KV-CACHE SKORLAMA
+Qwen3-Reranker'ın eğitildiği causal-LM "yes"/"no" formülasyonu:
+
+  <system talimatı> <Instruct>: ... <Query>: ... <Document>: {doküman} <assistant>
+
+Skor = softmax([logit("no"), logit("yes")])[yes], son token'da.
+
+Bir istekteki tüm dokümanlar aynı talimat + sorgu önekiyle başlar. Önek bir kez
+encode edilir, KV cache'i her doküman batch'ine kopyalanır ve sadece doküman
+son ekleri (doküman + assistant şablonu) modelden geçer.
+"""
+
+from typing import List, Sequence, Tuple, Union
+
+import torch
+from transformers import DynamicCache
+
+try:
+    from lib.rag.rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET, bucket_by_length
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında
+    from rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET, bucket_by_length
+
+# Qwen3-Reranker model kartındaki prompt şablonu
+SYSTEM_PREFIX = (
+    "<|im_start|>system\nJudge whether the Document meets the requirements based on the Query "
+    "and the Instruct provided. Note that the answer can only be \"yes\" or \"no\".<|im_end|>\n"
+    "<|im_start|>user\n"
+)
+ASSISTANT_SUFFIX = "<|im_end|>\n<|im_start|>assistant\n<think>\n\n</think>\n\n"
+DEFAULT_INSTRUCTION = "Given a web search query, retrieve relevant passages that answer the query"
+
+
+def _cache_layers(cache) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Farklı transformers sürümlerindeki cache yapısından katman başına (key, value) al"""
+    if isinstance(cache, tuple):
+        return [(layer[0], layer[1]) for layer in cache]
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _expand_cache(layers: Sequence[Tuple[torch.Tensor, torch.Tensor]], batch_size: int) -> DynamicCache:
+    """Önek KV'sini batch boyutuna genişlet (expand kopyalamaz; forward yeni cache'e yazar)"""
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(
+            keys.expand(batch_size, -1, -1, -1),
+            values.expand(batch_size, -1, -1, -1),
+            layer_idx,
+        )
+    return cache
+
+
+class PrefixCacheScorer:
+    """
+    Sorgu önekinin KV cache'ini dokümanlar arasında paylaşarak skorlayan scorer
+
+    model: AutoModelForCausalLM (Qwen3-Reranker). lm_head'in sadece "yes" / "no"
+    satırları kullanılır - tüm sözlük için logit hesaplanmaz.
+    """
+
+    def __init__(self, model, tokenizer, device: torch.device, max_length: int = DEFAULT_MAX_LENGTH,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, instruction: str = DEFAULT_INSTRUCTION):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_length = max_length
+        self.token_budget = token_budget
+        self.instruction = instruction
+
+        yes_id = tokenizer.convert_tokens_to_ids("yes")
+        no_id = tokenizer.convert_tokens_to_ids("no")
+        if yes_id is None or no_id is None or tokenizer.unk_token_id in (yes_id, no_id):
+            raise ValueError("Tokenizer'da 'yes' / 'no' token'ları yok - prefix modu bu modelle kullanılamaz")
+        self.decoder = model.get_decoder()
+        # [no, yes] satırları: (2, hidden)
+        lm_head = model.get_output_embeddings()
+        self.answer_weight = lm_head.weight[[no_id, yes_id]].detach()
+        self.answer_bias = lm_head.bias[[no_id, yes_id]].detach() if getattr(lm_head, "bias", None) is not None else None
+        self.suffix_ids = tokenizer.encode(ASSISTANT_SUFFIX, add_special_tokens=False)
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+
+    def prefix_ids(self, query: str) -> List[int]:
+        text = f"{SYSTEM_PREFIX}<Instruct>: {self.instruction}\n<Query>: {query}\n<Document>: "
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def _answer_scores(self, hidden: torch.Tensor) -> List[float]:
+        """Son token hidden state'lerinden P(yes) hesapla"""
+        logits = hidden.to(self.answer_weight.dtype) @ self.answer_weight.T
+        if self.answer_bias is not None:
+            logits = logits + self.answer_bias
+        return torch.softmax(logits.float(), dim=-1)[:, 1].cpu().tolist()
+
+    def score_query(self, query: str, documents: Sequence[Union[str, Sequence[int]]]) -> List[Tuple[float, int, int]]:
+        """
+        Tek sorgunun dokümanlarını paylaşılan önekle skorla
+
+        Dokümanlar metin ya da önceden tokenize edilmiş (özel token'sız) token id'leri olabilir.
+
+        Returns:
+            Her doküman için (skor, son ek token sayısı, batch'in pad'li son ek uzunluğu)
+        """
+        prefix = self.prefix_ids(query)
+        # Doküman, önek + assistant şablonuyla birlikte max_length'e sığacak kadar kesilir
+        doc_budget = max(1, self.max_length - len(prefix) - len(self.suffix_ids))
+        suffixes = [
+            (self.tokenizer.encode(doc, add_special_tokens=False) if isinstance(doc, str) else list(doc))[:doc_budget]
+            + self.suffix_ids
+            for doc in documents
+        ]
+        lengths = [len(ids) for ids in suffixes]
+        results: List[Tuple[float, int, int]] = [None] * len(documents)
+
+        with torch.no_grad():
+            prefix_out = self.decoder(
+                input_ids=torch.tensor([prefix], device=self.device),
+                use_cache=True,
+            )
+            prefix_layers = _cache_layers(prefix_out.past_key_values)
+            prefix_len = len(prefix)
+
+            for bucket in bucket_by_length(lengths, self.token_budget):
+                batch_len = max(lengths[i] for i in bucket)
+                # Sağdan padding: gerçek token'ların pozisyonları önekten kesintisiz devam eder
+                input_ids = torch.full((len(bucket), batch_len), self.pad_id, dtype=torch.long)
+                suffix_mask = torch.zeros((len(bucket), batch_len), dtype=torch.long)
+                for row, idx in enumerate(bucket):
+                    input_ids[row, :lengths[idx]] = torch.tensor(suffixes[idx])
+                    suffix_mask[row, :lengths[idx]] = 1
+
+                attention_mask = torch.cat(
+                    [torch.ones((len(bucket), prefix_len), dtype=torch.long), suffix_mask], dim=1
+                )
+                position_ids = torch.arange(prefix_len, prefix_len + batch_len).unsqueeze(0).expand(len(bucket), -1)
+
+                out = self.decoder(
+                    input_ids=input_ids.to(self.device),
+                    attention_mask=attention_mask.to(self.device),
+                    position_ids=position_ids.to(self.device),
+                    past_key_values=_expand_cache(prefix_layers, len(bucket)),
+                    use_cache=True,
+                )
+                last = torch.tensor([lengths[idx] - 1 for idx in bucket], device=self.device)
+                hidden = out.last_hidden_state[torch.arange(len(bucket), device=self.device), last]
+
+                for idx, score in zip(bucket, self._answer_scores(hidden)):
+                    results[idx] = (score, lengths[idx], batch_len)
+
+        return results
+
+    def score_full(self, query: str, document: str) -> float:
+        """Önek cache'i olmadan tam dizi ile skorla (doğrulama için referans)"""
+        prefix = self.prefix_ids(query)
+        doc_budget = max(1, self.max_length - len(prefix) - len(self.suffix_ids))
+        ids = prefix + self.tokenizer.encode(document, add_special_tokens=False)[:doc_budget] + self.suffix_ids
+        with torch.no_grad():
+            out = self.decoder(input_ids=torch.tensor([ids], device=self.device))
+        return self._answer_scores(out.last_hidden_state[:, -1])[0]
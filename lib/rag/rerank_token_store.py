@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+🗃️ RERANKER TOKEN STORE
+public.documents chunk'larının token id'lerini documents.id ile saklayan kalıcı
+store: /rerank dokümanları metin yerine id ile alabilir, hot path'te ne payload
+ne de doküman tokenization'ı kalır.
+
+Dizin yapısı:
+  tokens.bin  - Tüm dokümanların token id'leri uç uca (int32, sadece ekleme)
+  index.bin   - Kayıt başına (documents.id, offset, uzunluk) (sadece ekleme)
+  meta.json   - Tokenizer parmak izi; tokenizer değişirse store sıfırlanır
+
+tokens.bin salt okunur mmap'lenir: worker'lar aynı sayfaları page cache'ten
+paylaşır. Aynı id tekrar yazılırsa son kayıt geçerlidir. Yazmalar flock ile
+sıralanır; diğer worker'ların eklediği kayıtlar bulunamayan id'de index.bin'in
+okunmamış kuyruğundan alınır.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKENS_FILE = "tokens.bin"
+INDEX_FILE = "index.bin"
+META_FILE = "meta.json"
+TOKEN_DTYPE = np.int32
+# documents.id, token offset'i, token sayısı
+INDEX_RECORD = struct.Struct("<qqi")
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Tokenizer'ı tanımlayan parmak izi (ad + sözlük boyutu + örnek encode)"""
+    digest = hashlib.sha256()
+    digest.update(str(getattr(tokenizer, "name_or_path", "")).encode("utf-8"))
+    digest.update(str(len(tokenizer)).encode("utf-8"))
+    digest.update(str(tokenizer.encode("Satış ekibinin Q3 anahtar sonuçları", add_special_tokens=False)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class TokenStore:
+    """documents.id → token id'leri (mmap'li, kalıcı, sadece ekleme)"""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._index: Dict[int, Tuple[int, int]] = {}
+        self._index_read = 0  # index.bin'in okunmuş byte sayısı
+        self._tokens: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._check_meta()
+        self._refresh_index()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _check_meta(self):
+        """Farklı tokenizer ile yazılmış store'u kenara al ve boş başla"""
+        meta_path = self._file(META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("tokenizer") == self.fingerprint:
+                return
+            stale = f"{self.path.rstrip('/')}.stale-{int(time.time())}"
+            logger.warning(f"⚠️ Token store başka bir tokenizer ile yazılmış, {stale} dizinine taşınıyor")
+            os.replace(self.path, stale)
+            os.makedirs(self.path)
+
+        for name in (TOKENS_FILE, INDEX_FILE):
+            open(self._file(name), "ab").close()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"tokenizer": self.fingerprint, "created_at": time.time()}, f, indent=2)
+
+    def _refresh_index(self):
+        """index.bin'de henüz okunmamış kayıtları (diğer process'lerin yazdıkları dahil) yükle"""
+        with open(self._file(INDEX_FILE), "rb") as f:
+            f.seek(self._index_read)
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        for doc_id, offset, length in INDEX_RECORD.iter_unpack(data[:usable]):
+            self._index[doc_id] = (offset, length)
+        self._index_read += usable
+
+    def _tokens_view(self, end: int) -> np.memmap:
+        """tokens.bin'in en az `end` token'ını kapsayan mmap görünümü"""
+        if self._tokens is None or len(self._tokens) < end:
+            size = os.path.getsize(self._file(TOKENS_FILE)) // np.dtype(TOKEN_DTYPE).itemsize
+            self._tokens = np.memmap(self._file(TOKENS_FILE), dtype=TOKEN_DTYPE, mode="r", shape=(size,))
+        return self._tokens
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, doc_id: int) -> Optional[List[int]]:
+        with self._lock:
+            entry = self._index.get(doc_id)
+            if entry is None:
+                self._refresh_index()
+                entry = self._index.get(doc_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            offset, length = entry
+            self.hits += 1
+            return self._tokens_view(offset + length)[offset:offset + length].tolist()
+
+    def get_many(self, doc_ids: Sequence[int]) -> Tuple[List[Optional[List[int]]], List[int]]:
+        """Id'lerin token'ları (bulunamayanlar None) ve bulunamayan id'ler"""
+        tokens = [self.get(doc_id) for doc_id in doc_ids]
+        return tokens, [doc_id for doc_id, ids in zip(doc_ids, tokens) if ids is None]
+
+    def __contains__(self, doc_id: int) -> bool:
+        with self._lock:
+            if doc_id not in self._index:
+                self._refresh_index()
+            return doc_id in self._index
+
+    def put_many(self, items: Iterable[Tuple[int, Sequence[int]]]) -> int:
+        """(documents.id, token id'leri) kayıtlarını ekle; yazılan kayıt sayısını döndür"""
+        items = list(items)
+        if not items:
+            return 0
+        with self._lock, open(self._file(TOKENS_FILE), "ab") as tokens_file, \
+                open(self._file(INDEX_FILE), "ab") as index_file:
+            # Diğer worker'larla aynı anda yazılmasın: offset dosya sonundan hesaplanır
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                offset = tokens_file.seek(0, os.SEEK_END) // np.dtype(TOKEN_DTYPE).itemsize
+                records = bytearray()
+                for doc_id, ids in items:
+                    tokens_file.write(np.asarray(ids, dtype=TOKEN_DTYPE).tobytes())
+                    records += INDEX_RECORD.pack(int(doc_id), offset, len(ids))
+                    offset += len(ids)
+                # Önce token'lar diske: index kaydı hiçbir zaman yazılmamış veriyi göstermesin
+                tokens_file.flush()
+                index_file.write(records)
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+            self._refresh_index()
+            self.writes += len(items)
+        return len(items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "documents": len(self._index),
+            "tokens": os.path.getsize(self._file(TOKENS_FILE)) // np.dtype(TOKEN_DTYPE).itemsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+        }
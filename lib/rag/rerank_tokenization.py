@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+✂️ RERANKER TOKENIZATION AŞAMASI
+(query, doküman) çiftlerini uzunluğa göre sıralayıp bucket'lara ayırır ve her
+batch'i sadece kendi en uzun üyesine kadar pad'ler (dinamik padding)
+
+reranker_server.py ve lib/rag/reranker.py aynı aşamayı kullanır.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import torch
+
+# Varsayılan truncation uzunluğu (CPU performansı için 512'den düşürüldü)
+DEFAULT_MAX_LENGTH = 256
+
+# Bir forward pass'te pad'ler dahil işlenecek maksimum token sayısı
+# (16 çift x 256 token = eski sabit batch'lerin maliyeti)
+DEFAULT_TOKEN_BUDGET = 4096
+
+# Qwen tokenizer'ında pad token tanımlı değil
+DEFAULT_PAD_TOKEN = "<|endoftext|>"
+
+# Çiftin doküman tarafı: metin ya da önceden tokenize edilmiş token id'leri
+# (encode_document çıktısı, ör. token store'dan)
+Document = Union[str, Sequence[int]]
+
+
+@dataclass
+class TokenizedBatch:
+    """Tek forward pass'e girecek pad'lenmiş batch"""
+    indices: List[int]  # Orijinal çift listesindeki pozisyonlar
+    lengths: List[int]  # Her çiftin gerçek token sayısı
+    inputs: Dict[str, torch.Tensor]  # input_ids, attention_mask (padded)
+
+    @property
+    def padded_length(self) -> int:
+        return int(self.inputs["input_ids"].shape[1])
+
+
+@dataclass
+class PaddingStats:
+    """Dinamik padding'in sabit max_length padding'e göre kazancı"""
+    pairs: int = 0
+    real_tokens: int = 0  # Pad olmayan token sayısı
+    padded_tokens: int = 0  # Modele giren toplam token (pad dahil)
+    max_length_tokens: int = 0  # padding="max_length" olsaydı girecek token
+
+    @property
+    def pad_tokens(self) -> int:
+        return self.padded_tokens - self.real_tokens
+
+    @property
+    def saved_pad_tokens(self) -> int:
+        return self.max_length_tokens - self.padded_tokens
+
+    def add_pair(self, real_tokens: int, padded_tokens: int, max_length: int):
+        self.pairs += 1
+        self.real_tokens += real_tokens
+        self.padded_tokens += padded_tokens
+        self.max_length_tokens += max_length
+
+    def as_dict(self) -> dict:
+        return {
+            "pairs": self.pairs,
+            "real_tokens": self.real_tokens,
+            "padded_tokens": self.padded_tokens,
+            "pad_tokens": self.pad_tokens,
+            "saved_pad_tokens": self.saved_pad_tokens,
+            "padding_ratio": round(self.pad_tokens / self.padded_tokens, 4) if self.padded_tokens else 0.0,
+            # Token sayısına orantılı FLOP azalması (sabit max_length padding'e göre)
+            "flop_reduction": round(self.saved_pad_tokens / self.max_length_tokens, 4) if self.max_length_tokens else 0.0,
+        }
+
+
+def encode_document(tokenizer, document: str) -> List[int]:
+    """
+    Dokümanı tek başına (özel token'sız) tokenize et
+
+    Kesilmez: longest_first truncation query ile dokümanın hangisinin daha uzun
+    olduğuna baktığı için dokümanın tam uzunluğu gerekir.
+    """
+    return tokenizer.encode(document, add_special_tokens=False)
+
+
+@lru_cache(maxsize=8)
+def pair_template(tokenizer) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Tokenizer'ın çift şablonundaki özel token'lar: (baş, orta, son)
+
+    Çift = baş + query + orta + doküman + son. Şablon iki örnek metinle bir kez
+    çıkarılır (ör. BERT: [CLS] / [SEP] / [SEP], Qwen: boş / boş / boş).
+    """
+    first = tokenizer.encode("a", add_special_tokens=False)
+    second = tokenizer.encode("b", add_special_tokens=False)
+    full = tokenizer("a", "b")["input_ids"]
+    i = next(i for i in range(len(full)) if full[i:i + len(first)] == first)
+    j = next(j for j in range(i + len(first), len(full)) if full[j:j + len(second)] == second)
+    return full[:i], full[i + len(first):j], full[j + len(second):]
+
+
+def _truncate_longest_first(n_query: int, n_document: int, budget: int) -> Tuple[int, int]:
+    """Tokenizer'ın truncation="longest_first" davranışıyla aynı (query, doküman) uzunlukları"""
+    if n_query + n_document <= budget:
+        return n_query, n_document
+    half = budget // 2
+    if n_query <= n_document:
+        kept = min(n_query, half)
+        return kept, budget - kept
+    kept = min(n_document, half)
+    return budget - kept, kept
+
+
+def encode_pairs(tokenizer, pairs: Sequence[Tuple[str, Document]], max_length: int = DEFAULT_MAX_LENGTH) -> List[List[int]]:
+    """
+    Çiftleri padding olmadan tokenize et (truncation uygulanır)
+
+    Doküman token id'leri olarak verilmişse yeniden tokenize edilmez; çift,
+    tokenizer'ın şablonu ve truncation kuralıyla aynı sonucu verecek şekilde
+    elle birleştirilir.
+    """
+    if not pairs:
+        return []
+    input_ids: List[List[int]] = [None] * len(pairs)
+
+    text_indices = [i for i, (_, document) in enumerate(pairs) if isinstance(document, str)]
+    if text_indices:
+        encoded = tokenizer(
+            [pairs[i][0] for i in text_indices],
+            [pairs[i][1] for i in text_indices],
+            padding=False,
+            truncation=True,
+            max_length=max_length,
+        )
+        for i, ids in zip(text_indices, encoded["input_ids"]):
+            input_ids[i] = ids
+
+    if len(text_indices) < len(pairs):
+        head, middle, tail = pair_template(tokenizer)
+        budget = max_length - len(head) - len(middle) - len(tail)
+        query_ids: Dict[str, List[int]] = {}
+        for i, (query, document) in enumerate(pairs):
+            if input_ids[i] is not None:
+                continue
+            if query not in query_ids:
+                query_ids[query] = tokenizer.encode(query, add_special_tokens=False)
+            n_query, n_document = _truncate_longest_first(len(query_ids[query]), len(document), budget)
+            input_ids[i] = head + query_ids[query][:n_query] + middle + list(document[:n_document]) + tail
+
+    return input_ids
+
+
+def _length_range(length: int) -> int:
+    """Uzunluğun düştüğü 2'nin kuvveti aralığı (16'dan kısa çiftler tek aralıkta)"""
+    return max(length - 1, 15).bit_length()
+
+
+def bucket_by_length(lengths: Sequence[int], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                     max_batch_size: Optional[int] = None) -> List[List[int]]:
+    """
+    İndeksleri uzunluğa göre sırala ve token bütçesine sığan bucket'lara böl
+
+    Çiftler önce 2'nin kuvvetleri şeklindeki uzunluk aralıklarına ayrılır
+    (≤16, ≤32, ≤64, ...) - kısa ve uzun çiftler aynı batch'e düşmez. Bir bucket'ın
+    maliyeti (üye sayısı x en uzun üye) token_budget'ı geçmez; bütçeden uzun tek
+    bir çift yine de kendi bucket'ında işlenir.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets: List[List[int]] = []
+    current: List[int] = []
+    current_range = None
+
+    for idx in order:
+        length_range = _length_range(lengths[idx])
+        # Sıralı olduğu için eklenen çift bucket'ın yeni en uzun üyesi olur
+        cost = (len(current) + 1) * max(lengths[idx], 1)
+        full = max_batch_size is not None and len(current) >= max_batch_size
+        if current and (cost > token_budget or full or length_range != current_range):
+            buckets.append(current)
+            current = []
+        current.append(idx)
+        current_range = length_range
+
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def pad_batch(tokenizer, input_ids: Sequence[List[int]]) -> Dict[str, torch.Tensor]:
+    """
+    Batch'i sadece kendi en uzun üyesine kadar pad'le
+
+    Sadece input_ids + attention_mask üretilir: bucket'lı yol segment id'si
+    (token_type_ids) kullanmayan modeller içindir (Qwen reranker gibi decoder'lar).
+    BERT tarzı cross-encoder'lar token_type_ids'siz yanlış skor verir.
+    """
+    return tokenizer.pad(
+        {"input_ids": list(input_ids)},
+        padding="longest",
+        return_tensors="pt",
+    )
+
+
+def build_batches(tokenizer, input_ids: Sequence[List[int]], max_length: int = DEFAULT_MAX_LENGTH,
+                  token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  max_batch_size: Optional[int] = None) -> Tuple[List[TokenizedBatch], PaddingStats]:
+    """Önceden tokenize edilmiş çiftleri bucket'la, pad'le ve padding istatistiği çıkar"""
+    lengths = [len(ids) for ids in input_ids]
+    batches: List[TokenizedBatch] = []
+    stats = PaddingStats()
+
+    for bucket in bucket_by_length(lengths, token_budget, max_batch_size):
+        batch = TokenizedBatch(
+            indices=bucket,
+            lengths=[lengths[i] for i in bucket],
+            inputs=pad_batch(tokenizer, [input_ids[i] for i in bucket]),
+        )
+        for length in batch.lengths:
+            stats.add_pair(length, batch.padded_length, max_length)
+        batches.append(batch)
+
+    return batches, stats
+
+
+def tokenize_in_buckets(tokenizer, pairs: Sequence[Tuple[str, Document]], max_length: int = DEFAULT_MAX_LENGTH,
+                        token_budget: int = DEFAULT_TOKEN_BUDGET,
+                        max_batch_size: Optional[int] = None) -> Tuple[List[TokenizedBatch], PaddingStats]:
+    """
+    (query, doküman) çiftlerini uzunluk bucket'larına ayrılmış batch'lere dönüştür
+
+    Returns:
+        (batches, stats): Her batch orijinal indeksleriyle birlikte gelir,
+        stats padding="max_length"'e göre kazanılan pad token'larını gösterir
+    """
+    input_ids = encode_pairs(tokenizer, pairs, max_length)
+    return build_batches(tokenizer, input_ids, max_length, token_budget, max_batch_size)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+💾 RERANKER AĞIRLIK SNAPSHOT'LARI
+Modeli bir kez lokal diske (config + tokenizer + tek weights.pt) çevirir ve
+worker process'lerin ağırlıkları torch.load(mmap=True) ile paylaşımlı olarak
+açmasını sağlar.
+
+mmap'lenen sayfalar salt okunur kullanıldığı için işletim sistemi page cache'inde
+tek kopya olarak durur: N worker toplamda yaklaşık bir modellik RSS kullanır.
+
+Kullanım:
+  python lib/rag/rerank_weights.py <model_name> <snapshot_dir> [float32|bfloat16]
+"""
+
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import torch
+from accelerate import init_empty_weights
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+try:
+    from lib.rag.rerank_tokenization import DEFAULT_PAD_TOKEN
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında (python lib/rag/rerank_weights.py)
+    from rerank_tokenization import DEFAULT_PAD_TOKEN
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_WEIGHTS = "weights.pt"
+SNAPSHOT_META = "snapshot.json"
+
+
+def snapshot_dir_for(root: str, model_name: str, torch_dtype: torch.dtype = torch.float32,
+                     model_class=AutoModelForSequenceClassification) -> str:
+    """
+    Model adı, dtype ve model sınıfı için snapshot dizini
+    (ör. reranker_snapshots/Qwen--Qwen3-Reranker-4B--float32--AutoModelForSequenceClassification)
+    """
+    dtype_name = str(torch_dtype).replace("torch.", "")
+    return os.path.join(root, f"{model_name.strip('/').replace('/', '--')}--{dtype_name}--{model_class.__name__}")
+
+
+def snapshot_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, SNAPSHOT_WEIGHTS)) and os.path.exists(os.path.join(path, SNAPSHOT_META))
+
+
+def read_snapshot_meta(path: str) -> dict:
+    with open(os.path.join(path, SNAPSHOT_META), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_snapshot(model_name: str, path: str, torch_dtype: torch.dtype = torch.float32,
+                    model_class=AutoModelForSequenceClassification) -> str:
+    """Modeli indir/yükle ve snapshot olarak diske yaz (bkz. save_snapshot)"""
+    started = time.time()
+    logger.info(f"💾 Snapshot oluşturuluyor: {model_name} → {path}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = DEFAULT_PAD_TOKEN
+
+    model = model_class.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        torch_dtype=torch_dtype,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model.eval()
+    save_snapshot(model, tokenizer, path, model_name, torch_dtype, model_class)
+    logger.info(f"✅ Snapshot hazır ({time.time() - started:.1f}s): {path}")
+    return path
+
+
+def save_snapshot(model, tokenizer, path: str, model_name: str, torch_dtype: torch.dtype = torch.float32,
+                  model_class=AutoModelForSequenceClassification) -> str:
+    """
+    Bellekteki (henüz quantize edilmemiş) modeli snapshot olarak diske yaz
+
+    Yazma önce geçici dizine yapılır, bitince rename edilir: yarım kalan bir
+    dönüşüm asla geçerli snapshot gibi görünmez.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    tokenizer.save_pretrained(tmp_path)
+    model.config.save_pretrained(tmp_path)
+    # contiguous: mmap ile açılan her tensör dosyada tek parça dursun
+    state = {name: tensor.detach().cpu().contiguous() for name, tensor in model.state_dict().items()}
+    torch.save(state, os.path.join(tmp_path, SNAPSHOT_WEIGHTS))
+
+    with open(os.path.join(tmp_path, SNAPSHOT_META), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "dtype": str(torch_dtype).replace("torch.", ""),
+            "model_class": model_class.__name__,
+            "revision": getattr(model.config, "_commit_hash", None),
+            "created_at": time.time(),
+        }, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_snapshot(path: str, model_class=AutoModelForSequenceClassification):
+    """
+    Snapshot'tan model + tokenizer yükle; ağırlıklar kopyalanmadan mmap'ten kullanılır
+
+    Parametreler önce meta device üzerinde (bellek ayırmadan) oluşturulur, sonra
+    load_state_dict(assign=True) ile mmap'li tensörler doğrudan parametre olarak
+    atanır. Non-persistent buffer'lar (ör. rotary inv_freq) normal şekilde oluşur.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = DEFAULT_PAD_TOKEN
+
+    config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+    with init_empty_weights(include_buffers=False):
+        model = model_class.from_config(config, trust_remote_code=True)
+
+    state = torch.load(os.path.join(path, SNAPSHOT_WEIGHTS), mmap=True, weights_only=True, map_location="cpu")
+    model.load_state_dict(state, assign=True, strict=True)
+    model.eval()
+    return model, tokenizer
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) not in (3, 4):
+        print("Kullanım: python lib/rag/rerank_weights.py <model_name> <snapshot_dir> [float32|bfloat16]")
+        sys.exit(1)
+    create_snapshot(sys.argv[1], sys.argv[2], getattr(torch, sys.argv[3]) if len(sys.argv) == 4 else torch.float32)
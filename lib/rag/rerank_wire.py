@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+📡 RERANKER WIRE PROTOKOLÜ
+İstek/yanıt kodlaması: JSON (orjson varsa onunla) veya msgpack
+
+- İstek: Content-Type: application/msgpack ise gövde msgpack olarak çözülür
+- Yanıt: Accept başlığında application/msgpack varsa msgpack, yoksa JSON
+
+orjson / msgpack kurulu değilse standart json kullanılır ve msgpack istekleri
+415 alır.
+"""
+
+import json
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _is_msgpack(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+
+class WireRequest(Request):
+    """Gövdeyi msgpack ya da (orjson ile) JSON olarak çözen Request"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            if self.scope.get("wire_format") == "msgpack":
+                try:
+                    self._json = msgpack.unpackb(body, raw=False)
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Geçersiz msgpack gövdesi: {e}")
+            elif orjson is not None:
+                # orjson.JSONDecodeError, json.JSONDecodeError'dan türer: FastAPI 422'si korunur
+                self._json = orjson.loads(body)
+            else:
+                self._json = json.loads(body)
+        return self._json
+
+
+class WireRoute(APIRoute):
+    """
+    msgpack gövdeli istekleri kabul eden route
+
+    FastAPI gövdeyi sadece JSON content-type'larında çözer; msgpack isteğinin
+    content-type'ı JSON olarak yeniden yazılır ve çözme WireRequest.json()'a bırakılır.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def wire_handler(request: Request) -> Response:
+            scope = request.scope
+            if _is_msgpack(request.headers.get("content-type", "")):
+                if msgpack is None:
+                    raise HTTPException(status_code=415, detail="msgpack kurulu değil")
+                scope["wire_format"] = "msgpack"
+                scope["headers"] = [
+                    (name, JSON_MEDIA_TYPE.encode("latin-1") if name == b"content-type" else value)
+                    for name, value in scope["headers"]
+                ]
+            return await handler(WireRequest(scope, request.receive))
+
+        return wire_handler
+
+
+def wants_msgpack(request: Request) -> bool:
+    """İstemci Accept başlığında msgpack istiyor mu"""
+    return msgpack is not None and any(_is_msgpack(part) for part in request.headers.get("accept", "").split(","))
+
+
+def encode_response(payload: Any, msgpack_response: bool = False) -> Response:
+    """Yanıt gövdesini seçilen formatta kodla"""
+    if msgpack_response:
+        return Response(content=msgpack.packb(payload, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE)
+    if orjson is not None:
+        return Response(content=orjson.dumps(payload), media_type=JSON_MEDIA_TYPE)
+    return Response(
+        content=json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        media_type=JSON_MEDIA_TYPE,
+    )
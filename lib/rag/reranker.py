@@ -10,6 +10,15 @@ import torch.nn.functional as F
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 from typing import List, Dict
 import logging
+import os
+
+try:
+    from lib.rag.rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET, tokenize_in_buckets
+    from lib.rag.rerank_precision import apply_precision, load_dtype
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında (python lib/rag/reranker.py)
+    from rerank_tokenization import DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET, tokenize_in_buckets
+    from rerank_precision import apply_precision, load_dtype
 
 # Logging ayarla
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +29,9 @@ _model = None
 _tokenizer = None
 _device = None
 
+# Hassasiyet modu: fp32 | bf16 | int8 (reranker_server.py ile aynı ortam değişkeni)
+_precision = os.environ.get("RERANKER_DTYPE", "fp32")
+
 def _load_model():
     """Model ve tokenizer'ı lazy load et"""
     global _model, _tokenizer, _device
@@ -47,12 +59,13 @@ def _load_model():
         _model = AutoModelForSequenceClassification.from_pretrained(
             model_name, 
             trust_remote_code=True,
-            torch_dtype=torch.float32,
+            torch_dtype=load_dtype(_precision),
             pad_token_id=_tokenizer.pad_token_id  # Kritik! Model'a pad_token_id'yi ver
         ).to(_device)
         _model.eval()  # Evaluation mode
+        _model = apply_precision(_model, _precision)
         
-        logger.info("✅ Model başarıyla yüklendi")
+        logger.info(f"✅ Model başarıyla yüklendi (hassasiyet={_precision})")
         return _model, _tokenizer, _device
         
     except Exception as e:
@@ -96,44 +109,34 @@ def rerank_documents(
         # Her dokümantı sorgu ile pair yap
         pairs = [[query, doc] for doc in documents]
         
-        # Tokenize et - daha kısa max_length ve padding kontrolü
+        # Tokenize et - uzunluk bucket'ları + her batch kendi en uzun çiftine kadar pad'lenir
         with torch.no_grad():
-            inputs = tokenizer(
-                pairs,
-                padding=True,  # Dinamik padding
-                truncation=True,
-                return_tensors='pt',
-                max_length=128  # Daha kısa - inference'ı hızlandır
-            ).to(device)
+            batches, stats = tokenize_in_buckets(tokenizer, pairs, DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET)
+            
+            logger.info(f"   ✅ Tokenize başarılı: {len(batches)} batch, shapes={[tuple(b.inputs['input_ids'].shape) for b in batches]}")
+            logger.info(f"   ✂️ Padding: {stats.as_dict()}")
             
-            logger.info(f"   ✅ Tokenize başarılı: input shape={inputs['input_ids'].shape}")
-            logger.info(f"   📝 Input keys: {list(inputs.keys())}")
-            logger.info(f"   🔧 Attention mask: {inputs['attention_mask'][0][:20]}...")
+            scores = [0.0] * len(documents)
             
             # Model çalıştır
             try:
                 logger.info(f"   🚀 Model inference başladı...")
-                # Explicit attention mask ve token_type_ids ekle
-                model_inputs = {
-                    'input_ids': inputs['input_ids'],
-                    'attention_mask': inputs['attention_mask']
-                }
-                if 'token_type_ids' in inputs:
-                    model_inputs['token_type_ids'] = inputs['token_type_ids']
-                
-                outputs = model(**model_inputs)
-                logger.info(f"   ✅ Model inference başarılı, logits shape={outputs.logits.shape}")
-                
-                # Logits shape: (batch_size, num_labels=2)
-                # Label 0: not-relevant, Label 1: relevant
-                # Logits'i softmax ile probability'ye dönüştür
-                logits = outputs.logits
-                logger.info(f"   📊 Logits sample: {logits[0].detach().cpu().tolist()}")
-                
-                probs = F.softmax(logits, dim=-1)  # Softmax
-                logger.info(f"   📊 Probs sample: {probs[0].detach().cpu().tolist()}")
+                for batch in batches:
+                    # Explicit attention mask (bucket'lı yol token_type_ids üretmez, bkz. pad_batch)
+                    model_inputs = {
+                        'input_ids': batch.inputs['input_ids'].to(device),
+                        'attention_mask': batch.inputs['attention_mask'].to(device)
+                    }
+                    
+                    outputs = model(**model_inputs)
+                    
+                    # Logits shape: (batch_size, num_labels=2)
+                    # Label 0: not-relevant, Label 1: relevant
+                    # Logits'i softmax ile probability'ye dönüştür
+                    probs = F.softmax(outputs.logits.float(), dim=-1)  # Softmax (bf16 logits fp32'ye çevrilir)
+                    for idx, score in zip(batch.indices, probs[:, 1].cpu().tolist()):
+                        scores[idx] = score  # Relevant class'ın probability'si
                 
-                scores = probs[:, 1].cpu().tolist()  # Relevant class'ın probability'si
                 logger.info(f"   ✅ Scores hesaplandı: {scores[:3]}...")
                 
             except Exception as e:
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+🎥 TRAFİK KAYDI
+reranker_server.py ve vlm_transformers_server.py'nin isteklerini JSONL'e yazar;
+lib/rag/traffic_replay.py bu kaydı aynı zamanlama ile yeniden oynatır.
+
+Her satır bir istek:
+  {"ts": 1718000000.123, "endpoint": "/rerank", "status": 200, "elapsed_ms": 812.4,
+   "worker_pid": 1234, "request": {...boyutlar...}, "payload": {...}}
+
+- request: Payload'sız boyut bilgisi (doküman sayısı, karakter uzunlukları,
+  görsel boyutu...); replay payload yoksa aynı boyutta sentetik istek üretir
+- payload: Sadece payload kaydı açıksa - istek gövdesinin kendisi (metinler /
+  görseller diske yazılır, hassas veri içerebilir)
+
+Satırlar O_APPEND ile tek write() çağrısında yazılır: çoklu worker aynı dosyaya
+kayıt yapabilir.
+"""
+
+import json
+import os
+import random
+from typing import Iterator, Optional
+
+
+class TrafficCapture:
+    """İstek kaydedici (sample_rate: kaydedilecek isteklerin oranı)"""
+
+    def __init__(self, path: str, payloads: bool = False, sample_rate: float = 1.0):
+        self.path = path
+        self.payloads = payloads
+        self.sample_rate = sample_rate
+        self.recorded = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, endpoint: str, started_at: float, elapsed_ms: float, status: int,
+               request: Optional[dict] = None, payload: Optional[dict] = None):
+        entry = {
+            "ts": round(started_at, 6),
+            "endpoint": endpoint,
+            "status": status,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "worker_pid": os.getpid(),
+            "request": request,
+        }
+        if self.payloads and payload is not None:
+            entry["payload"] = payload
+        os.write(self._fd, (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.recorded += 1
+
+    def stats(self) -> dict:
+        return {"path": self.path, "payloads": self.payloads, "sample_rate": self.sample_rate,
+                "recorded": self.recorded}
+
+    def close(self):
+        os.close(self._fd)
+
+
+def capture_from_env(prefix: str) -> Optional[TrafficCapture]:
+    """<PREFIX>_CAPTURE_PATH ayarlıysa kaydediciyi oluştur (ör. prefix="RERANKER")"""
+    path = os.environ.get(f"{prefix}_CAPTURE_PATH", "")
+    if not path:
+        return None
+    return TrafficCapture(
+        path,
+        payloads=os.environ.get(f"{prefix}_CAPTURE_PAYLOADS", "0") == "1",
+        sample_rate=float(os.environ.get(f"{prefix}_CAPTURE_SAMPLE", "1.0")),
+    )
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """Kayıt dosyasını oku (yarım yazılmış son satır atlanır)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def percentile(values, q: float) -> float:
+    """Doğrusal interpolasyonlu yüzdelik (q: 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+🔁 TRAFİK REPLAY
+lib/rag/traffic_capture.py ile kaydedilmiş trafiği (RERANKER_CAPTURE_PATH /
+VLM_CAPTURE_PATH) aynı zaman aralıklarıyla sunuculara yeniden gönderir ve
+gecikme dağılımını raporlar
+
+- İstekler kayıttaki zaman damgalarına göre, --speedup kat hızlandırılarak
+  gönderilir (--speedup 0: beklemeden, sadece --concurrency sınırıyla)
+- Kayıtta payload varsa aynen gönderilir; yoksa aynı boyutta sentetik istek
+  üretilir (aynı sayıda / uzunlukta doküman, aynı boyutta görsel).
+  document_ids ile gelmiş istekler sentetikte metinle gönderilir (id'ler hedef
+  sunucunun token store'unda olmayabilir). Sentetik görsellere rastgele kutular
+  çizilir: VLM sonuç cache'i replay'i cache isabetine çevirmesin
+- /analyze/batch öğeleri kayıttaki boyutlarıyla tek istekte gönderilir (raporda
+  öğe durumları ayrıca sayılır); /analyze/stream yanıtı akış bitene kadar okunur
+- Rapor endpoint başına: durum kodları, replay gecikmesi (p50/p90/p99/max),
+  kayıttaki gecikme ve zamanlama gecikmesi (concurrency sınırı yüzünden geç
+  gönderilen istekler)
+
+Kullanım:
+  python lib/rag/traffic_replay.py reranker_capture.jsonl --speedup 2 --concurrency 16
+  python lib/rag/traffic_replay.py vlm_capture.jsonl --vlm-url http://localhost:8001 --output replay.json
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from lib.rag.traffic_capture import percentile, read_capture
+except ImportError:
+    # Dosya doğrudan çalıştırıldığında (python lib/rag/traffic_replay.py)
+    from traffic_capture import percentile, read_capture
+
+logger = logging.getLogger(__name__)
+
+# Sentetik metinlerin kelime havuzu
+FILLER_WORDS = (
+    "hedef anahtar sonuç çeyrek müşteri satış ekip yeni oranı yüzde sözleşme değeri raporlar haftalık "
+    "yönetici bütçe revizyonu sürüm memnuniyet anket gelir büyüme maliyet süreç destek talebi yanıt süresi"
+).split()
+# Karakter uzunluğu bilinmeyen dokümanlar için (ör. document_ids ile gelmiş istek)
+DEFAULT_DOCUMENT_CHARS = 800
+DEFAULT_IMAGE_SIZE = (1024, 1024)
+
+
+def filler_text(chars: int, rng: random.Random) -> str:
+    """Yaklaşık `chars` karakterlik Türkçe dolgu metni"""
+    words: List[str] = []
+    length = 0
+    while length < chars:
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:max(chars, 1)]
+
+
+def synthesize_rerank(shape: dict, rng: random.Random) -> dict:
+    """Kayıttaki boyutlarla sentetik /rerank gövdesi"""
+    if "groups" in shape:
+        return {"requests": [synthesize_rerank(group, rng) for group in shape["groups"]]}
+    chars = shape.get("document_chars") or [DEFAULT_DOCUMENT_CHARS] * shape.get("documents", 0)
+    body = {
+        "query": filler_text(shape.get("query_chars", 40), rng),
+        "documents": [filler_text(n, rng) for n in chars],
+    }
+    for field in ("top_k", "lean", "cascade", "cascade_top_n", "deadline_ms", "partial"):
+        if shape.get(field) is not None:
+            body[field] = shape[field]
+    return body
+
+
+def synthesize_analyze(shape: dict, rng: random.Random) -> dict:
+    """Kayıttaki görsel boyutuyla sentetik /analyze gövdesi (rastgele kutulu sayfa)"""
+    from PIL import Image, ImageDraw
+
+    if "items" in shape:
+        return {"items": [synthesize_analyze(item, rng) for item in shape["items"]]}
+    size = (shape.get("width") or DEFAULT_IMAGE_SIZE[0], shape.get("height") or DEFAULT_IMAGE_SIZE[1])
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        left, top = rng.randrange(size[0]), rng.randrange(size[1])
+        right, bottom = rng.randint(left, size[0]), rng.randint(top, size[1])
+        draw.rectangle((left, top, right, bottom), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return {
+        "image_base64": base64.b64encode(buffer.getvalue()).decode("ascii"),
+        "task": shape.get("task", "extract"),
+        "language": shape.get("language", "turkish"),
+    }
+
+
+def build_body(record: dict, rng: random.Random, synthetic: bool = False) -> Optional[dict]:
+    """Kayıttan gönderilecek gövde (payload yoksa ya da synthetic ise boyutlardan üretilir)"""
+    if not synthetic and record.get("payload") is not None:
+        return record["payload"]
+    shape = record.get("request")
+    if shape is None:
+        return None  # Gövdesi doğrulanamamış istek (422): yeniden üretilemez
+    if record["endpoint"].startswith("/analyze"):
+        return synthesize_analyze(shape, rng)
+    return synthesize_rerank(shape, rng)
+
+
+def _post(url: str, body: bytes, timeout: float) -> Tuple[int, float, Optional[str], bytes]:
+    """JSON POST; (durum kodu, gecikme ms, hata, yanıt gövdesi) - bağlantı hatasında durum 0"""
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    started = time.perf_counter()
+    content = b""
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content = response.read()  # Akışlı yanıtta akış bitene kadar
+            status, error = response.status, None
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, error = e.code, None
+    except (urllib.error.URLError, OSError) as e:
+        status, error = 0, str(e)
+    return status, (time.perf_counter() - started) * 1000, error, content
+
+
+def _item_statuses(content: bytes) -> List[int]:
+    """/analyze/batch yanıtındaki öğe durumları"""
+    try:
+        return [item.get("status", 0) for item in json.loads(content).get("results", [])]
+    except (ValueError, AttributeError):
+        return []
+
+
+def _distribution(values: Sequence[float]) -> dict:
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p90": round(percentile(values, 90), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2),
+        "mean": round(sum(values) / len(values), 2),
+    }
+
+
+async def replay(records: Sequence[dict], base_urls: Dict[str, str], speedup: float = 1.0,
+                 concurrency: int = 16, timeout: float = 300.0, synthetic: bool = False, seed: int = 0) -> dict:
+    """
+    Kayıtları zamanlamalarıyla yeniden gönder
+
+    Args:
+        base_urls: endpoint → sunucu adresi (ör. {"/rerank": "http://localhost:8000"})
+        speedup: Kayıttaki aralıkların kaç kat hızlı oynatılacağı (0 = beklemeden)
+    """
+    rng = random.Random(seed)
+    prepared = []
+    skipped = Counter()
+    for record in sorted(records, key=lambda r: r["ts"]):
+        body = build_body(record, rng, synthetic)
+        if body is None:
+            skipped[record["endpoint"]] += 1
+            continue
+        prepared.append((record, json.dumps(body, ensure_ascii=False).encode("utf-8")))
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="replay")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results: Dict[str, List[dict]] = defaultdict(list)
+    first_ts = prepared[0][0]["ts"] if prepared else 0.0
+    started = loop.time()
+
+    async def fire(record: dict, body: bytes):
+        scheduled = started + ((record["ts"] - first_ts) / speedup if speedup > 0 else 0.0)
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        async with semaphore:
+            lag_ms = (loop.time() - scheduled) * 1000
+            url = base_urls[record["endpoint"]].rstrip("/") + record["endpoint"]
+            status, latency_ms, error, content = await loop.run_in_executor(executor, _post, url, body, timeout)
+        results[record["endpoint"]].append({
+            "status": status, "latency_ms": latency_ms, "lag_ms": lag_ms, "error": error,
+            "captured_ms": record.get("elapsed_ms"), "captured_status": record.get("status"),
+            "item_status": _item_statuses(content) if record["endpoint"] == "/analyze/batch" and status == 200 else [],
+        })
+
+    logger.info(f"🔁 {len(prepared)} istek oynatılıyor (speedup={speedup}, concurrency={concurrency})")
+    try:
+        await asyncio.gather(*(fire(record, body) for record, body in prepared))
+    finally:
+        executor.shutdown(wait=False)
+    duration = loop.time() - started
+
+    captured_span = (prepared[-1][0]["ts"] - first_ts) if len(prepared) > 1 else 0.0
+    report = {
+        "requests": len(prepared),
+        "skipped": dict(skipped),
+        "speedup": speedup,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 3),
+        "achieved_rps": round(len(prepared) / duration, 3) if duration > 0 else None,
+        "captured_rps": round(len(prepared) / captured_span, 3) if captured_span > 0 else None,
+        "endpoints": {},
+    }
+    for endpoint, entries in sorted(results.items()):
+        ok = [e for e in entries if 200 <= e["status"] < 300]
+        captured_ok = [e["captured_ms"] for e in entries
+                       if e["captured_ms"] is not None and 200 <= (e["captured_status"] or 0) < 300]
+        errors = Counter(e["error"] for e in entries if e["error"])
+        report["endpoints"][endpoint] = {
+            "requests": len(entries),
+            "status": dict(Counter(str(e["status"]) for e in entries)),
+            "latency_ms": _distribution([e["latency_ms"] for e in ok]),
+            "captured_latency_ms": _distribution(captured_ok),
+            "schedule_lag_ms": _distribution([e["lag_ms"] for e in entries]),
+            "errors": dict(errors.most_common(5)),
+        }
+        item_statuses = [str(status) for e in entries for status in e["item_status"]]
+        if item_statuses:
+            report["endpoints"][endpoint]["item_status"] = dict(Counter(item_statuses))
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Kaydedilmiş reranker / VLM trafiğini yeniden oynat")
+    parser.add_argument("capture", nargs="+", help="Kayıt dosyaları (JSONL)")
+    parser.add_argument("--speedup", type=float, default=1.0, help="Zamanlama hızlandırma katsayısı (0 = beklemeden)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Aynı anda açık maksimum istek")
+    parser.add_argument("--reranker-url", default="http://localhost:8000")
+    parser.add_argument("--vlm-url", default="http://localhost:8001")
+    parser.add_argument("--endpoints", help="Sadece bu endpoint'ler (virgülle, ör. /rerank)")
+    parser.add_argument("--limit", type=int, help="En fazla bu kadar istek (kayıt sırasıyla)")
+    parser.add_argument("--synthetic", action="store_true", help="Payload olsa da boyutlardan sentetik istek üret")
+    parser.add_argument("--timeout", type=float, default=300.0, help="İstek başına zaman aşımı (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Rapor dosyası (JSON); verilmezse stdout")
+    args = parser.parse_args()
+
+    records = [record for path in args.capture for record in read_capture(path)]
+    if args.endpoints:
+        wanted = {e.strip() for e in args.endpoints.split(",") if e.strip()}
+        records = [r for r in records if r["endpoint"] in wanted]
+    records.sort(key=lambda r: r["ts"])
+    if args.limit:
+        records = records[:args.limit]
+
+    base_urls = {
+        "/rerank": args.reranker_url, "/rerank/batch": args.reranker_url,
+        "/analyze": args.vlm_url, "/analyze/batch": args.vlm_url, "/analyze/stream": args.vlm_url,
+    }
+    unknown = {r["endpoint"] for r in records} - set(base_urls)
+    if unknown:
+        parser.error(f"Bilinmeyen endpoint'ler: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(replay(
+        records, base_urls, args.speedup, args.concurrency, args.timeout, args.synthetic, args.seed
+    ))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
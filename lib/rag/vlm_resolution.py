@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+📐 VLM ÇÖZÜNÜRLÜK BÜTÇESİ
+vlm_transformers_server.py'nin görselleri görev başına vision token bütçesine
+sığdırırken kullandığı ızgara hesabı
+
+Qwen2.5-VL'de bir vision token factor × factor piksellik bir karedir (14px patch ×
+2×2 merge = 28px). Kenarlar factor'ün katına yuvarlanır; böylece processor'ın kendi
+yeniden boyutlandırması devreye girmez ve token sayısı doğrudan (w/factor)·(h/factor) olur.
+"""
+
+import math
+from typing import Tuple
+
+
+def vision_tokens(width: int, height: int, factor: int) -> int:
+    """Izgaraya oturmuş görselin vision token sayısı"""
+    return (width // factor) * (height // factor)
+
+
+def fit_size(width: int, height: int, factor: int, max_tokens: int, min_tokens: int) -> Tuple[int, int]:
+    """
+    (width, height) görselinin bütçeye sığan, factor'ün katı yeni boyutu
+
+    Bütçeyi aşan görsel en-boy oranı korunarak küçültülür, min_tokens altındaki
+    büyütülür; arada kalan sadece en yakın ızgara katına yuvarlanır. Bütçe kesin
+    sınırdır: yuvarlama onu aşarsa (ör. 28px'den ince banner) oranca en çok
+    büyüyen kenar birer kare kısaltılır.
+    """
+    max_tokens = max(max_tokens, min_tokens)
+    max_pixels = max_tokens * factor * factor
+    min_pixels = min_tokens * factor * factor
+
+    new_width = max(factor, round(width / factor) * factor)
+    new_height = max(factor, round(height / factor) * factor)
+    if new_width * new_height > max_pixels:
+        beta = math.sqrt(width * height / max_pixels)
+        new_width = max(factor, math.floor(width / beta / factor) * factor)
+        new_height = max(factor, math.floor(height / beta / factor) * factor)
+    elif new_width * new_height < min_pixels:
+        beta = math.sqrt(min_pixels / (width * height))
+        new_width = math.ceil(width * beta / factor) * factor
+        new_height = math.ceil(height * beta / factor) * factor
+
+    # Kenarlar en az bir kare olduğu için yuvarlama bütçeyi iki yönde de kaçırabilir
+    while vision_tokens(new_width, new_height, factor) > max_tokens and max(new_width, new_height) > factor:
+        if new_height == factor or (new_width > factor and new_width / width >= new_height / height):
+            new_width -= factor
+        else:
+            new_height -= factor
+    while vision_tokens(new_width, new_height, factor) < min_tokens:
+        if new_width / width <= new_height / height:
+            grown = (new_width + factor, new_height)
+        else:
+            grown = (new_width, new_height + factor)
+        if vision_tokens(*grown, factor) > max_tokens:
+            break
+        new_width, new_height = grown
+    return new_width, new_height
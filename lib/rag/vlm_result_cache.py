@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+🗂️ VLM SONUÇ CACHE'İ
+vlm_transformers_server.py'nin analiz sonuçlarını görselin içeriğine göre saklayan
+kalıcı cache: tekrar yüklenen PDF'ler, aynı slayt şablonları ve logolar generate
+edilmeden cevaplanır.
+
+Anahtarlar:
+  context - (model, görev, prompt, üretim parametreleri) hash'i
+  key     - context + çözülmüş görselin piksel byte'larının sha256'sı (birebir eşleşme)
+  phash   - 64 bit difference hash (opsiyonel): aynı context'te Hamming mesafesi
+            eşiğin altındaki kayıt "yakın kopya" olarak döner
+
+Kayıtlar SQLite dosyasında tutulur (süreç yeniden başlasa da kalır); toplam boyut
+max_mb'yi aşınca en uzun süredir okunmayan kayıtlar atılır.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key BLOB PRIMARY KEY,
+    context BLOB NOT NULL,
+    phash INTEGER,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_context ON entries (context);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+
+def context_key(*parts: str) -> bytes:
+    """Görselden bağımsız kısım: model, görev, prompt, parametreler"""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = str(part).encode("utf-8")
+        # Uzunluk öneki: ("ab", "c") ile ("a", "bc") aynı hash'i vermesin
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+    return digest.digest()
+
+
+def image_key(context: bytes, image: Image.Image) -> bytes:
+    """Birebir anahtar: context + görselin modu, boyutu ve piksel byte'ları"""
+    digest = hashlib.sha256(context)
+    digest.update(f"{image.mode}:{image.width}x{image.height}".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+def difference_hash(image: Image.Image, size: int = 8) -> int:
+    """
+    Difference hash (dHash): gri tonlu (size+1)×size küçültmede yan yana piksellerin
+    parlaklık karşılaştırması → size² bit. Yeniden sıkıştırma / ölçekleme gibi
+    küçük farklar birkaç bit değiştirir.
+    """
+    pixels = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    # SQLite INTEGER işaretli 64 bit
+    return bits - (1 << 64) if bits >= (1 << 63) else bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+class CacheHit(NamedTuple):
+    value: dict
+    kind: str  # "exact" | "perceptual"
+
+
+class VLMResultCache:
+    """
+    İçerik adresli analiz sonucu cache'i (max_mb = 0 → kapalı)
+
+    phash_distance < 0 ise yakın kopya araması kapalıdır; sadece birebir aynı
+    pikseller cache'ten döner. Bağlantı thread'ler arasında bir kilitle paylaşılır.
+    """
+
+    def __init__(self, path: str, max_mb: float, phash_distance: int = -1):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.phash_distance = phash_distance
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.total_bytes = 0
+        self.entries = 0
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        if not self.enabled:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self.entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self.total_bytes = int(total)
+        logger.info(f"💾 VLM sonuç cache'i: {self.entries} kayıt, {self.total_bytes / 1024 / 1024:.1f} MB ({path})")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def perceptual(self) -> bool:
+        return self.enabled and self.phash_distance >= 0
+
+    def get(self, key: bytes, context: bytes, phash: Optional[int] = None) -> Optional[CacheHit]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            kind = "exact"
+            if row is None and phash is not None and self.perceptual:
+                # Aynı context'teki en yakın phash (yakın kopya)
+                best = None
+                for candidate_key, candidate_phash in self._db.execute(
+                    "SELECT key, phash FROM entries WHERE context = ? AND phash IS NOT NULL", (context,)
+                ):
+                    distance = hamming(phash, candidate_phash)
+                    if distance <= self.phash_distance and (best is None or distance < best[0]):
+                        best = (distance, candidate_key)
+                if best is not None:
+                    key = best[1]
+                    row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                    kind = "perceptual"
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        if kind == "exact":
+            self.exact_hits += 1
+        else:
+            self.perceptual_hits += 1
+        return CacheHit(json.loads(row[0]), kind)
+
+    def put(self, key: bytes, context: bytes, phash: Optional[int], value: dict):
+        if not self.enabled:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(key) + len(context) + len(encoded.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, context, phash, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, context, phash, encoded, size, now, now),
+            )
+            if previous is None:
+                self.entries += 1
+                self.total_bytes += size
+            else:
+                self.total_bytes += size - previous[0]
+            self.writes += 1
+            self._evict()
+
+    def _evict(self):
+        """Boyut sınırı aşıldıysa en uzun süredir okunmayan kayıtları at (kilit içinde)"""
+        while self.total_bytes > self.max_bytes and self.entries > 0:
+            victims = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            for victim_key, victim_size in victims:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (victim_key,))
+                self.entries -= 1
+                self.total_bytes -= victim_size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.perceptual_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "perceptual": self.perceptual,
+            "entries": self.entries,
+            "size_mb": round(self.total_bytes / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+🔀 RERANK ROUTER (scatter-gather)
+Birden fazla reranker_server.py replikasının önünde durur; tek bir isteğin
+dokümanlarını replikalara bölüp paralel skorlatır ve kısmi sonuçları tek bir
+global top-k'da birleştirir. 100+ adaylı tek sorguda gecikme, replika sayısına
+yakın oranda düşer (sadece toplam throughput değil).
+
+- Sağlık: replikaların /health/ready ve /health'i periyodik yoklanır; hazır
+  olmayan replikaya parça gönderilmez
+- Yük: en az yüklü replika seçilir - tahmini bekleme = (replika kuyruğu +
+  router'ın o replikada açık çiftleri) / replikanın pairs/sn'si
+- Bölme: dokümanlar karakter uzunluğuna göre dengeli parçalara ayrılır
+  (uzun dokümanlar önce, en hafif parçaya); her parça kendi top_k'sını döner,
+  global top-k bu parçaların birleşimidir
+- Hata: parçası başarısız olan replika sağlıksız işaretlenir, parça bir kez
+  başka replikada denenir. partial=true ise yine de skorlanamayan dokümanlar
+  unscored_indices'te döner
+
+Replikalara her zaman lean istek gönderilir; tam yanıt (ranked_documents)
+router'da oluşturulur. Cascade açıksa BM25 istatistikleri parça içinde
+hesaplanır ve cascade_top_n parça başına uygulanır.
+
+Kullanım:
+  RERANKER_ROUTER_REPLICAS=http://localhost:8000,http://localhost:8002 python rerank_router.py
+  # Aynı makinedeki replikalar Unix socket ile: unix:/tmp/reranker0.sock,unix:/tmp/reranker1.sock
+"""
+
+import os
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from lib.rag.rerank_wire import WireRoute, encode_response, wants_msgpack
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# Sağlık yoklamaları her HTTP isteğini INFO'da log'lamasın
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Router ayarları (ortam değişkenleri ile değiştirilebilir)
+# REPLICAS: Virgülle ayrılmış replika adresleri (http://host:port ya da unix:/yol.sock)
+# MIN_SHARD: Bir parçadaki en az doküman sayısı; küçük istekler bölünmeden tek replikaya gider
+# HEALTH_INTERVAL_S: Replika sağlık / yük yoklama aralığı
+# TIMEOUT_S: Replika isteği zaman aşımı (istekte deadline_ms varsa o kullanılır)
+REPLICAS = [r.strip() for r in os.environ.get("RERANKER_ROUTER_REPLICAS", "http://localhost:8000").split(",") if r.strip()]
+PORT = int(os.environ.get("RERANKER_ROUTER_PORT", "8010"))
+MIN_SHARD = int(os.environ.get("RERANKER_ROUTER_MIN_SHARD", "16"))
+HEALTH_INTERVAL_S = float(os.environ.get("RERANKER_ROUTER_HEALTH_INTERVAL_S", "2"))
+TIMEOUT_S = float(os.environ.get("RERANKER_ROUTER_TIMEOUT_S", "180"))
+
+app = FastAPI(title="Rerank Router", version="1.0")
+app.router.route_class = WireRoute
+
+
+class RouterRequest(BaseModel):
+    """reranker_server.RerankerRequest ile aynı alanlar"""
+    query: str
+    documents: List[str] = []
+    document_ids: Optional[List[int]] = None
+    top_k: int = 10
+    lean: bool = False
+    deadline_ms: Optional[float] = None
+    partial: bool = False
+    cascade: Optional[bool] = None
+    cascade_top_n: Optional[int] = None
+
+
+class ShardError(Exception):
+    """Bir parçanın replikada skorlanamaması (status: replikanın döndüğü HTTP kodu, bağlantı hatasında 0)"""
+
+    def __init__(self, message: str, status: int = 0, detail=None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.detail = detail
+        self.headers = headers or {}
+
+
+class Replica:
+    """Tek bir reranker replikası: bağlantı, sağlık ve yük durumu"""
+
+    def __init__(self, address: str):
+        self.address = address
+        if address.startswith("unix:"):
+            transport = httpx.AsyncHTTPTransport(uds=address[len("unix:"):])
+            self.client = httpx.AsyncClient(transport=transport, base_url="http://reranker")
+        else:
+            self.client = httpx.AsyncClient(base_url=address)
+        self.ready = False
+        self.queue_pairs = 0  # Replikanın son bildirdiği kuyruk
+        self.pairs_per_second: Optional[float] = None
+        self.inflight_pairs = 0  # Router'ın bu replikada cevap bekleyen çiftleri
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def estimated_wait_s(self, extra_pairs: int = 0) -> float:
+        """Bu replikaya extra_pairs çift daha verilirse tahmini bitiş süresi"""
+        rate = self.pairs_per_second or 100.0  # Henüz ölçüm yoksa kaba bir varsayım
+        return (self.queue_pairs + self.inflight_pairs + extra_pairs) / rate
+
+    async def refresh(self):
+        """Hazır olma ve yük bilgisini güncelle"""
+        try:
+            ready = await self.client.get("/health/ready", timeout=2.0)
+            self.ready = ready.status_code == 200
+            if self.ready:
+                health = (await self.client.get("/health", timeout=2.0)).json()
+                self.queue_pairs = health.get("queue_size") or 0
+                self.pairs_per_second = health.get("pairs_per_second") or self.pairs_per_second
+            self.last_error = None if self.ready else f"ready={ready.status_code}"
+        except (httpx.HTTPError, ValueError) as e:
+            self.ready = False
+            self.last_error = str(e) or type(e).__name__
+
+    async def rerank(self, body: dict, pairs: int, timeout: float) -> dict:
+        """Parçayı skorlat (lean yanıt)"""
+        self.inflight_pairs += pairs
+        self.requests += 1
+        try:
+            response = await self.client.post("/rerank", json=body, timeout=timeout)
+        except httpx.HTTPError as e:
+            self.failures += 1
+            self.ready = False  # Bir sonraki yoklamaya kadar parça gönderilmez
+            self.last_error = str(e) or type(e).__name__
+            raise ShardError(f"{self.address}: {self.last_error}")
+        finally:
+            self.inflight_pairs -= pairs
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            if response.status_code in (500, 503):
+                self.failures += 1
+                self.ready = response.status_code != 500 and self.ready
+                self.last_error = f"{response.status_code}: {detail}"
+            headers = {name: response.headers[name] for name in ("Retry-After", "X-Estimated-Wait-Ms")
+                       if name in response.headers}
+            raise ShardError(f"{self.address}: {response.status_code} {detail}", response.status_code, detail, headers)
+        return response.json()
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address,
+            "ready": self.ready,
+            "queue_pairs": self.queue_pairs,
+            "inflight_pairs": self.inflight_pairs,
+            "pairs_per_second": self.pairs_per_second,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+replicas = [Replica(address) for address in REPLICAS]
+health_task: Optional[asyncio.Task] = None
+routed_requests = 0
+routed_shards = 0
+retried_shards = 0
+
+
+def split_documents(lengths: List[int], shards: int) -> List[List[int]]:
+    """
+    Doküman indekslerini toplam uzunluğu dengeli parçalara böl
+
+    En uzun doküman önce, o an en hafif parçaya (LPT). Parça içindeki sıra
+    orijinal sıradır.
+    """
+    loads = [0] * shards
+    parts: List[List[int]] = [[] for _ in range(shards)]
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        lightest = min(range(shards), key=lambda s: loads[s])
+        parts[lightest].append(index)
+        loads[lightest] += lengths[index]
+    return [sorted(part) for part in parts if part]
+
+
+def pick_replicas(count: int, pairs_per_shard: int, exclude: Tuple[Replica, ...] = ()) -> List[Replica]:
+    """En az yüklü `count` hazır replika (tahmini bitiş süresine göre)"""
+    candidates = [r for r in replicas if r.ready and r not in exclude]
+    return sorted(candidates, key=lambda r: r.estimated_wait_s(pairs_per_shard))[:count]
+
+
+def _shard_body(request: RouterRequest, indices: List[int]) -> dict:
+    """Parçanın replika isteği (her zaman lean; top_k parça boyutuyla sınırlı)"""
+    body = {
+        "query": request.query,
+        "documents": [request.documents[i] for i in indices] if request.documents else [],
+        "top_k": min(request.top_k, len(indices)),
+        "lean": True,
+        "partial": request.partial,
+    }
+    if request.document_ids is not None:
+        body["document_ids"] = [request.document_ids[i] for i in indices]
+    for field in ("deadline_ms", "cascade", "cascade_top_n"):
+        if getattr(request, field) is not None:
+            body[field] = getattr(request, field)
+    return body
+
+
+async def score_shard(request: RouterRequest, indices: List[int], replica: Replica, timeout: float) -> dict:
+    """Parçayı skorlat; replika başarısızsa bir kez en az yüklü başka replikada dene"""
+    global retried_shards
+    body = _shard_body(request, indices)
+    try:
+        return await replica.rerank(body, len(indices), timeout)
+    except ShardError as e:
+        # 4xx (geçersiz istek, bulunamayan id) ve 504 (deadline) başka replikada da aynı sonucu verir
+        if e.status not in (0, 500, 503):
+            raise
+        fallback = pick_replicas(1, len(indices), exclude=(replica,))
+        if not fallback:
+            raise
+        logger.warning(f"🔁 Parça {replica.address} → {fallback[0].address}: {e}")
+        retried_shards += 1
+        return await fallback[0].rerank(body, len(indices), timeout)
+
+
+async def route(request: RouterRequest) -> dict:
+    """İsteği parçalara böl, paralel skorlat ve global top-k'yı birleştir"""
+    global routed_requests, routed_shards
+    total = len(request.document_ids) if request.document_ids is not None else len(request.documents)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="En az 1 doküman gerekli")
+    if request.document_ids is not None and request.documents and len(request.documents) != total:
+        raise HTTPException(status_code=400, detail="documents ve document_ids aynı uzunlukta olmalı")
+
+    started = time.perf_counter()
+    available = sum(1 for r in replicas if r.ready)
+    if available == 0:
+        raise HTTPException(status_code=503, detail="Hazır reranker replikası yok", headers={"Retry-After": "5"})
+    shard_count = max(1, min(available, math.ceil(total / MIN_SHARD)))
+    lengths = [len(d) for d in request.documents] if request.documents else [1] * total
+    parts = split_documents(lengths, shard_count)
+    chosen = pick_replicas(len(parts), math.ceil(total / len(parts)))
+    timeout = request.deadline_ms / 1000 + 1.0 if request.deadline_ms else TIMEOUT_S
+
+    results = await asyncio.gather(
+        *(score_shard(request, part, replica, timeout) for part, replica in zip(parts, chosen)),
+        return_exceptions=True,
+    )
+    routed_requests += 1
+    routed_shards += len(parts)
+
+    # Parça sonuçlarını global indekslere çevir
+    scored: List[Tuple[int, float]] = []
+    unscored: List[int] = []
+    missing_ids: List[int] = []
+    errors: List[ShardError] = []
+    for part, result in zip(parts, results):
+        if isinstance(result, ShardError):
+            errors.append(result)
+            if result.status == 404 and isinstance(result.detail, dict):
+                missing_ids.extend(result.detail.get("missing_ids", []))
+            unscored.extend(part)
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        scored.extend((part[i], score) for i, score in zip(result["indices"], result["scores"]))
+        unscored.extend(part[i] for i in result.get("unscored_indices") or [])
+
+    if missing_ids:
+        raise HTTPException(status_code=404, detail={"error": f"{len(missing_ids)} doküman token store'da yok",
+                                                     "missing_ids": sorted(missing_ids)})
+    if errors and (not request.partial or not scored):
+        error = errors[0]
+        status = error.status if error.status in (400, 413, 422, 503, 504) else 502
+        raise HTTPException(status_code=status, detail=f"{len(errors)}/{len(parts)} parça skorlanamadı: {error}",
+                            headers=error.headers or None)
+
+    ranked = sorted(scored, key=lambda item: item[1], reverse=True)[:request.top_k]
+    logger.info(f"🔀 {total} doküman {len(parts)} replikaya bölündü, "
+                f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+    if request.lean:
+        response = {
+            "indices": [index for index, _ in ranked],
+            "scores": [score for _, score in ranked],
+            "total_documents": total,
+        }
+        if request.document_ids is not None:
+            response["document_ids"] = [request.document_ids[index] for index, _ in ranked]
+    else:
+        ranked_documents = []
+        for index, score in ranked:
+            entry = {"index": index, "score": score}
+            if request.documents:
+                entry["document"] = request.documents[index]
+            if request.document_ids is not None:
+                entry["document_id"] = request.document_ids[index]
+            ranked_documents.append(entry)
+        response = {
+            "query": request.query,
+            "ranked_documents": ranked_documents,
+            "total_documents": total,
+            "shards": [{"replica": replica.address, "documents": len(part)} for part, replica in zip(parts, chosen)],
+        }
+    if unscored:
+        response["unscored_indices"] = sorted(unscored)
+    return response
+
+
+async def poll_replicas():
+    """Replikaların sağlık / yük bilgisini periyodik güncelle"""
+    while True:
+        await asyncio.gather(*(replica.refresh() for replica in replicas))
+        await asyncio.sleep(HEALTH_INTERVAL_S)
+
+
+@app.on_event("startup")
+async def start_polling():
+    global health_task
+    await asyncio.gather(*(replica.refresh() for replica in replicas))
+    logger.info(f"🔀 Router: {len(replicas)} replika ({sum(r.ready for r in replicas)} hazır)")
+    health_task = asyncio.create_task(poll_replicas())
+
+
+@app.on_event("shutdown")
+async def stop_polling():
+    if health_task is not None:
+        health_task.cancel()
+    await asyncio.gather(*(replica.client.aclose() for replica in replicas))
+
+
+@app.post("/rerank")
+async def rerank(request: RouterRequest, http_request: Request):
+    """reranker_server /rerank ile aynı istek/yanıt; dokümanlar replikalara bölünür"""
+    return encode_response(await route(request), wants_msgpack(http_request))
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    ready = sum(1 for r in replicas if r.ready)
+    if ready == 0:
+        return JSONResponse(status_code=503, content={"status": "no_ready_replica"}, headers={"Retry-After": "5"})
+    return {"status": "ready", "ready_replicas": ready}
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "healthy" if any(r.ready for r in replicas) else "degraded",
+        "replicas": [replica.stats() for replica in replicas],
+        "min_shard": MIN_SHARD,
+        "routed_requests": routed_requests,
+        "routed_shards": routed_shards,
+        "retried_shards": retried_shards,
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
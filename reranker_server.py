@@ -4,74 +4,1100 @@
 FastAPI ile Qwen/Qwen3-Reranker-4B modelini çalıştıran server
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Tuple, Callable, NamedTuple, Optional, Dict, Sequence, Union
+from dataclasses import dataclass
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
 import torch
 import torch.nn.functional as F
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoModelForSequenceClassification, AutoTokenizer
 import logging
 
+from lib.rag.rerank_tokenization import (
+    DEFAULT_MAX_LENGTH,
+    DEFAULT_TOKEN_BUDGET,
+    Document,
+    PaddingStats,
+    encode_document,
+    tokenize_in_buckets,
+)
+from lib.rag.rerank_weights import (
+    create_snapshot,
+    load_snapshot,
+    read_snapshot_meta,
+    save_snapshot,
+    snapshot_dir_for,
+    snapshot_exists,
+)
+from lib.rag.rerank_precision import apply_precision, load_dtype
+from lib.rag.rerank_prefix import DEFAULT_INSTRUCTION, PrefixCacheScorer
+from lib.rag.rerank_cascade import bm25_scores, bm25_scores_terms, select_survivors
+from lib.rag.rerank_token_store import TokenStore, tokenizer_fingerprint
+from lib.rag.rerank_backend import BACKENDS, build_backend
+from lib.rag import rerank_metrics as metrics
+from lib.rag.rerank_wire import WireRoute, encode_response, wants_msgpack
+from lib.rag.traffic_capture import capture_from_env
+from lib.rag.cpu_placement import placement_from_env, plan_placement, read_topology
+
 # Logging ayarla
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Qwen3 Reranker Server", version="1.0")
+# Route'lar msgpack gövdeli istekleri de kabul eder (Content-Type: application/msgpack)
+app.router.route_class = WireRoute
 
 # Global model ve tokenizer (sunucu başlangıcında yüklenir)
+MODEL_NAME = os.environ.get("RERANKER_MODEL", "Qwen/Qwen3-Reranker-4B")
+# Hassasiyet modu: fp32 | bf16 | int8 (Linear katmanlarda dinamik quantization)
+# Seçim için: python lib/rag/rerank_precision.py (fp32'ye göre sıralama uyumu + hız)
+PRECISION = os.environ.get("RERANKER_DTYPE", "fp32")
+# Skorlama modu:
+# classifier: AutoModelForSequenceClassification, her çift ayrı encode edilir
+# prefix_cache: Qwen3-Reranker'ın causal-LM yes/no formülasyonu; talimat + sorgu öneki
+#               istek başına bir kez encode edilir, KV cache'i tüm dokümanlara paylaştırılır
+SCORING = os.environ.get("RERANKER_SCORING", "classifier")
+INSTRUCTION = os.environ.get("RERANKER_INSTRUCTION", DEFAULT_INSTRUCTION)
+if SCORING not in ("classifier", "prefix_cache"):
+    raise ValueError(f"Geçersiz RERANKER_SCORING: {SCORING} (classifier | prefix_cache)")
+MODEL_CLASS = AutoModelForCausalLM if SCORING == "prefix_cache" else AutoModelForSequenceClassification
+# Inference backend'i (classifier modu): eager | compile | onnx
+# compile/onnx artifact'ları ARTIFACT_ROOT altında model revizyonuna göre cache'lenir
+BACKEND = os.environ.get("RERANKER_BACKEND", "eager")
+ARTIFACT_ROOT = os.environ.get("RERANKER_ARTIFACT_ROOT", "reranker_artifacts")
+if BACKEND not in BACKENDS:
+    raise ValueError(f"Geçersiz RERANKER_BACKEND: {BACKEND} ({' | '.join(BACKENDS)})")
+if BACKEND != "eager" and SCORING != "classifier":
+    raise ValueError("RERANKER_BACKEND=compile/onnx sadece RERANKER_SCORING=classifier ile kullanılabilir")
 model = None
 tokenizer = None
 device = None
+backend = None  # Classifier forward pass'i (eager / compile / onnx)
+token_store = None  # documents.id → token id'leri (RERANKER_TOKEN_STORE ayarlıysa)
+prefix_scorer = None  # Sadece SCORING=prefix_cache iken
+weights_source = None  # Ağırlıkların yüklendiği snapshot dizini (HF'den yüklendiyse None)
+cpu_placement = None  # Bu worker'ın CPU yerleşimi (RERANKER_CPUS ayarlıysa)
+
+# Yükleme durumu: loading → warmup → ready (ya da failed)
+# Model arka planda yüklenir; sunucu bu sırada /health/live ve /health/ready'ye cevap verir
+PROCESS_STARTED = time.time()
+load_state = "loading"
+load_error: Optional[str] = None
+time_to_ready: Optional[float] = None
+load_task: Optional[asyncio.Task] = None
+
+# Micro-batching ayarları (ortam değişkenleri ile değiştirilebilir)
+# MAX_BATCH_SIZE: Tek forward pass'te işlenecek maksimum (query, doküman) çifti
+# MAX_WAIT_MS: İlk çift geldikten sonra diğer isteklerin çiftleri için beklenecek süre
+MAX_BATCH_SIZE = int(os.environ.get("RERANKER_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("RERANKER_MAX_WAIT_MS", "10"))
+# MAX_QUEUE_PAIRS: Kuyrukta bekleyebilecek maksimum çift; dolarsa yeni istekler 503 alır,
+# tek başına bu sınırdan fazla çift içeren istek hiç kabul edilemeyeceği için 413 alır
+MAX_QUEUE_PAIRS = int(os.environ.get("RERANKER_MAX_QUEUE_PAIRS", "512"))
+# Tokenization: çiftler uzunluğa göre bucket'lanır, her forward pass pad'ler dahil
+# en fazla TOKEN_BUDGET token işler ve sadece kendi en uzun çiftine kadar pad'lenir
+MAX_LENGTH = int(os.environ.get("RERANKER_MAX_LENGTH", str(DEFAULT_MAX_LENGTH)))
+TOKEN_BUDGET = int(os.environ.get("RERANKER_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
+
+# Skor cache ayarları
+# CACHE_MAX_MB: Cache'in yaklaşık bellek sınırı (0 = cache kapalı)
+# CACHE_TTL_S: Bir skorun geçerli kalacağı süre (saniye)
+# CACHE_PATH: Doluysa cache kapanışta bu dosyaya yazılır, açılışta geri okunur
+CACHE_MAX_MB = float(os.environ.get("RERANKER_CACHE_MAX_MB", "64"))
+CACHE_TTL_S = float(os.environ.get("RERANKER_CACHE_TTL_S", "3600"))
+CACHE_PATH = os.environ.get("RERANKER_CACHE_PATH", "")
+
+# Pre-fork ayarları
+# WORKERS > 1: Model bir kez lokal snapshot'a çevrilir, N worker process ağırlıkları
+# aynı dosyadan mmap ile paylaşır (toplam RSS ~ tek model)
+# SNAPSHOT_PATH: Doluysa model HF yerine bu snapshot'tan mmap ile yüklenir
+WORKERS = int(os.environ.get("RERANKER_WORKERS", "1"))
+SNAPSHOT_ROOT = os.environ.get("RERANKER_SNAPSHOT_ROOT", "reranker_snapshots")
+SNAPSHOT_PATH = os.environ.get("RERANKER_SNAPSHOT", "")
+# SNAPSHOT_AUTO: Tek worker'da da model ilk açılışta SNAPSHOT_ROOT altına snapshot olarak
+# yazılır; sonraki açılışlar checkpoint shard'ları yerine snapshot'ı mmap ile açar
+SNAPSHOT_AUTO = os.environ.get("RERANKER_SNAPSHOT_AUTO", "1") == "1"
+# CPU yerleşimi (lib/rag/cpu_placement.py): RERANKER_CPUS ayarlıysa ("auto", "node1",
+# "0-15") her worker NUMA topolojisine göre ayrı bir çekirdek kümesine sabitlenir ve
+# torch thread sayısı kümedeki çekirdek sayısına eşitlenir. RERANKER_CPU_RESERVE
+# kümenin başından boş bırakılacak çekirdek sayısı, RERANKER_SMT=1 hyperthread'leri de kullanır
+CPUS = os.environ.get("RERANKER_CPUS", "")
+# WARMUP: Hazır işaretlenmeden önce temsili şekillerle (kısa/uzun çift × tek/tam batch)
+# forward pass'ler çalıştırılır; ilk gerçek istek ilk çağrı maliyetini ödemez
+WARMUP = os.environ.get("RERANKER_WARMUP", "1") == "1"
+
+# Token store: documents.id ile saklanan token id'leri (boş = kapalı)
+# Doluysa /rerank dokümanları "document_ids" ile alabilir
+TOKEN_STORE_PATH = os.environ.get("RERANKER_TOKEN_STORE", "")
+
+# Unix domain socket: Doluysa sunucu TCP'ye ek olarak bu socket'i de dinler
+# (aynı makinedeki Next.js process'i TCP yükü olmadan bağlanır)
+UDS_PATH = os.environ.get("RERANKER_UDS", "")
+# PORT: TCP portu (aynı makinede birden fazla replika için, bkz. rerank_router.py)
+PORT = int(os.environ.get("RERANKER_PORT", "8000"))
+
+# Süresi ve durum kodu /metrics'e yazılan endpoint'ler
+METERED_ENDPOINTS = ("/rerank", "/rerank/batch")
+
+# Trafik kaydı: RERANKER_CAPTURE_PATH ayarlıysa METERED_ENDPOINTS istekleri JSONL'e
+# yazılır (boyutlar + süreler; RERANKER_CAPTURE_PAYLOADS=1 ise metinler de).
+# Yeniden oynatmak için: python lib/rag/traffic_replay.py <kayıt.jsonl>
+traffic_capture = capture_from_env("RERANKER")
+
+# Cascade ayarları
+# CASCADE: Açıksa adaylar önce BM25 ile skorlanır, sadece en iyi CASCADE_TOP_N tanesi
+# cross-encoder'a gider (istek bazında "cascade" alanıyla ezilebilir)
+CASCADE = os.environ.get("RERANKER_CASCADE", "0") == "1"
+CASCADE_TOP_N = int(os.environ.get("RERANKER_CASCADE_TOP_N", "20"))
 
 class RerankerRequest(BaseModel):
     """Reranking isteği"""
     query: str
-    documents: List[str]
+    documents: List[str] = []  # document_ids verilip token store'da hepsi varsa boş olabilir
+    document_ids: Optional[List[int]] = None  # public.documents.id (token store anahtarı)
     top_k: int = 10
+    lean: bool = False  # True: sadece indeks + skor döner (doküman metni geri gönderilmez)
+    deadline_ms: Optional[float] = None  # İstemcinin bu istek için bekleyebileceği süre
+    partial: bool = False  # True: deadline'da bitmeyen dokümanlar unscored_indices'te döner
+    cascade: Optional[bool] = None  # None: RERANKER_CASCADE varsayılanı
+    cascade_top_n: Optional[int] = None  # Cross-encoder'a geçecek aday sayısı (en az top_k)
 
 class RerankerResponse(BaseModel):
     """Reranking yanıtı"""
     query: str
     ranked_documents: List[dict]  # [{"index": 0, "document": "...", "score": 0.95}, ...]
     total_documents: int
+    padding: Optional[dict] = None  # Dinamik padding istatistiği (kazanılan pad token'ları)
+    cache: Optional[dict] = None  # {"hits": 3, "coalesced": 1, "computed": 6}
+    stages: Optional[List[dict]] = None  # Aşama başına aday sayısı ve süre (cascade)
+    unscored_indices: Optional[List[int]] = None  # partial: deadline'a yetişmeyen dokümanlar
 
-@app.on_event("startup")
-async def load_model():
-    """Sunucu başlatıldığında model yükle"""
-    global model, tokenizer, device
+class LeanRerankerResponse(BaseModel):
+    """Yalın reranking yanıtı: sadece sıralı indeksler ve skorlar (paralel listeler)"""
+    indices: List[int]
+    scores: List[float]
+    document_ids: Optional[List[int]] = None  # İstek document_ids ile geldiyse
+    total_documents: int
+    unscored_indices: Optional[List[int]] = None  # partial: deadline'a yetişmeyen dokümanlar
+
+class BatchRerankerRequest(BaseModel):
+    """Çoklu sorgu reranking isteği"""
+    requests: List[RerankerRequest]
+
+class BatchRerankerResponse(BaseModel):
+    """Çoklu sorgu reranking yanıtı (istekteki grup sırasıyla)"""
+    results: List[Union[RerankerResponse, LeanRerankerResponse]]
+    total_groups: int
+    total_pairs: int
+    elapsed_ms: float
+
+class DocumentTokensRequest(BaseModel):
+    """Token store'a eklenecek chunk'lar: [{"id": 42, "text": "..."}, ...]"""
+    documents: List[dict]
+
+class ScoredPair(NamedTuple):
+    """Tek bir çiftin skoru ve forward pass'teki token maliyeti"""
+    score: float
+    tokens: int  # Çiftin gerçek token sayısı (cache'ten gelirse 0)
+    padded_tokens: int  # Girdiği batch'in pad'li uzunluğu (cache'ten gelirse 0)
+    fallback: bool = False  # Batch hatası sonucu verilen dummy skor (cache'lenmez)
+
+
+class ScoreCache:
+    """
+    (model, max_length, query, doküman) hash'ine göre skor cache'i
+
+    LRU sırası OrderedDict ile tutulur; süresi dolan kayıtlar okunurken, bellek
+    sınırını aşan en eski kayıtlar yazılırken atılır. Bellek sınırı kayıt başına
+    yaklaşık ENTRY_BYTES üzerinden kayıt sayısına çevrilir.
+    """
+
+    # 32 byte'lık digest anahtarı + (skor, bitiş zamanı) tuple'ı + dict slot'u
+    ENTRY_BYTES = 256
+
+    def __init__(self, max_mb: float, ttl_s: float, path: str = ""):
+        self.max_entries = int(max_mb * 1024 * 1024) // self.ENTRY_BYTES
+        self.ttl_s = ttl_s
+        self.path = path
+        self._entries: "OrderedDict[bytes, Tuple[float, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(model_name: str, max_length: int, query: str, document: str) -> bytes:
+        digest = hashlib.sha256()
+        for part in (model_name, str(max_length), query, document):
+            encoded = part.encode("utf-8")
+            # Uzunluk öneki: ("ab", "c") ile ("a", "bc") aynı hash'i vermesin
+            digest.update(len(encoded).to_bytes(8, "little"))
+            digest.update(encoded)
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[float]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        score, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return score
+
+    def put(self, key: bytes, score: float, expires_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        self._entries[key] = (score, expires_at if expires_at is not None else time.time() + self.ttl_s)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def load(self):
+        """Diskteki cache dosyasını (varsa) süresi dolmamış kayıtlarla yükle"""
+        if not self.enabled or not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            # Dosya LRU sırasıyla (eskiden yeniye) yazılır
+            for key_hex, score, expires_at in data.get("entries", []):
+                if expires_at > now:
+                    self.put(bytes.fromhex(key_hex), score, expires_at)
+            logger.info(f"💾 Skor cache yüklendi: {len(self._entries)} kayıt ({self.path})")
+        except Exception as e:
+            logger.warning(f"⚠️ Skor cache okunamadı, boş başlanıyor: {e}")
+
+    def save(self):
+        """Süresi dolmamış kayıtları diske yaz (atomik: önce geçici dosya)"""
+        if not self.enabled or not self.path:
+            return
+        now = time.time()
+        entries = [
+            [key.hex(), score, expires_at]
+            for key, (score, expires_at) in self._entries.items()
+            if expires_at > now
+        ]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(tmp_path, self.path)
+            logger.info(f"💾 Skor cache kaydedildi: {len(entries)} kayıt ({self.path})")
+        except Exception as e:
+            logger.warning(f"⚠️ Skor cache kaydedilemedi: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "persistent": bool(self.path),
+        }
+
+
+@dataclass
+class _PendingPair:
+    """Kuyrukta bekleyen tek bir (query, doküman) çifti ve sonucunu bekleyen future"""
+    query: str
+    document: str
+    future: asyncio.Future
+    enqueued_at: float  # loop.time(): kuyrukta bekleme süresi metriği için
+
+
+class QueueFullError(Exception):
+    """Inference kuyruğu dolu - istek kabul edilmedi"""
+
+
+class RequestTooLargeError(Exception):
+    """İstek kuyruğun tamamından fazla çift içeriyor - tekrar denense de kabul edilemez"""
+
+
+class DeadlineExceededError(Exception):
+    """İstek deadline'ı içinde skorlanamaz (tahmini bekleme süresi ya da süre doldu)"""
+
+    def __init__(self, message: str, estimated_wait_s: Optional[float] = None):
+        super().__init__(message)
+        self.estimated_wait_s = estimated_wait_s
+
+
+class DocumentsNotFoundError(Exception):
+    """document_ids'teki bazı id'ler token store'da yok - istemci metinle tekrar göndermeli"""
+
+    def __init__(self, missing_ids: List[int]):
+        super().__init__(f"Token store'da olmayan doküman id'leri: {missing_ids}")
+        self.missing_ids = missing_ids
+
+
+def _too_large_detail(pairs: int, max_queue_pairs: int) -> str:
+    return (f"İstek {pairs} çift içeriyor, sınır {max_queue_pairs} çift (RERANKER_MAX_QUEUE_PAIRS); "
+            f"dokümanları daha küçük isteklere bölün")
+
+
+class MicroBatchScheduler:
+    """
+    Eşzamanlı /rerank isteklerinin çiftlerini ortak batch'lerde toplar
+
+    Her istek çiftlerini kuyruğa atar ve kendi future'larını bekler. Arka plandaki
+    döngü ilk çift geldiğinde en fazla max_wait_ms kadar bekleyip kuyruktan
+    max_batch_size'a kadar çift toplar, skorlamayı tek thread'lik inference
+    executor'ında çalıştırır ve her skoru ait olduğu isteğin future'ına geri yazar.
+    Event loop inference sırasında serbest kalır (/health cevap vermeye devam eder).
+
+    Kuyruk max_queue_pairs ile sınırlıdır; o an sığmayan istek QueueFullError,
+    boş kuyruğa bile sığmayan istek RequestTooLargeError alır.
+    Batch'lerin throughput'u (EWMA) kuyrukta bekleme süresini tahmin etmek için tutulur.
+    """
+
+    # Throughput EWMA'sında son batch'in ağırlığı
+    THROUGHPUT_ALPHA = 0.2
+
+    def __init__(self, score_fn: Callable[[List[Tuple[str, str]]], List[ScoredPair]],
+                 max_batch_size: int, max_wait_ms: float, max_queue_pairs: int):
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue_pairs = max(1, max_queue_pairs)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self._executor = None
+        self.in_flight = 0  # Şu an executor'da hesaplanan çift sayısı
+        self.rejected = 0  # Kuyruk dolu olduğu için reddedilen istek sayısı
+        self.pairs_per_second: Optional[float] = None  # İlk batch'e kadar bilinmiyor
+
+    def start(self):
+        if self._task is None:
+            # Tek worker: model aynı anda tek batch çalıştırır, torch kendi thread'lerini kullanır
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker-inference")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def busy(self) -> bool:
+        return self.in_flight > 0
+
+    def estimate_wait_s(self, pairs: int) -> Optional[float]:
+        """Kuyruğa şimdi eklenen `pairs` çiftin hepsinin skorlanması için tahmini süre"""
+        if not self.pairs_per_second:
+            return None
+        return (self.queue_size + self.in_flight + pairs) / self.pairs_per_second
+
+    def enqueue(self, pairs: List[Tuple[str, Document]]) -> List[asyncio.Future]:
+        """
+        Çiftleri kuyruğa ekle ve her biri için future döndür
+
+        İptal edilen future'ın çifti batch'e alınırken atlanır (hesaplanmaz).
+        """
+        if len(pairs) > self.max_queue_pairs:
+            self.rejected += 1
+            raise RequestTooLargeError(_too_large_detail(len(pairs), self.max_queue_pairs))
+        if self.queue_size + len(pairs) > self.max_queue_pairs:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Kuyruk dolu ({self.queue_size}/{self.max_queue_pairs} çift bekliyor)"
+            )
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for query, document in pairs:
+            future = loop.create_future()
+            self._queue.put_nowait(_PendingPair(query, document, future, loop.time()))
+            futures.append(future)
+        # Gauge'lar durum değiştiği yerde güncellenir: multiprocess modunda her worker
+        # kendi değerini yazar, /metrics'i hangi worker cevaplarsa cevaplasın toplam doğru olur
+        metrics.QUEUE_PAIRS.set(self.queue_size)
+        return futures
+
+    async def submit(self, pairs: List[Tuple[str, Document]]) -> List[ScoredPair]:
+        """Çiftleri kuyruğa ekle ve skorlarını aynı sırayla döndür"""
+        return list(await asyncio.gather(*self.enqueue(pairs)))
+
+    async def _collect_batch(self) -> List[_PendingPair]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            # Kuyrukta hazır bekleyenleri beklemeden al
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            metrics.QUEUE_PAIRS.set(self.queue_size)
+            # İptal edilmiş isteklerin çiftlerini hesaplama
+            batch = [p for p in batch if not p.future.done()]
+            if not batch:
+                continue
+
+            loop = asyncio.get_running_loop()
+            picked_at = loop.time()
+            for p in batch:
+                metrics.STAGE_SECONDS.labels("queue_wait").observe(picked_at - p.enqueued_at)
+            metrics.BATCH_PAIRS.observe(len(batch))
+
+            self.in_flight = len(batch)
+            metrics.IN_FLIGHT_PAIRS.set(self.in_flight)
+            try:
+                scores = await loop.run_in_executor(
+                    self._executor, self.score_fn, [(p.query, p.document) for p in batch]
+                )
+            except Exception as e:
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                continue
+            finally:
+                self.in_flight = 0
+                metrics.IN_FLIGHT_PAIRS.set(0)
+            elapsed = loop.time() - picked_at
+            if elapsed > 0:
+                throughput = len(batch) / elapsed
+                metrics.BATCH_PAIRS_PER_SECOND.observe(throughput)
+                if self.pairs_per_second is None:
+                    self.pairs_per_second = throughput
+                else:
+                    self.pairs_per_second += self.THROUGHPUT_ALPHA * (throughput - self.pairs_per_second)
+
+            for p, scored in zip(batch, scores):
+                if not p.future.done():
+                    p.future.set_result(scored)
+
+
+def score_pairs(pairs: List[Tuple[str, str]]) -> List[ScoredPair]:
+    """Toplanan çiftleri seçili skorlama moduyla skorla (inference thread'inde çalışır)"""
+    if prefix_scorer is not None:
+        return _score_pairs_prefix(pairs)
+    return _score_pairs_classifier(pairs)
+
+
+def _score_pairs_prefix(pairs: List[Tuple[str, str]]) -> List[ScoredPair]:
+    """Çiftleri sorguya göre grupla; her sorgunun öneki bir kez encode edilir"""
+    results: List[ScoredPair] = [None] * len(pairs)
+    groups: Dict[str, List[int]] = {}
+    for idx, (query, _) in enumerate(pairs):
+        groups.setdefault(query, []).append(idx)
+
+    logger.info(f"   📦 {len(pairs)} pair → {len(groups)} sorgu öneki (prefix KV cache)")
+    for query, indices in groups.items():
+        try:
+            with metrics.STAGE_SECONDS.labels("forward").time():
+                scored = prefix_scorer.score_query(query, [pairs[i][1] for i in indices])
+            for idx, (score, length, padded_length) in zip(indices, scored):
+                results[idx] = ScoredPair(score, length, padded_length)
+        except Exception as e:
+            logger.error(f"   ❌ Prefix skorlama hatası: {str(e)}")
+            # Fallback: bu sorgu için dummy scores
+            for idx in indices:
+                results[idx] = ScoredPair(0.5, 0, 0, fallback=True)
+    return results
+
+
+def _score_pairs_classifier(pairs: List[Tuple[str, str]]) -> List[ScoredPair]:
+    """Toplanan çiftleri uzunluk bucket'larına ayırıp her bucket'ı bir forward pass ile skorla"""
+    results: List[ScoredPair] = [None] * len(pairs)
+
+    with torch.no_grad():
+        with metrics.STAGE_SECONDS.labels("tokenize").time():
+            batches, stats = tokenize_in_buckets(tokenizer, pairs, MAX_LENGTH, TOKEN_BUDGET)
+        logger.info(
+            f"   📦 {len(pairs)} pair → {len(batches)} batch "
+            f"(pad={stats.pad_tokens}, kazanılan pad={stats.saved_pad_tokens})"
+        )
+
+        for batch in batches:
+            inputs = {name: tensor.to(device) for name, tensor in batch.inputs.items()}
+            batch_tokens = batch.padded_length * len(batch.indices)
+            metrics.PADDING_RATIO.observe((batch_tokens - sum(batch.lengths)) / batch_tokens)
+
+            # Model çalıştır
+            try:
+                with metrics.STAGE_SECONDS.labels("forward").time():
+                    logits = backend(inputs)
+                with metrics.STAGE_SECONDS.labels("softmax").time():
+                    probs = F.softmax(logits.float(), dim=-1)  # Softmax (bf16 logits fp32'ye çevrilir)
+                    batch_scores = probs[:, 1].cpu().tolist()  # Relevant class'ın probability'si
+            except Exception as e:
+                logger.error(f"   ❌ Batch hatası: {str(e)}")
+                # Fallback: bu batch için dummy scores
+                batch_scores = None
+
+            for pos, (idx, length) in enumerate(zip(batch.indices, batch.lengths)):
+                if batch_scores is None:
+                    results[idx] = ScoredPair(0.5, length, batch.padded_length, fallback=True)
+                else:
+                    results[idx] = ScoredPair(batch_scores[pos], length, batch.padded_length)
+
+    return results
+
+
+scheduler = MicroBatchScheduler(score_pairs, MAX_BATCH_SIZE, MAX_WAIT_MS, MAX_QUEUE_PAIRS)
+score_cache = ScoreCache(CACHE_MAX_MB, CACHE_TTL_S, CACHE_PATH)
+
+# Şu an hesaplanmakta olan çiftler: aynı anahtarı isteyenler aynı future'ı bekler
+_inflight: Dict[bytes, asyncio.Future] = {}
+# Deadline'a yetişemeyeceği için 504 alan istek sayısı
+deadline_rejected = 0
+
+# Başka bir isteğin hesaplamasını bekleyen (coalesced) istek sayısı - sahibi
+# deadline yüzünden vazgeçse bile bu çiftler iptal edilmez
+_coalesced_waiters: Dict[bytes, int] = {}
+
+
+def _settle_owned(key: bytes, owned: asyncio.Future, scheduled: asyncio.Future):
+    """Scheduler sonucunu cache'e ve çifti bekleyen herkesin future'ına yaz"""
+    _inflight.pop(key, None)
+    if owned.done():
+        return
+    if scheduled.cancelled():
+        owned.cancel()
+        return
+    error = scheduled.exception()
+    if error is not None:
+        owned.set_exception(RuntimeError(f"Paylaşılan hesaplama başarısız: {error!r}"))
+        owned.exception()
+        return
+    scored = scheduled.result()
+    if not scored.fallback:
+        score_cache.put(key, scored.score)
+    owned.set_result(scored)
+
+
+def _document_key(document: Document) -> str:
+    """Cache anahtarında dokümanın yeri: metnin kendisi ya da token id'lerinin hash'i"""
+    if isinstance(document, str):
+        return document
+    return "\x00tokens:" + hashlib.sha256(np.asarray(document, dtype=np.int32).tobytes()).hexdigest()
+
+
+async def score_pairs_cached(pairs: List[Tuple[str, Document]],
+                             deadline: Optional[float] = None) -> Tuple[List[Optional[ScoredPair]], dict]:
+    """
+    Çiftleri önce cache'ten, sonra devam eden hesaplamalardan, en son scheduler'dan skorla
+
+    Aynı anda aynı (query, doküman) çiftini isteyen istekler tek hesaplamayı paylaşır.
+
+    deadline (loop.time()) verilirse o ana kadar bitmeyen çiftler None döner; bu
+    isteğin kuyrukta bekleyen ve başka kimsenin beklemediği çiftleri iptal edilir.
+
+    Returns:
+        (skorlar, {"hits": ..., "coalesced": ..., "computed": ...})
+    """
+    loop = asyncio.get_running_loop()
+    results: List[Optional[ScoredPair]] = [None] * len(pairs)
+    waiting: List[Tuple[int, bytes, asyncio.Future, bool]] = []
+    owned: Dict[bytes, asyncio.Future] = {}
+    new_pairs: List[Tuple[str, Document]] = []
+    new_keys: List[bytes] = []
+    counts = {"hits": 0, "coalesced": 0, "computed": 0}
+
+    for i, (query, document) in enumerate(pairs):
+        # Hassasiyet modu skorları değiştirir - anahtarın parçası
+        key = ScoreCache.make_key(f"{MODEL_NAME}@{PRECISION}/{SCORING}", MAX_LENGTH, query, _document_key(document))
+        cached = score_cache.get(key)
+        if cached is not None:
+            results[i] = ScoredPair(cached, 0, 0)
+            counts["hits"] += 1
+            continue
+
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = loop.create_future()
+            _inflight[key] = future
+            owned[key] = future
+            new_pairs.append((query, document))
+            new_keys.append(key)
+        else:
+            score_cache.coalesced += 1
+            counts["coalesced"] += 1
+            _coalesced_waiters[key] = _coalesced_waiters.get(key, 0) + 1
+        waiting.append((i, key, future, is_owner))
+
+    scheduled: Dict[bytes, asyncio.Future] = {}
+    if new_pairs:
+        try:
+            for key, scheduled_future in zip(new_keys, scheduler.enqueue(new_pairs)):
+                scheduled[key] = scheduled_future
+                scheduled_future.add_done_callback(functools.partial(_settle_owned, key, owned[key]))
+        except BaseException as e:
+            # Bu hesaplamayı bekleyen diğer isteklere de hatayı ilet
+            for key, future in owned.items():
+                _inflight.pop(key, None)
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Paylaşılan hesaplama başarısız: {e!r}"))
+                    # Bekleyen yoksa "exception was never retrieved" uyarısını bastır
+                    future.exception()
+            raise
+        counts["computed"] = len(new_pairs)
+
+    try:
+        if waiting:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            await asyncio.wait({future for _, _, future, _ in waiting}, timeout=timeout)
+    finally:
+        # Süre doldu ya da istek iptal edildi: kimsenin beklemediği çiftleri hesaplatma
+        for key, scheduled_future in scheduled.items():
+            if not scheduled_future.done() and not _coalesced_waiters.get(key):
+                scheduled_future.cancel()
+        for _, key, _, is_owner in waiting:
+            if not is_owner and key in _coalesced_waiters:
+                _coalesced_waiters[key] -= 1
+                if _coalesced_waiters[key] <= 0:
+                    del _coalesced_waiters[key]
+
+    for source, count in counts.items():
+        metrics.PAIRS.labels({"hits": "cache"}.get(source, source)).inc(count)
+
+    for i, _, future, is_owner in waiting:
+        if not future.done() or future.cancelled():
+            continue  # Deadline'a yetişmedi
+        scored = future.result()
+        # Paylaşılan çiftin token maliyeti hesaplamayı başlatan isteğe yazılır
+        results[i] = scored if is_owner else ScoredPair(scored.score, 0, 0, scored.fallback)
+
+    return results, counts
+
+def _load_weights():
+    """
+    Model + tokenizer'ı yükle: snapshot varsa mmap'ten, yoksa HF'den
+
+    HF'den yüklenen model SNAPSHOT_AUTO açıksa (quantize edilmeden önce) snapshot'a
+    yazılır; bir sonraki açılış shard'ları okumak yerine snapshot'ı mmap'ler.
+
+    Returns:
+        (model, tokenizer, snapshot dizini ya da None)
+    """
+    auto_snapshot = ""
+    if not SNAPSHOT_PATH and SNAPSHOT_AUTO:
+        auto_snapshot = snapshot_dir_for(SNAPSHOT_ROOT, MODEL_NAME, load_dtype(PRECISION), MODEL_CLASS)
+    snapshot = SNAPSHOT_PATH or (auto_snapshot if auto_snapshot and snapshot_exists(auto_snapshot) else "")
+    
+    if snapshot:
+        # Ağırlıklar kopyalanmadan mmap'ten kullanılır
+        loaded_model, loaded_tokenizer = load_snapshot(snapshot, MODEL_CLASS)
+        logger.info(f"💾 Snapshot (mmap): {snapshot}")
+        return loaded_model, loaded_tokenizer, snapshot
+    
+    loaded_tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, trust_remote_code=True)
+    
+    # Padding token'ını ayarla - Qwen için kritik!
+    if loaded_tokenizer.pad_token is None:
+        loaded_tokenizer.pad_token = "<|endoftext|>"  # Qwen pad token'ı
     
-    logger.info("🤖 Qwen3-Reranker-4B model yükleniyor...")
+    loaded_model = MODEL_CLASS.from_pretrained(
+        MODEL_NAME, 
+        trust_remote_code=True,
+        torch_dtype=load_dtype(PRECISION),
+        pad_token_id=loaded_tokenizer.pad_token_id  # Kritik! Model'a pad_token_id'yi ver
+    )
+    loaded_model.eval()  # Evaluation mode
+    
+    if auto_snapshot:
+        started = time.perf_counter()
+        try:
+            save_snapshot(loaded_model, loaded_tokenizer, auto_snapshot, MODEL_NAME, load_dtype(PRECISION), MODEL_CLASS)
+            logger.info(f"💾 Snapshot yazıldı ({time.perf_counter() - started:.1f}s): {auto_snapshot} - sonraki açılış mmap ile")
+        except OSError as e:
+            # Disk dolu / yazma izni yok: sunucu yine de HF ağırlıklarıyla açılır
+            logger.warning(f"⚠️ Snapshot yazılamadı ({auto_snapshot}): {e}")
+    return loaded_model, loaded_tokenizer, None
+
+def _load_model_sync():
+    """Model, tokenizer ve backend'i yükle (event loop'u bloklamamak için ayrı thread'de çalışır)"""
+    global model, tokenizer, device, backend, prefix_scorer, token_store, weights_source, cpu_placement
+    
+    logger.info(f"🤖 {MODEL_NAME} model yükleniyor...")
+    load_started = time.perf_counter()
     
     # Device seç (GPU varsa kullan)
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     logger.info(f"📍 Device: {device}")
     
+    # Worker'lar CPU çekirdeklerini paylaşır - her biri kendi çekirdek kümesine sabitlenir
+    # (RERANKER_CPUS) ya da en azından kendi payı kadar thread kullanır
+    cpu_placement = placement_from_env("RERANKER", WORKERS)
+    if cpu_placement is None and WORKERS > 1:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // WORKERS))
+        logger.info(f"🧵 Worker pid={os.getpid()}: {torch.get_num_threads()} torch thread")
+    
     # Model ve tokenizer yükle
-    model_name = "Qwen/Qwen3-Reranker-4B"
+    loaded_model, tokenizer, weights_source = _load_weights()
+    if device.type != "cpu":
+        loaded_model = loaded_model.to(device)
+    # bf16 snapshot zaten bf16'dır; int8 quantization her açılışta (her worker'da) ayrı yapılır
+    model = apply_precision(loaded_model, PRECISION)
+    
+    logger.info(f"✅ Tokenizer yüklendi (pad_token={tokenizer.pad_token}, pad_token_id={tokenizer.pad_token_id})")
+    if SCORING == "prefix_cache":
+        prefix_scorer = PrefixCacheScorer(model, tokenizer, device, MAX_LENGTH, TOKEN_BUDGET, INSTRUCTION)
+    else:
+        revision = read_snapshot_meta(weights_source).get("revision") if weights_source else None
+        backend = build_backend(
+            BACKEND, model, MODEL_NAME, PRECISION, device, ARTIFACT_ROOT,
+            threads=torch.get_num_threads(), revision=revision
+        )
+    
+    metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - load_started)
+    logger.info(f"✅ Model başarıyla yüklendi (hassasiyet={PRECISION}, skorlama={SCORING}, {time.perf_counter() - load_started:.1f}s)")
+
+    if TOKEN_STORE_PATH:
+        token_store = TokenStore(TOKEN_STORE_PATH, tokenizer_fingerprint(tokenizer))
+        logger.info(f"🗃️ Token store: {TOKEN_STORE_PATH} ({len(token_store)} chunk)")
+
+def _warmup():
+    """
+    Temsili şekillerle ısınma: kısa/uzun (MAX_LENGTH) çift × tek çift/tam batch
+    
+    İlk forward'ların maliyeti (allocator, oneDNN/cuBLAS kernel seçimi, compile
+    derlemesi, ORT session hazırlığı) gerçek isteklere kalmaz. Skor cache'ine yazılmaz.
+    """
+    started = time.perf_counter()
+    for length in sorted({min(32, MAX_LENGTH), MAX_LENGTH}):
+        # Her kelime en az bir token: truncation çifti MAX_LENGTH'e indirir
+        document = " ".join(["belge"] * length)
+        for batch_size in sorted({1, MAX_BATCH_SIZE}):
+            score_pairs([("ısınma sorgusu", document)] * batch_size)
+    metrics.WARMUP_SECONDS.set(time.perf_counter() - started)
+    logger.info(f"🔥 Warmup tamamlandı ({time.perf_counter() - started:.1f}s)")
+
+async def load_model():
+    """Modeli yükle, ısıt ve scheduler'ı başlat; bitince sunucu hazır (ready) olur"""
+    global load_state, load_error, time_to_ready
+    loop = asyncio.get_running_loop()
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-        
-        # Padding token'ını ayarla - Qwen için kritik!
-        if tokenizer.pad_token is None:
-            tokenizer.pad_token = "<|endoftext|>"  # Qwen pad token'ı
-        
-        logger.info(f"✅ Tokenizer yüklendi (pad_token={tokenizer.pad_token}, pad_token_id={tokenizer.pad_token_id})")
-        
-        model = AutoModelForSequenceClassification.from_pretrained(
-            model_name, 
-            trust_remote_code=True,
-            torch_dtype=torch.float32,
-            pad_token_id=tokenizer.pad_token_id  # Kritik! Model'a pad_token_id'yi ver
-        ).to(device)
-        model.eval()  # Evaluation mode
-        
-        logger.info("✅ Model başarıyla yüklendi")
+        await loop.run_in_executor(None, _load_model_sync)
+        # compile/onnx'te derleme / ORT session hazırlığı her durumda ilk isteğe kalmasın
+        if WARMUP or BACKEND != "eager":
+            load_state = "warmup"
+            await loop.run_in_executor(None, _warmup)
     except Exception as e:
+        load_state = "failed"
+        load_error = str(e)
         logger.error(f"❌ Model yükleme hatası: {e}")
-        raise
+        return
+
+    score_cache.load()
+    scheduler.start()
+    logger.info(f"🧮 Micro-batch scheduler başladı (max_batch_size={MAX_BATCH_SIZE}, max_wait_ms={MAX_WAIT_MS})")
+    
+    time_to_ready = time.time() - PROCESS_STARTED
+    metrics.TIME_TO_READY_SECONDS.set(time_to_ready)
+    load_state = "ready"
+    logger.info(f"🟢 Sunucu hazır (başlangıçtan {time_to_ready:.1f}s)")
+
+@app.on_event("startup")
+async def start_loading():
+    """Model yüklemesini arka planda başlat: sunucu hemen dinlemeye başlar"""
+    global load_task
+    load_task = asyncio.create_task(load_model())
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    """Sunucu kapanırken scheduler döngüsünü durdur ve skor cache'ini diske yaz"""
+    await scheduler.stop()
+    # Yükleme bitmeden kapanırsa cache hiç okunmadı: diskteki cache boşuyla ezilmesin
+    if load_state == "ready":
+        score_cache.save()
+    metrics.mark_worker_dead()
+
+def _require_ready():
+    """Model hazır değilse isteği reddet (yüklenirken 503 + Retry-After)"""
+    if load_state == "ready":
+        return
+    if load_state == "failed":
+        raise HTTPException(status_code=500, detail=f"Model yüklenemedi: {load_error}")
+    raise HTTPException(status_code=503, detail=f"Model henüz hazır değil ({load_state})", headers={"Retry-After": "5"})
+
+def _validate_documents(request: RerankerRequest, label: str = ""):
+    """Metin / id alanlarının tutarlılığını kontrol et (HTTPException 400)"""
+    if not request.documents and not request.document_ids:
+        raise HTTPException(status_code=400, detail=f"Dokümantasyon boş{label}")
+    if request.document_ids is not None:
+        if token_store is None:
+            raise HTTPException(status_code=400, detail=f"document_ids için RERANKER_TOKEN_STORE ayarlı değil{label}")
+        if request.documents and len(request.documents) != len(request.document_ids):
+            raise HTTPException(status_code=400, detail=f"documents ve document_ids uzunlukları farklı{label}")
+
+
+def _store_documents(doc_ids: Sequence[int], texts: Sequence[str]) -> int:
+    """Store'da olmayan chunk'ları tokenize edip ekle (ilk görüşte doldurma)"""
+    new = [(doc_id, text) for doc_id, text in zip(doc_ids, texts) if doc_id not in token_store]
+    return token_store.put_many((doc_id, encode_document(tokenizer, text)) for doc_id, text in new)
+
+
+async def _resolve_documents(request: RerankerRequest) -> List[Document]:
+    """
+    İsteğin dokümanları: metinler ya da token store'dan token id'leri
+
+    Yeni chunk'ların tokenize edilip store'a yazılması (flock + append) executor'da
+    çalışır; event loop ve micro-batch scheduler beklemez.
+    """
+    if request.document_ids is None:
+        return request.documents
+    if request.documents:
+        stored = await asyncio.get_running_loop().run_in_executor(
+            None, _store_documents, request.document_ids, request.documents
+        )
+        if stored:
+            logger.info(f"   🗃️ Token store'a {stored} yeni chunk eklendi")
+        return request.documents
+    documents, missing = token_store.get_many(request.document_ids)
+    if missing:
+        raise DocumentsNotFoundError(missing)
+    return documents
+
+
+def _check_deadline(deadline: float, pairs: int, partial: bool):
+    """
+    Kuyruktaki iş ve ölçülen throughput ile deadline'a yetişilip yetişilemeyeceğini tahmin et
+
+    partial isteklerde en az ilk çiftin yetişmesi yeterli; diğerlerinde tüm çiftler.
+    """
+    remaining = deadline - asyncio.get_running_loop().time()
+    estimate = scheduler.estimate_wait_s(1 if partial else pairs)
+    if remaining <= 0 or (estimate is not None and estimate > remaining):
+        raise DeadlineExceededError(
+            f"Deadline'a yetişilemez (kalan {max(remaining, 0) * 1000:.0f}ms, "
+            f"tahmini bekleme {estimate * 1000 if estimate is not None else 0:.0f}ms)",
+            estimate,
+        )
+
+
+def _scored_pair_count(request: RerankerRequest) -> int:
+    """Grubun cross-encoder'a gidecek en fazla çift sayısı (cascade varsa survivor'lar)"""
+    documents = len(request.document_ids or request.documents)
+    use_cascade = CASCADE if request.cascade is None else request.cascade
+    if use_cascade:
+        return min(documents, max(request.cascade_top_n or CASCADE_TOP_N, request.top_k))
+    return documents
+
+
+async def _rerank_group(request: RerankerRequest) -> RerankerResponse:
+    """Tek bir (sorgu, dokümanlar) grubunu skorla ve top_k sonucu döndür"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + request.deadline_ms / 1000.0 if request.deadline_ms else None
+    documents = await _resolve_documents(request)
+    by_id = not request.documents
+    logger.info(
+        f"🔄 Reranking başladı: sorgu='{request.query[:50]}...', dokü={len(documents)}"
+        f"{' (token store)' if by_id else ''}"
+    )
+    
+    # Cascade: ucuz BM25 aşaması adayları eler, cross-encoder sadece kalanları skorlar
+    candidates = list(range(len(documents)))
+    stages = []
+    use_cascade = CASCADE if request.cascade is None else request.cascade
+    survivor_count = max(request.cascade_top_n or CASCADE_TOP_N, request.top_k)
+    if use_cascade and len(candidates) > survivor_count:
+        started = time.perf_counter()
+        if by_id:
+            # Metin yok: tokenizer token id'leri BM25 terimi olarak kullanılır
+            query_terms = tokenizer.encode(request.query, add_special_tokens=False)
+            first_scores = bm25_scores_terms(query_terms, documents)
+        else:
+            first_scores = bm25_scores(request.query, documents)
+        candidates = select_survivors(first_scores, survivor_count)
+        stages.append({
+            "stage": "bm25",
+            "candidates": len(documents),
+            "survivors": len(candidates),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+        logger.info(f"   🪜 BM25: {len(documents)} aday → {len(candidates)}")
+    
+    # Her dokümantı sorgu ile pair yap
+    pairs = [(request.query, documents[idx]) for idx in candidates]
+    
+    # Deadline'a yetişemeyecek istek kuyruğa hiç girmesin
+    if deadline is not None:
+        _check_deadline(deadline, len(pairs), request.partial)
+    
+    # Önce skor cache'i, sonra scheduler - eşzamanlı isteklerle ortak batch'lerde skorlanır
+    started = time.perf_counter()
+    scored_pairs, cache_counts = await score_pairs_cached(pairs, deadline)
+    unscored = [idx for idx, scored in zip(candidates, scored_pairs) if scored is None]
+    if unscored and (not request.partial or len(unscored) == len(pairs)):
+        raise DeadlineExceededError(f"Deadline doldu: {len(unscored)}/{len(pairs)} doküman skorlanamadı")
+    if unscored:
+        logger.warning(f"   ⏱️ Deadline doldu: {len(unscored)} doküman skorlanmadan döndü (partial)")
+    scores = [scored.score if scored is not None else None for scored in scored_pairs]
+    logger.info(f"   ✅ Scores hesaplandı: {scores[:3]}... (cache: {cache_counts})")
+    
+    # Bu isteğin hesaplattığı çiftlerin padding maliyeti (sabit max_length padding'e göre)
+    padding = PaddingStats()
+    for scored in scored_pairs:
+        if scored is not None and scored.padded_tokens:
+            padding.add_pair(scored.tokens, scored.padded_tokens, MAX_LENGTH)
+    stages.append({
+        "stage": "cross_encoder",
+        "candidates": len(pairs),
+        "computed": cache_counts["computed"],
+        "tokens": padding.padded_tokens,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+    
+    # Skor ile indeks pair yap (indeks her zaman orijinal doküman listesindeki pozisyon)
+    scored_docs = []
+    for idx, score in zip(candidates, scores):
+        if score is None:
+            continue
+        scored_doc = {"index": idx, "score": float(score)}
+        if request.documents:
+            scored_doc["document"] = request.documents[idx]
+        if request.document_ids is not None:
+            scored_doc["document_id"] = request.document_ids[idx]
+        scored_docs.append(scored_doc)
+    
+    with metrics.STAGE_SECONDS.labels("topk").time():
+        # Skor'a göre azalan sırada sırala
+        ranked = sorted(scored_docs, key=lambda x: x["score"], reverse=True)
+        
+        # Top K al
+        top_k = min(request.top_k, len(ranked))
+        ranked = ranked[:top_k]
+    
+    logger.info(f"✅ Reranking tamamlandı: top {top_k} seçildi")
+    if ranked:
+        logger.info(f"   En yüksek skor: {ranked[0]['score']:.4f}")
+    logger.info(f"   ✂️ Padding: {padding.saved_pad_tokens} pad token kazanıldı (FLOP azalması ~%{padding.as_dict()['flop_reduction'] * 100:.0f})")
+    
+    if request.lean:
+        return LeanRerankerResponse(
+            indices=[doc["index"] for doc in ranked],
+            scores=[doc["score"] for doc in ranked],
+            document_ids=[doc["document_id"] for doc in ranked] if request.document_ids is not None else None,
+            total_documents=len(documents),
+            unscored_indices=unscored or None
+        )
+    
+    return RerankerResponse(
+        query=request.query,
+        ranked_documents=ranked,
+        total_documents=len(documents),
+        padding=padding.as_dict(),
+        cache=cache_counts,
+        stages=stages,
+        unscored_indices=unscored or None
+    )
+
+def _serialize(response: BaseModel, http_request: Request) -> Response:
+    """Yanıtı Accept başlığına göre msgpack ya da JSON'a çevir (süresi serialize aşaması olarak ölçülür)"""
+    with metrics.STAGE_SECONDS.labels("serialize").time():
+        return encode_response(response.model_dump(exclude_none=True), wants_msgpack(http_request))
+
+def _request_shape(request: Union[RerankerRequest, BatchRerankerRequest]) -> dict:
+    """Trafik kaydı için isteğin payload'sız boyut bilgisi"""
+    if isinstance(request, BatchRerankerRequest):
+        return {"groups": [_request_shape(group) for group in request.requests]}
+    return {
+        "query_chars": len(request.query),
+        "documents": len(request.document_ids or request.documents),
+        "document_chars": [len(document) for document in request.documents],
+        "by_id": request.document_ids is not None,
+        "top_k": request.top_k,
+        "lean": request.lean,
+        "cascade": request.cascade,
+        "cascade_top_n": request.cascade_top_n,
+        "deadline_ms": request.deadline_ms,
+        "partial": request.partial,
+    }
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Rerank endpoint'lerinin toplam süresi ve sonuç durumu (+ açıksa trafik kaydı)"""
+    endpoint = request.url.path
+    if endpoint not in METERED_ENDPOINTS:
+        return await call_next(request)
+    capturing = traffic_capture is not None and traffic_capture.sampled()
+    started_at = time.time()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+    metrics.REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    if capturing:
+        # Endpoint çözümlenen gövdeyi request.state'e bırakır (doğrulama hatasında yok)
+        body = getattr(request.state, "capture", None)
+        traffic_capture.record(
+            endpoint, started_at, elapsed * 1000, response.status_code,
+            _request_shape(body) if body is not None else None,
+            body.model_dump(exclude_none=True) if body is not None and traffic_capture.payloads else None,
+        )
+    return response
+
+def _deadline_exceeded(error: DeadlineExceededError) -> HTTPException:
+    """Deadline reddi: kuyruk doluluğundan (503) ayrı tutulan 504"""
+    global deadline_rejected
+    deadline_rejected += 1
+    logger.warning(f"⏱️ İstek reddedildi: {error}")
+    headers = {}
+    if error.estimated_wait_s is not None:
+        headers["X-Estimated-Wait-Ms"] = str(int(error.estimated_wait_s * 1000))
+    return HTTPException(status_code=504, detail=str(error), headers=headers)
 
 @app.post("/rerank", response_model=RerankerResponse)
-async def rerank(request: RerankerRequest) -> RerankerResponse:
+async def rerank(request: RerankerRequest, http_request: Request) -> RerankerResponse:
     """
     Sorgu ve dokümanlara göre rerank yapıp en iyi sonuçları döndür
     
@@ -83,92 +1109,191 @@ async def rerank(request: RerankerRequest) -> RerankerResponse:
     Returns:
         RerankerResponse: Sıralanmış dokümantasyon
     """
-    if not model or not tokenizer:
-        raise HTTPException(status_code=500, detail="Model yüklenmedi")
+    http_request.state.capture = request
+    _require_ready()
     
-    if not request.documents:
-        raise HTTPException(status_code=400, detail="Dokümantasyon boş")
+    _validate_documents(request)
     
     try:
-        logger.info(f"🔄 Reranking başladı: sorgu='{request.query[:50]}...', dokü={len(request.documents)}")
-        
-        # Her dokümantı sorgu ile pair yap
-        pairs = [[request.query, doc] for doc in request.documents]
-        
-        # Tokenize et - batch processing optimize et
-        with torch.no_grad():
-            # Daha küçük batch'ler ile işle (CPU'da daha hızlı)
-            batch_size = 4
-            all_scores = []
-            
-            for i in range(0, len(pairs), batch_size):
-                batch_pairs = pairs[i:i+batch_size]
-                
-                inputs = tokenizer(
-                    batch_pairs,
-                    padding="max_length",  # Explicit padding
-                    truncation=True,
-                    return_tensors='pt',
-                    max_length=256  # CPU performansı için düşürdük (512'den)
-                ).to(device)
-                
-                logger.info(f"   � Batch {i//batch_size + 1}: {len(batch_pairs)} pair işleniyor...")
-                
-                # Model çalıştır
-                try:
-                    outputs = model(**inputs)
-                    probs = F.softmax(outputs.logits, dim=-1)  # Softmax
-                    batch_scores = probs[:, 1].cpu().tolist()  # Relevant class'ın probability'si
-                    all_scores.extend(batch_scores)
-                    
-                except Exception as e:
-                    logger.error(f"   ❌ Batch hatası: {str(e)}")
-                    # Fallback: bu batch için dummy scores
-                    all_scores.extend([0.5] * len(batch_pairs))
-            
-            scores = all_scores
-            logger.info(f"   ✅ Scores hesaplandı: {scores[:3]}...")
-        
-        # Skor ile indeks pair yap
-        scored_docs = [
-            {
-                "index": idx,
-                "document": doc,
-                "score": float(score)
-            }
-            for idx, (doc, score) in enumerate(zip(request.documents, scores))
-        ]
-        
-        # Skor'a göre azalan sırada sırala
-        ranked = sorted(scored_docs, key=lambda x: x["score"], reverse=True)
-        
-        # Top K al
-        top_k = min(request.top_k, len(ranked))
-        ranked = ranked[:top_k]
-        
-        logger.info(f"✅ Reranking tamamlandı: top {top_k} seçildi")
-        logger.info(f"   En yüksek skor: {ranked[0]['score']:.4f}")
-        
-        return RerankerResponse(
-            query=request.query,
-            ranked_documents=ranked,
-            total_documents=len(request.documents)
-        )
-        
+        return _serialize(await _rerank_group(request), http_request)
+    except RequestTooLargeError as e:
+        logger.warning(f"📏 İstek reddedildi: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(f"⏳ İstek reddedildi: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DocumentsNotFoundError as e:
+        logger.info(f"🗃️ {e}")
+        raise HTTPException(status_code=404, detail={"error": str(e), "missing_ids": e.missing_ids})
+    except DeadlineExceededError as e:
+        raise _deadline_exceeded(e)
     except Exception as e:
         logger.error(f"❌ Reranking hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Reranking hatası: {str(e)}")
 
+async def _gather_groups(groups: List[RerankerRequest]) -> List[RerankerResponse]:
+    """
+    Grupları paralel skorla; biri hata verirse diğerlerini iptal et
+
+    Yanıt zaten hata olacağı için kalan grupların kuyruktaki çiftleri hesaplanmaz
+    (iptal edilen grubun future'ları scheduler'da atlanır).
+    """
+    tasks = [asyncio.create_task(_rerank_group(group)) for group in groups]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        errors = [task.exception() for task in tasks
+                  if task.done() and not task.cancelled() and task.exception() is not None]
+        if errors:
+            raise errors[0]
+        return [task.result() for task in tasks]
+    finally:
+        # Hata ya da istemcinin bağlantıyı kesmesi: kalan grupları iptal et ve
+        # iptalin kuyruktaki future'lara yansımasını bekle
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+@app.post("/rerank/batch", response_model=BatchRerankerResponse)
+async def rerank_batch(request: BatchRerankerRequest, http_request: Request) -> BatchRerankerResponse:
+    """
+    Birden fazla (sorgu, dokümanlar) grubunu tek çağrıda rerank et
+    
+    Tüm grupların çiftleri aynı anda kuyruğa girer; scheduler onları ortak
+    batch'lerde skorlar. Sonuçlar istekteki grup sırasıyla döner.
+    """
+    http_request.state.capture = request
+    _require_ready()
+    
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="Grup listesi boş")
+    
+    for i, group in enumerate(request.requests):
+        _validate_documents(group, f" (grup {i})")
+    
+    # Kuyruk kontrolü tüm batch için: gruplardan bir kısmı kabul edilip diğerleri
+    # reddedilmesin
+    total_pairs = sum(len(group.document_ids or group.documents) for group in request.requests)
+    scored_pairs = sum(_scored_pair_count(group) for group in request.requests)
+    if scored_pairs > MAX_QUEUE_PAIRS:
+        # Boş kuyruğa da sığmaz: Retry-After ile tekrar denenmesinin anlamı yok
+        scheduler.rejected += 1
+        detail = _too_large_detail(scored_pairs, MAX_QUEUE_PAIRS)
+        logger.warning(f"📏 Batch reddedildi: {detail}")
+        raise HTTPException(status_code=413, detail=detail)
+    if scheduler.queue_size + scored_pairs > MAX_QUEUE_PAIRS:
+        scheduler.rejected += 1
+        detail = f"Kuyruk dolu ({scheduler.queue_size}/{MAX_QUEUE_PAIRS} çift bekliyor, batch {scored_pairs} çift)"
+        logger.warning(f"⏳ Batch reddedildi: {detail}")
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "1"})
+    
+    try:
+        started = time.perf_counter()
+        logger.info(f"📚 Batch reranking: {len(request.requests)} grup, {total_pairs} çift")
+        results = await _gather_groups(request.requests)
+        return _serialize(BatchRerankerResponse(
+            results=list(results),
+            total_groups=len(results),
+            total_pairs=total_pairs,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2)
+        ), http_request)
+    except RequestTooLargeError as e:
+        logger.warning(f"📏 Batch reddedildi: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        logger.warning(f"⏳ Batch reddedildi: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DocumentsNotFoundError as e:
+        logger.info(f"🗃️ {e}")
+        raise HTTPException(status_code=404, detail={"error": str(e), "missing_ids": e.missing_ids})
+    except DeadlineExceededError as e:
+        raise _deadline_exceeded(e)
+    except Exception as e:
+        logger.error(f"❌ Batch reranking hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Reranking hatası: {str(e)}")
+
+@app.post("/documents/tokens")
+async def store_document_tokens(request: DocumentTokensRequest):
+    """
+    Chunk'ları token store'a ekle (ingest sırasında çağrılır)
+    
+    Zaten store'da olan id'ler atlanır. Tokenization event loop'u bloklamasın
+    diye ayrı thread'de yapılır.
+    """
+    _require_ready()
+    if token_store is None:
+        raise HTTPException(status_code=400, detail="RERANKER_TOKEN_STORE ayarlı değil")
+    
+    try:
+        doc_ids = [int(doc["id"]) for doc in request.documents]
+        texts = [str(doc["text"]) for doc in request.documents]
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail='Her doküman {"id": int, "text": str} olmalı')
+    
+    loop = asyncio.get_running_loop()
+    stored = await loop.run_in_executor(None, _store_documents, doc_ids, texts)
+    logger.info(f"🗃️ Token store: {stored} yeni chunk ({len(doc_ids) - stored} zaten vardı)")
+    return {"stored": stored, "skipped": len(doc_ids) - stored, "documents": len(token_store)}
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: process ayakta ve event loop cevap veriyor (model yüklenirken de 200)"""
+    if load_state == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": load_error})
+    return {"status": "alive", "state": load_state, "uptime_s": round(time.time() - PROCESS_STARTED, 2)}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: model yüklendi, ısındı, istek kabul ediyor"""
+    if load_state != "ready":
+        return JSONResponse(
+            status_code=503,
+            content={"status": load_state, "uptime_s": round(time.time() - PROCESS_STARTED, 2), "error": load_error},
+            headers={"Retry-After": "5"}
+        )
+    return {"status": "ready", "time_to_ready_s": round(time_to_ready, 2)}
+
 @app.get("/health")
 async def health():
     """Sunucu sağlık kontrolü"""
     return {
-        "status": "healthy",
-        "model": "Qwen/Qwen3-Reranker-4B",
+        "status": "healthy" if load_state == "ready" else load_state,
+        "time_to_ready_s": round(time_to_ready, 2) if time_to_ready is not None else None,
+        "model": MODEL_NAME,
         "device": str(device),
-        "model_loaded": model is not None
+        "model_loaded": model is not None,
+        "precision": PRECISION,
+        "scoring": SCORING,
+        "backend": BACKEND,
+        "worker_pid": os.getpid(),
+        "workers": WORKERS,
+        "placement": cpu_placement.report() if cpu_placement is not None else None,
+        "weights": "mmap-snapshot" if weights_source else "huggingface",
+        "snapshot": weights_source,
+        "queue_size": scheduler.queue_size,
+        "max_queue_pairs": MAX_QUEUE_PAIRS,
+        "busy": scheduler.busy,
+        "rejected": scheduler.rejected,
+        "deadline_rejected": deadline_rejected,
+        "pairs_per_second": round(scheduler.pairs_per_second, 2) if scheduler.pairs_per_second else None,
+        "max_batch_size": MAX_BATCH_SIZE,
+        "max_wait_ms": MAX_WAIT_MS,
+        "max_length": MAX_LENGTH,
+        "token_budget": TOKEN_BUDGET,
+        "cascade": CASCADE,
+        "cascade_top_n": CASCADE_TOP_N,
+        "cache": score_cache.stats(),
+        "token_store": token_store.stats() if token_store is not None else None,
+        "capture": traffic_capture.stats() if traffic_capture is not None else None
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrikleri (istek/aşama süreleri, batch doluluğu, padding, kuyruk)"""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 async def root():
     """Ana sayfa"""
@@ -177,10 +1302,75 @@ async def root():
         "version": "1.0",
         "endpoints": [
             "/rerank (POST) - Dokümantasyonu sırala",
-            "/health (GET) - Sunucu durumu"
+            "/rerank/batch (POST) - Birden fazla sorguyu tek çağrıda sırala",
+            "/documents/tokens (POST) - Chunk token'larını token store'a ekle",
+            "/health (GET) - Sunucu durumu",
+            "/health/live (GET) - Liveness (model yüklenirken de 200)",
+            "/health/ready (GET) - Readiness (model hazır olunca 200)",
+            "/metrics (GET) - Prometheus metrikleri"
         ]
     }
 
+def prepare_snapshot() -> str:
+    """Worker'ların paylaşacağı snapshot'ı hazırla (yoksa oluştur)"""
+    snapshot = SNAPSHOT_PATH or snapshot_dir_for(SNAPSHOT_ROOT, MODEL_NAME, load_dtype(PRECISION), MODEL_CLASS)
+    if snapshot_exists(snapshot):
+        logger.info(f"💾 Mevcut snapshot kullanılıyor: {snapshot}")
+        return snapshot
+    
+    # Dönüşüm ayrı process'te: supervisor process modelin tam kopyasını bellekte tutmasın
+    process = multiprocessing.get_context("spawn").Process(
+        target=create_snapshot, args=(MODEL_NAME, snapshot, load_dtype(PRECISION), MODEL_CLASS)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise SystemExit(f"❌ Snapshot oluşturulamadı (exit code {process.exitcode})")
+    return snapshot
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WORKERS > 1:
+        # Spawn edilen worker'lar ortam değişkenlerini devralır
+        os.environ["RERANKER_SNAPSHOT"] = prepare_snapshot()
+        # Worker'ların metrikleri ortak dizinde birleşir (/metrics hangi worker'a düşerse düşsün)
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="reranker_metrics_"))
+        if CPUS:
+            # Plan başta doğrulanır; worker'lar slot'larını bu dizindeki kilit dosyalarından alır
+            try:
+                plan = plan_placement(read_topology(), CPUS, WORKERS,
+                                      int(os.environ.get("RERANKER_CPU_RESERVE", "0")),
+                                      os.environ.get("RERANKER_SMT", "0") == "1")
+            except ValueError as e:
+                raise SystemExit(f"❌ RERANKER_CPUS: {e}")
+            for planned in plan:
+                logger.info(f"🧭 Worker {planned.worker}: CPU {planned.report()['cpus']}, "
+                            f"NUMA {planned.numa_nodes}, {planned.intra_op_threads} thread")
+            os.environ["RERANKER_PLACEMENT_DIR"] = tempfile.mkdtemp(prefix="reranker_placement_")
+        logger.info(f"🍴 {WORKERS} worker başlatılıyor (paylaşımlı mmap ağırlıklar)")
+        worker_options = {}
+        if "timeout_worker_healthcheck" in inspect.signature(uvicorn.Config).parameters:
+            # Yeni uvicorn sürümleri startup'ı süren worker'ı öldürür - model yüklemesi uzun sürer
+            worker_options["timeout_worker_healthcheck"] = 600
+        if UDS_PATH:
+            # Çoklu worker'da uvicorn tek bir adres dinler: socket TCP'nin yerine geçer
+            logger.info(f"🔌 Unix socket: {UDS_PATH} (çoklu worker modunda TCP kapalı)")
+            uvicorn.run("reranker_server:app", uds=UDS_PATH, workers=WORKERS, **worker_options)
+        else:
+            uvicorn.run("reranker_server:app", host="0.0.0.0", port=PORT, workers=WORKERS, **worker_options)
+    elif UDS_PATH:
+        # Aynı process'te iki server: model/scheduler startup'ı sadece TCP server'da çalışır
+        logger.info(f"🔌 Unix socket: {UDS_PATH} (+ TCP 0.0.0.0:{PORT})")
+        tcp_server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=PORT))
+        uds_server = uvicorn.Server(uvicorn.Config(app, uds=UDS_PATH, lifespan="off"))
+
+        async def serve_both():
+            await asyncio.gather(tcp_server.serve(), uds_server.serve())
+
+        try:
+            asyncio.run(serve_both())
+        except KeyboardInterrupt:
+            # İki server da düzgün kapandı; uvicorn yakaladığı sinyali çıkışta yeniden yükseltir
+            pass
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
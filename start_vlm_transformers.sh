@@ -46,7 +46,7 @@ echo "   Model: $VLM_MODEL"
 echo "   Provider: Lokal Transformers"
 echo "   Device: $DEVICE"
 echo "   Port: 8001"
-echo "   Health: http://localhost:8001/health"
+echo "   Health: http://localhost:8001/health (hazır: /health/ready)"
 echo "═══════════════════════════════════════════════════════════════"
 echo ""
 
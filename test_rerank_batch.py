@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+✅ /rerank/batch grup iptali testi
+reranker_server.py: bir grup hata verince diğer grupların kuyruktaki çiftleri
+iptal edilir (scheduler onları hesaplamadan atlar)
+"""
+
+import asyncio
+
+import pytest
+
+import reranker_server
+from reranker_server import MicroBatchScheduler, RerankerRequest, ScoredPair
+
+
+@pytest.fixture
+def idle_scheduler(monkeypatch):
+    # Başlatılmamış scheduler: kuyruğa giren çiftler test boyunca bekler
+    scheduler = MicroBatchScheduler(lambda pairs: [ScoredPair(0.5, 1, 1) for _ in pairs], 16, 0, 64)
+    monkeypatch.setattr(reranker_server, "scheduler", scheduler)
+    monkeypatch.setattr(reranker_server, "score_cache", reranker_server.ScoreCache(0, 60))
+    monkeypatch.setattr(reranker_server, "_inflight", {})
+    monkeypatch.setattr(reranker_server, "_coalesced_waiters", {})
+    monkeypatch.setattr(reranker_server, "CASCADE", False)
+    monkeypatch.setattr(reranker_server, "tokenizer", None)
+
+    original = reranker_server._resolve_documents
+
+    async def resolve(request):
+        if request.query == "bozuk":
+            await asyncio.sleep(0.01)  # Diğer grup kuyruğa girmiş olsun
+            raise reranker_server.DocumentsNotFoundError([42])
+        return await original(request)
+
+    monkeypatch.setattr(reranker_server, "_resolve_documents", resolve)
+    return scheduler
+
+
+def _queued_futures(scheduler):
+    return [pending.future for pending in list(scheduler._queue._queue)]
+
+
+def test_failing_group_cancels_sibling_pairs(idle_scheduler):
+    groups = [
+        RerankerRequest(query="soru", documents=["a", "b", "c"]),
+        RerankerRequest(query="bozuk", documents=["d"]),
+    ]
+
+    async def scenario():
+        with pytest.raises(reranker_server.DocumentsNotFoundError):
+            await reranker_server._gather_groups(groups)
+        return _queued_futures(idle_scheduler)
+
+    futures = asyncio.run(scenario())
+    assert len(futures) == 3
+    assert all(future.cancelled() for future in futures)
+    assert reranker_server._inflight == {}
+
+
+def test_successful_groups_keep_request_order(idle_scheduler):
+    groups = [RerankerRequest(query="soru", documents=["a", "b"], top_k=2),
+              RerankerRequest(query="soru 2", documents=["c"], top_k=1)]
+
+    async def scenario():
+        idle_scheduler.start()
+        try:
+            return await reranker_server._gather_groups(groups)
+        finally:
+            await idle_scheduler.stop()
+
+    results = asyncio.run(scenario())
+    assert [result.query for result in results] == ["soru", "soru 2"]
+    assert [len(result.ranked_documents) for result in results] == [2, 1]
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+✅ Cascade ilk aşama testi
+lib/rag/rerank_cascade.py: Türkçe küçük harf dönüşümü, BM25 sıralaması ve
+eşit skorlu adaylarda orijinal sıranın korunması
+"""
+
+from lib.rag.rerank_cascade import bm25_scores, bm25_scores_terms, select_survivors, tokenize
+
+
+def test_tokenize_uses_turkish_casefolding():
+    assert tokenize("İSTANBUL ŞUBESİ, IRMAK") == ["istanbul", "şubesi", "ırmak"]
+    # Noktasız I → ı: "IŞIK" ile "ışık" aynı terim, "isik" değil
+    assert tokenize("IŞIK") == tokenize("ışık") != tokenize("isik")
+
+
+def test_uppercase_query_matches_lowercase_document():
+    scores = bm25_scores("İSTANBUL satış", [
+        "Ankara ofisinin bütçesi",
+        "istanbul satış ekibinin hedefleri",
+        "İzmir satış raporu",
+    ])
+    assert scores[1] > scores[2] > scores[0] == 0.0
+
+
+def test_rare_terms_weigh_more():
+    documents = [["okr", "hedef"], ["okr", "gelir"], ["okr", "hedef"]]
+    scores = bm25_scores_terms(["okr", "gelir"], documents)
+    assert scores[1] == max(scores)
+    assert scores[0] == scores[2]
+
+
+def test_token_ids_work_as_terms():
+    scores = bm25_scores_terms([101, 7], [[1, 2, 3], [7, 7, 9], [101, 4]])
+    assert scores[0] == 0.0
+    assert scores[1] > 0 and scores[2] > 0
+
+
+def test_empty_candidates():
+    assert bm25_scores("soru", []) == []
+    assert select_survivors([], 3) == []
+
+
+def test_survivors_keep_original_order_on_ties():
+    assert select_survivors([0.5, 2.0, 0.5, 2.0, 0.1], 3) == [1, 3, 0]
+    assert select_survivors([1.0, 1.0], 5) == [0, 1]
+    assert select_survivors([1.0, 2.0], 0) == []
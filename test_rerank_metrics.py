@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+✅ Reranker metrikleri testi
+lib/rag/rerank_metrics.py: /metrics çıktısı, PROMETHEUS_MULTIPROC_DIR ile
+worker'ların metriklerinin birleştirilmesi ve kuyruk gauge'larının /metrics
+çağrılmadan scheduler tarafından güncellenmesi
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+from typing import Optional
+
+from lib.rag import rerank_metrics
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _sample(text: str, name: str, default: Optional[float] = None) -> float:
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[-1])
+    if default is not None:
+        return default
+    raise AssertionError(f"{name} bulunamadı")
+
+
+def test_render_metrics_exposes_stages_and_pair_sources(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    before, _ = rerank_metrics.render_metrics()
+    before_cache = _sample(before.decode(), 'reranker_pairs_total{source="cache"}', default=0.0)
+
+    rerank_metrics.STAGE_SECONDS.labels("tokenize").observe(0.003)
+    rerank_metrics.PAIRS.labels("cache").inc(5)
+    body, content_type = rerank_metrics.render_metrics()
+    text = body.decode()
+
+    assert content_type.startswith("text/plain")
+    assert 'reranker_stage_seconds_bucket{le="0.005",stage="tokenize"}' in text
+    assert _sample(text, 'reranker_pairs_total{source="cache"}') == before_cache + 5
+
+
+def _run_worker(env: dict, code: str):
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, timeout=60)
+
+
+def test_multiprocess_mode_merges_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = (
+        "from lib.rag import rerank_metrics as m\n"
+        "m.REQUESTS.labels('/rerank', '200').inc({n})\n"
+        "m.QUEUE_PAIRS.inc(3)\n"
+        "{dead}\n"
+    )
+    _run_worker(env, worker.format(n=2, dead=""))
+    _run_worker(env, worker.format(n=3, dead="m.mark_worker_dead()"))
+
+    render = (
+        "from lib.rag import rerank_metrics as m\n"
+        "print(m.render_metrics()[0].decode())\n"
+    )
+    text = subprocess.run(
+        [sys.executable, "-c", render], cwd=ROOT, env=env, check=True, timeout=60,
+        capture_output=True, text=True,
+    ).stdout
+
+    assert _sample(text, 'reranker_requests_total{endpoint="/rerank",status="200"}') == 5
+    # Kapanan worker'ın canlı gauge'u toplama girmez
+    assert _sample(text, "reranker_queue_pairs") == 3
+
+
+def test_queue_gauges_follow_scheduler_without_scrape(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    from reranker_server import MicroBatchScheduler, ScoredPair
+
+    def queue_pairs() -> float:
+        return _sample(rerank_metrics.render_metrics()[0].decode(), "reranker_queue_pairs")
+
+    seen_in_flight = []
+
+    def score_fn(pairs):
+        text = rerank_metrics.render_metrics()[0].decode()
+        seen_in_flight.append(_sample(text, "reranker_in_flight_pairs"))
+        return [ScoredPair(0.5, 1, 1) for _ in pairs]
+
+    async def scenario():
+        scheduler = MicroBatchScheduler(score_fn, max_batch_size=8, max_wait_ms=0, max_queue_pairs=64)
+        futures = scheduler.enqueue([("soru", f"doküman {i}") for i in range(3)])
+        assert queue_pairs() == 3
+
+        scheduler.start()
+        try:
+            await asyncio.gather(*futures)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert seen_in_flight == [3]
+    assert queue_pairs() == 0
+    assert _sample(rerank_metrics.render_metrics()[0].decode(), "reranker_in_flight_pairs") == 0
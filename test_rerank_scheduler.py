@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+✅ Micro-batch scheduler kuyruk sınırı testi
+reranker_server.py: o an dolu kuyruk tekrar denenebilir 503, kuyruğun tamamından
+büyük istek tekrar denenmemesi gereken 413 alır
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import reranker_server
+from reranker_server import MicroBatchScheduler, QueueFullError, RequestTooLargeError, ScoredPair
+
+
+def _score(pairs):
+    return [ScoredPair(0.5, 1, 1) for _ in pairs]
+
+
+def _pairs(n: int):
+    return [("soru", f"doküman {i}") for i in range(n)]
+
+
+def test_enqueue_distinguishes_full_queue_from_oversized_request():
+    async def scenario():
+        scheduler = MicroBatchScheduler(_score, max_batch_size=4, max_wait_ms=0, max_queue_pairs=8)
+        with pytest.raises(RequestTooLargeError, match="sınır 8 çift"):
+            scheduler.enqueue(_pairs(9))
+        assert scheduler.queue_size == 0
+
+        scheduler.enqueue(_pairs(6))
+        with pytest.raises(QueueFullError):
+            scheduler.enqueue(_pairs(3))
+        assert len(scheduler.enqueue(_pairs(2))) == 2
+        assert scheduler.rejected == 2
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(reranker_server, "load_state", "ready")
+    monkeypatch.setattr(reranker_server, "MAX_QUEUE_PAIRS", 8)
+    monkeypatch.setattr(reranker_server, "CASCADE", False)
+    monkeypatch.setattr(reranker_server, "score_cache", reranker_server.ScoreCache(0, 60))
+    monkeypatch.setattr(reranker_server, "scheduler", MicroBatchScheduler(_score, 4, 0, 8))
+    # Lifespan çalıştırılmaz: model yüklenmez
+    return TestClient(reranker_server.app)
+
+
+def test_oversized_rerank_gets_413_without_retry_after(client):
+    response = client.post("/rerank", json={"query": "soru", "documents": [f"d{i}" for i in range(9)]})
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+    assert "8" in response.json()["detail"]
+
+
+def test_oversized_batch_gets_413(client):
+    groups = [{"query": "soru", "documents": [f"d{i}" for i in range(5)]} for _ in range(2)]
+    response = client.post("/rerank/batch", json={"requests": groups})
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+
+
+def test_cascade_counts_only_survivors(client):
+    # Cascade'de kuyruğa sadece survivor'lar girer: 10 doküman, 3 çift
+    group = reranker_server.RerankerRequest(query="soru", documents=[f"d{i}" for i in range(10)],
+                                            top_k=2, cascade=True, cascade_top_n=3)
+    assert reranker_server._scored_pair_count(group) == 3
+    group.cascade = False
+    assert reranker_server._scored_pair_count(group) == 10
+
+
+def test_full_queue_batch_stays_retryable(client):
+    async def fill():
+        reranker_server.scheduler.enqueue(_pairs(6))
+
+    asyncio.run(fill())
+    groups = [{"query": "soru", "documents": ["a", "b", "c"]}]
+    response = client.post("/rerank/batch", json={"requests": groups})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
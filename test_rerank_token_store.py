@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+✅ Token store testi
+lib/rag/rerank_token_store.py'nin kalıcılığı ve lib/rag/rerank_tokenization.py'de
+token id'leriyle verilen dokümanların çifte elle eklenmesi: id ile skorlama
+metinle skorlamayla aynı girdiyi (dolayısıyla aynı skoru) üretmeli
+
+RERANKER_MODEL yerel olarak yüklenebiliyorsa (ör. önbellekteki model ya da bir
+dizin) aynı karşılaştırma gerçek tokenizer ve modelle de yapılır.
+"""
+
+import os
+
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast
+
+from lib.rag.rerank_token_store import TokenStore, tokenizer_fingerprint
+from lib.rag.rerank_tokenization import (
+    DEFAULT_PAD_TOKEN,
+    _truncate_longest_first,
+    encode_document,
+    encode_pairs,
+    pair_template,
+    tokenize_in_buckets,
+)
+
+WORDS = "satış ekibinin q3 anahtar sonuçları okr hedef gelir bütçe istanbul ofisi rapor çeyrek büyüme".split()
+
+QUERY = "satış ekibinin q3 hedef sonuçları"
+DOCUMENTS = [
+    "okr",
+    "istanbul ofisi q3 satış rapor",
+    " ".join(WORDS * 3),
+    " ".join(WORDS[::-1] * 20),
+]
+
+
+def _word_tokenizer(template: bool) -> PreTrainedTokenizerFast:
+    """Kelime sözlüklü küçük tokenizer; template=True → BERT tarzı [CLS] a [SEP] b [SEP]"""
+    specials = ["[UNK]", "[CLS]", "[SEP]", DEFAULT_PAD_TOKEN]
+    vocab = {token: i for i, token in enumerate(specials + WORDS)}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    if template:
+        backend.post_processor = processors.TemplateProcessing(
+            single="[CLS] $A [SEP]",
+            pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+            special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])],
+        )
+    return PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]", pad_token=DEFAULT_PAD_TOKEN)
+
+
+def _real_tokenizer():
+    from transformers import AutoTokenizer
+
+    model_name = os.environ.get("RERANKER_MODEL", "Qwen/Qwen3-Reranker-4B")
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    except Exception:
+        pytest.skip(f"{model_name} yerelde yok")
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = DEFAULT_PAD_TOKEN
+    return tokenizer
+
+
+@pytest.fixture(params=["template", "plain", "real"])
+def tokenizer(request):
+    if request.param == "real":
+        return _real_tokenizer()
+    return _word_tokenizer(template=request.param == "template")
+
+
+@pytest.mark.parametrize("n_query, n_document, budget, expected", [
+    (3, 4, 10, (3, 4)),     # Sığıyor
+    (3, 40, 10, (3, 7)),    # Sadece doküman kısalır
+    (40, 3, 10, (7, 3)),    # Sadece query kısalır
+    (20, 30, 10, (5, 5)),   # İkisi de yarıya
+    (20, 20, 11, (5, 6)),   # Eşitlikte fazladan token dokümana
+    (0, 30, 10, (0, 10)),
+])
+def test_truncate_longest_first(n_query, n_document, budget, expected):
+    assert _truncate_longest_first(n_query, n_document, budget) == expected
+
+
+@pytest.mark.parametrize("max_length", [8, 16, 33, 256])
+def test_token_id_documents_encode_like_text(tokenizer, max_length):
+    text_pairs = [(QUERY, document) for document in DOCUMENTS]
+    id_pairs = [(QUERY, encode_document(tokenizer, document)) for document in DOCUMENTS]
+
+    expected = encode_pairs(tokenizer, text_pairs, max_length)
+    assert encode_pairs(tokenizer, id_pairs, max_length) == expected
+    assert all(len(ids) <= max_length for ids in expected)
+
+    # Karışık istek: metin ve id'li dokümanlar sıralarını korur
+    mixed = [pair if i % 2 else id_pairs[i] for i, pair in enumerate(text_pairs)]
+    assert encode_pairs(tokenizer, mixed, max_length) == expected
+
+
+def test_pair_template_of_bert_style_tokenizer():
+    tokenizer = _word_tokenizer(template=True)
+    cls_id, sep_id = tokenizer.convert_tokens_to_ids(["[CLS]", "[SEP]"])
+    assert pair_template(tokenizer) == ([cls_id], [sep_id], [sep_id])
+    assert pair_template(_word_tokenizer(template=False)) == ([], [], [])
+
+
+def test_token_id_scoring_equals_text_scoring():
+    tokenizer = _real_tokenizer()
+    from transformers import AutoModelForSequenceClassification
+
+    try:
+        model = AutoModelForSequenceClassification.from_pretrained(
+            os.environ.get("RERANKER_MODEL", "Qwen/Qwen3-Reranker-4B"), local_files_only=True
+        ).eval()
+    except Exception:
+        pytest.skip("Reranker modeli yerelde yok")
+    model.config.pad_token_id = tokenizer.pad_token_id
+
+    def scores(pairs):
+        batches, _ = tokenize_in_buckets(tokenizer, pairs, max_length=32)
+        result = [None] * len(pairs)
+        with torch.no_grad():
+            for batch in batches:
+                logits = model(**batch.inputs).logits[:, -1]
+                for i, score in zip(batch.indices, logits.tolist()):
+                    result[i] = score
+        return result
+
+    text_pairs = [(QUERY, document) for document in DOCUMENTS]
+    id_pairs = [(QUERY, encode_document(tokenizer, document)) for document in DOCUMENTS]
+    assert scores(id_pairs) == scores(text_pairs)
+
+
+def test_store_reopen_returns_same_ids(tmp_path):
+    path = str(tmp_path / "tokens")
+    store = TokenStore(path, "fp-1")
+    assert store.put_many([(11, [1, 2, 3]), (12, []), (13, list(range(1000)))]) == 3
+    assert store.get(11) == [1, 2, 3]
+
+    reopened = TokenStore(path, "fp-1")
+    assert len(reopened) == 3
+    assert reopened.get(11) == [1, 2, 3]
+    assert reopened.get(12) == []
+    assert reopened.get(13) == list(range(1000))
+    assert reopened.stats()["tokens"] == 1003
+
+
+def test_get_many_reports_missing_ids(tmp_path):
+    store = TokenStore(str(tmp_path / "tokens"), "fp-1")
+    store.put_many([(1, [5, 6]), (3, [7])])
+
+    tokens, missing = store.get_many([3, 2, 1, 4])
+    assert tokens == [[7], None, [5, 6], None]
+    assert missing == [2, 4]
+    assert 1 in store and 2 not in store
+    assert (store.hits, store.misses) == (2, 2)
+
+
+def test_rewritten_id_returns_latest_record(tmp_path):
+    path = str(tmp_path / "tokens")
+    store = TokenStore(path, "fp-1")
+    store.put_many([(1, [1, 1])])
+    store.put_many([(1, [2, 2, 2])])
+    assert store.get(1) == [2, 2, 2]
+    assert TokenStore(path, "fp-1").get(1) == [2, 2, 2]
+
+
+def test_records_appended_by_another_worker_are_found(tmp_path):
+    path = str(tmp_path / "tokens")
+    reader = TokenStore(path, "fp-1")
+    writer = TokenStore(path, "fp-1")
+    assert reader.get(7) is None
+
+    writer.put_many([(7, [9, 8, 7])])
+    assert 7 in reader
+    assert reader.get(7) == [9, 8, 7]
+
+
+def test_tokenizer_change_moves_store_aside(tmp_path):
+    path = str(tmp_path / "tokens")
+    TokenStore(path, "fp-1").put_many([(1, [1, 2])])
+
+    store = TokenStore(path, "fp-2")
+    assert len(store) == 0
+    assert store.get(1) is None
+    stale = [name for name in os.listdir(tmp_path) if name.startswith("tokens.stale-")]
+    assert len(stale) == 1
+    assert TokenStore(str(tmp_path / stale[0]), "fp-1").get(1) == [1, 2]
+
+
+def test_fingerprint_tracks_vocabulary():
+    assert tokenizer_fingerprint(_word_tokenizer(True)) == tokenizer_fingerprint(_word_tokenizer(True))
+
+    other = _word_tokenizer(True)
+    other.add_tokens(["yeni"])
+    assert tokenizer_fingerprint(other) != tokenizer_fingerprint(_word_tokenizer(True))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+✅ Skor cache testi
+reranker_server.py'deki ScoreCache'in LRU / TTL / kalıcılık davranışı ve aynı
+çifti isteyen eşzamanlı isteklerin tek hesaplamayı paylaşması (coalescing)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import reranker_server
+from reranker_server import ScoreCache, ScoredPair
+
+
+def _key(i: int) -> bytes:
+    return ScoreCache.make_key("model", 256, "soru", f"doküman {i}")
+
+
+def _cache(max_entries: int, ttl_s: float = 60, path: str = "") -> ScoreCache:
+    return ScoreCache(max_entries * ScoreCache.ENTRY_BYTES / 1024 / 1024, ttl_s, path)
+
+
+def test_make_key_is_length_prefixed():
+    assert ScoreCache.make_key("m", 1, "ab", "c") != ScoreCache.make_key("m", 1, "a", "bc")
+
+
+def test_evicts_least_recently_used_down_to_max_entries():
+    cache = _cache(3)
+    assert cache.max_entries == 3
+    for i in range(3):
+        cache.put(_key(i), float(i))
+    # 0 okunur → en eski 1 olur
+    assert cache.get(_key(0)) == 0.0
+    cache.put(_key(3), 3.0)
+
+    assert cache.stats()["entries"] == 3
+    assert cache.evictions == 1
+    assert cache.get(_key(1)) is None
+    assert [cache.get(_key(i)) for i in (0, 2, 3)] == [0.0, 2.0, 3.0]
+
+
+def test_expired_entry_is_a_miss():
+    cache = _cache(8, ttl_s=60)
+    cache.put(_key(0), 0.5, expires_at=time.time() - 1)
+    cache.put(_key(1), 0.7)
+
+    assert cache.get(_key(0)) is None
+    assert cache.get(_key(1)) == 0.7
+    assert cache.expirations == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ScoreCache(0, 60)
+    cache.put(_key(0), 1.0)
+    assert not cache.enabled
+    assert cache.get(_key(0)) is None
+
+
+def test_save_and_load_keep_lru_order_and_drop_expired(tmp_path):
+    path = str(tmp_path / "scores.json")
+    cache = _cache(3, path=path)
+    cache.put(_key(0), 0.0)
+    cache.put(_key(1), 1.0, expires_at=time.time() - 1)
+    cache.put(_key(2), 2.0)
+    cache.get(_key(0))  # LRU sırası: 2, 0
+    cache.save()
+
+    reopened = _cache(2, path=path)
+    reopened.load()
+    assert reopened.stats()["entries"] == 2
+    reopened.put(_key(4), 4.0)  # En eski (2) atılmalı
+    assert reopened.get(_key(2)) is None
+    assert reopened.get(_key(0)) == 0.0
+    assert reopened.get(_key(1)) is None
+
+
+class _ManualScheduler:
+    """enqueue edilen çiftleri test bitirene kadar bekleten scheduler"""
+
+    def __init__(self):
+        self.enqueued = []
+
+    def enqueue(self, pairs):
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in pairs]
+        self.enqueued.extend(zip(pairs, futures))
+        return futures
+
+
+@pytest.fixture
+def manual_scheduler(monkeypatch):
+    scheduler = _ManualScheduler()
+    monkeypatch.setattr(reranker_server, "scheduler", scheduler)
+    monkeypatch.setattr(reranker_server, "score_cache", _cache(64))
+    monkeypatch.setattr(reranker_server, "_inflight", {})
+    monkeypatch.setattr(reranker_server, "_coalesced_waiters", {})
+    return scheduler
+
+
+def test_concurrent_requests_share_one_computation(manual_scheduler):
+    async def scenario():
+        pairs = [("soru", "ortak doküman"), ("soru", "tek doküman")]
+        first = asyncio.create_task(reranker_server.score_pairs_cached(pairs))
+        second = asyncio.create_task(reranker_server.score_pairs_cached(pairs[:1]))
+        await asyncio.sleep(0)
+
+        # İkinci istek ortak çifti yeniden kuyruğa koymaz
+        assert [pair for pair, _ in manual_scheduler.enqueued] == pairs
+        for (_, document), future in manual_scheduler.enqueued:
+            future.set_result(ScoredPair(0.9 if document == "ortak doküman" else 0.1, 10, 12))
+        return await first, await second
+
+    (first_scores, first_counts), (second_scores, second_counts) = asyncio.run(scenario())
+
+    assert first_counts == {"hits": 0, "coalesced": 0, "computed": 2}
+    assert second_counts == {"hits": 0, "coalesced": 1, "computed": 0}
+    assert [scored.score for scored in first_scores] == [0.9, 0.1]
+    # Paylaşılan çiftin token maliyeti hesaplamayı başlatan isteğe yazılır
+    assert second_scores == [ScoredPair(0.9, 0, 0, False)]
+    assert reranker_server.score_cache.coalesced == 1
+    assert reranker_server._inflight == {}
+
+    # Sonuç cache'e yazıldı: üçüncü istek hiç kuyruğa girmez
+    third_scores, third_counts = asyncio.run(reranker_server.score_pairs_cached([("soru", "ortak doküman")]))
+    assert third_counts["hits"] == 1
+    assert third_scores[0].score == 0.9
+    assert len(manual_scheduler.enqueued) == 2
+
+
+def test_fallback_scores_are_not_cached(manual_scheduler):
+    async def scenario():
+        task = asyncio.create_task(reranker_server.score_pairs_cached([("soru", "doküman")]))
+        await asyncio.sleep(0)
+        manual_scheduler.enqueued[0][1].set_result(ScoredPair(0.0, 0, 0, True))
+        return await task
+
+    scores, _ = asyncio.run(scenario())
+    assert scores[0].fallback
+    assert reranker_server.score_cache.stats()["entries"] == 0
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+✅ VLM çözünürlük bütçesi testi
+lib/rag/vlm_resolution.py: kenarlar 28px ızgaraya oturur, vision token sayısı
+görevin bütçesini aşmaz ve en-boy oranı korunur
+
+VLM_MODEL yerel olarak yüklenebiliyorsa processor'ın ızgarayı değiştirmediği
+(token sayısının gerçekten bütçede kaldığı) da kontrol edilir.
+"""
+
+import os
+
+import pytest
+from PIL import Image
+
+from lib.rag.vlm_resolution import fit_size, vision_tokens
+
+FACTOR = 28  # Qwen2.5-VL: 14px patch × 2 merge
+MIN_TOKENS = 4
+
+# Render edilmiş A4 sayfası (scale: 2), slayt, ince banner, küçük logo, ızgaraya oturmuş kare
+SIZES = [(1190, 1684), (1920, 1080), (3000, 40), (40, 3000), (30, 20), (1, 1), (560, 560)]
+BUDGETS = [4, 64, 256, 1024, 1280]
+
+
+@pytest.mark.parametrize("width, height", SIZES)
+@pytest.mark.parametrize("max_tokens", BUDGETS)
+def test_fitted_size_is_on_grid_and_within_budget(width, height, max_tokens):
+    new_width, new_height = fit_size(width, height, FACTOR, max_tokens, MIN_TOKENS)
+
+    assert new_width % FACTOR == 0 and new_height % FACTOR == 0
+    assert new_width >= FACTOR and new_height >= FACTOR
+    assert MIN_TOKENS <= vision_tokens(new_width, new_height, FACTOR) <= max_tokens
+
+
+@pytest.mark.parametrize("width, height", [(1190, 1684), (1920, 1080)])
+@pytest.mark.parametrize("max_tokens", [64, 256, 1024])
+def test_downscale_uses_most_of_budget_and_keeps_aspect(width, height, max_tokens):
+    new_width, new_height = fit_size(width, height, FACTOR, max_tokens, MIN_TOKENS)
+    # Izgaraya aşağı yuvarlama her kenardan en fazla bir kare kaybettirir
+    rows, cols = new_height // FACTOR, new_width // FACTOR
+    assert (rows + 1) * (cols + 1) > max_tokens
+    assert abs(new_width / new_height - width / height) < 2 * FACTOR / min(new_width, new_height)
+
+
+def test_image_within_budget_is_only_rounded_to_grid():
+    assert fit_size(560, 560, FACTOR, 1024, MIN_TOKENS) == (560, 560)
+    assert fit_size(570, 550, FACTOR, 1024, MIN_TOKENS) == (560, 560)
+
+
+def test_tiny_image_is_upscaled_to_min_tokens():
+    new_width, new_height = fit_size(30, 20, FACTOR, 256, MIN_TOKENS)
+    assert vision_tokens(new_width, new_height, FACTOR) >= MIN_TOKENS
+    assert new_width >= new_height
+    # Yukarı yuvarlama bütçeyi aşmaz (ceil 84×56 = 6 token verirdi)
+    assert fit_size(30, 20, FACTOR, MIN_TOKENS, MIN_TOKENS) == (56, 56)
+
+
+def test_thin_banner_stays_within_budget():
+    # Yükseklik 28px'nin altına inemez; genişlik bütçeye göre kısaltılır
+    assert fit_size(3000, 40, FACTOR, 4, MIN_TOKENS) == (112, 28)
+    assert fit_size(40, 3000, FACTOR, 64, MIN_TOKENS) == (28, 64 * FACTOR)
+
+
+def test_processor_keeps_fitted_grid():
+    from transformers import AutoProcessor
+
+    model_id = os.environ.get("VLM_MODEL", "Qwen/Qwen2.5-VL-7B-Instruct")
+    try:
+        processor = AutoProcessor.from_pretrained(model_id, local_files_only=True)
+    except Exception:
+        pytest.skip(f"{model_id} yerelde yok")
+    image_processor = processor.image_processor
+    factor = image_processor.patch_size * image_processor.merge_size
+
+    for width, height in SIZES[:3]:
+        for max_tokens in (64, 256):
+            new_width, new_height = fit_size(width, height, factor, max_tokens, MIN_TOKENS)
+            image = Image.new("RGB", (new_width, new_height), "white")
+            grid_t, grid_h, grid_w = image_processor(images=[image], return_tensors="pt")["image_grid_thw"][0].tolist()
+            assert (grid_h * image_processor.patch_size, grid_w * image_processor.patch_size) == (new_height, new_width)
+            tokens = grid_t * grid_h * grid_w // image_processor.merge_size ** 2
+            assert tokens == vision_tokens(new_width, new_height, factor)
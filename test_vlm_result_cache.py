@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+✅ VLM sonuç cache'i testi
+lib/rag/vlm_result_cache.py: birebir / yakın kopya eşleşmesi, max_mb'ye kadar
+LRU atma, yeniden açılınca kayıtların kalması ve dHash'in işaretli 64 bit hali
+"""
+
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from lib.rag.vlm_result_cache import VLMResultCache, context_key, difference_hash, hamming, image_key
+
+CONTEXT = context_key("model", "describe", "Bu görseli açıkla", "512")
+
+
+def _slide(shift: int = 0, text: str = "Q3 OKR") -> Image.Image:
+    image = Image.new("RGB", (320, 240), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20 + shift, 20, 160 + shift, 120), fill="navy")
+    draw.ellipse((180, 100, 300, 220), fill="orange")
+    draw.text((30, 180), text, fill="black")
+    return image
+
+
+def _put(cache: VLMResultCache, image: Image.Image, value: dict, context: bytes = CONTEXT) -> bytes:
+    key = image_key(context, image)
+    cache.put(key, context, difference_hash(image), value)
+    return key
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "vlm" / "results.sqlite")
+
+
+def test_context_key_is_length_prefixed():
+    assert context_key("ab", "c") != context_key("a", "bc")
+
+
+def test_difference_hash_fits_signed_64_bit():
+    # Soldan sağa kararan görsel: her karşılaştırma 1 → tüm bitler dolu
+    gradient = Image.linear_gradient("L").rotate(90).transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    bits = difference_hash(gradient)
+    assert bits == -1
+    assert -(1 << 63) <= difference_hash(_slide()) < (1 << 63)
+    assert difference_hash(Image.new("L", (64, 64), 128)) == 0
+
+
+def test_hamming_ignores_sign():
+    assert hamming(-1, 0) == 64
+    assert hamming(-1, -1) == 0
+    assert hamming(-(1 << 63), 0) == 1
+    assert hamming(-2, 1) == 64
+    assert hamming(difference_hash(_slide()), difference_hash(_slide())) == 0
+
+
+def test_exact_hit_and_miss(cache_path):
+    cache = VLMResultCache(cache_path, max_mb=1)
+    key = _put(cache, _slide(), {"description": "Mavi dikdörtgen"})
+
+    hit = cache.get(key, CONTEXT, difference_hash(_slide()))
+    assert hit.kind == "exact"
+    assert hit.value == {"description": "Mavi dikdörtgen"}
+    # Aynı pikseller farklı context'te (ör. farklı prompt) eşleşmez
+    other = context_key("model", "table", "Tabloyu çıkar", "1024")
+    assert cache.get(image_key(other, _slide()), other) is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_perceptual_hit_only_when_enabled(cache_path):
+    original, near_copy = _slide(), _slide(shift=2)
+    near_key = image_key(CONTEXT, near_copy)
+    assert near_key != image_key(CONTEXT, original)
+    assert hamming(difference_hash(original), difference_hash(near_copy)) <= 6
+
+    exact_only = VLMResultCache(cache_path, max_mb=1)
+    _put(exact_only, original, {"description": "slayt"})
+    assert exact_only.get(near_key, CONTEXT, difference_hash(near_copy)) is None
+    exact_only.close()
+
+    perceptual = VLMResultCache(cache_path, max_mb=1, phash_distance=6)
+    hit = perceptual.get(near_key, CONTEXT, difference_hash(near_copy))
+    assert hit.kind == "perceptual"
+    assert hit.value == {"description": "slayt"}
+    # Farklı context'teki yakın kopya dönmez
+    assert perceptual.get(near_key, context_key("x"), difference_hash(near_copy)) is None
+    # Uzak görsel dönmez
+    distant = Image.linear_gradient("L").convert("RGB")
+    assert perceptual.get(image_key(CONTEXT, distant), CONTEXT, difference_hash(distant)) is None
+
+
+def test_evicts_least_recently_read_down_to_max_mb(cache_path):
+    payload = "x" * 20_000
+    cache = VLMResultCache(cache_path, max_mb=0.1)  # ~5 kayıt
+    keys = []
+    for i in range(5):
+        keys.append(_put(cache, _slide(text=str(i)), {"i": i, "text": payload}))
+        time.sleep(0.01)
+    assert cache.evictions == 0
+    cache.get(keys[0], CONTEXT)  # 0 okunur → en eski 1 olur
+    time.sleep(0.01)
+
+    for i in range(5, 8):
+        keys.append(_put(cache, _slide(text=str(i)), {"i": i, "text": payload}))
+        time.sleep(0.01)
+
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.evictions == 3
+    assert cache.entries == 5
+    assert [i for i, key in enumerate(keys) if cache.get(key, CONTEXT) is not None] == [0, 4, 5, 6, 7]
+
+
+def test_reopen_keeps_entries_and_size(cache_path):
+    cache = VLMResultCache(cache_path, max_mb=1)
+    key = _put(cache, _slide(), {"description": "kalıcı"})
+    _put(cache, _slide(text="b"), {"description": "ikinci"})
+    # Aynı anahtarın üzerine yazmak boyutu iki kez saymaz
+    _put(cache, _slide(), {"description": "kalıcı"})
+    size, entries = cache.total_bytes, cache.entries
+    cache.close()
+
+    reopened = VLMResultCache(cache_path, max_mb=1)
+    assert (reopened.total_bytes, reopened.entries) == (size, entries) == (size, 2)
+    assert reopened.get(key, CONTEXT).value == {"description": "kalıcı"}
+
+
+def test_disabled_cache(cache_path):
+    cache = VLMResultCache(cache_path, max_mb=0, phash_distance=6)
+    key = _put(cache, _slide(), {"description": "yok"})
+    assert not cache.enabled and not cache.perceptual
+    assert cache.get(key, CONTEXT) is None
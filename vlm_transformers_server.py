@@ -8,22 +8,123 @@ HF Inference API gerektirmez
 """
 
 import os
+import asyncio
 import base64
 import io
+import json
 import logging
+import math
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Tuple, Union
 import torch
 from PIL import Image
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from transformers import AutoProcessor, AutoModelForVision2Seq, BitsAndBytesConfig
+from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from lib.rag.traffic_capture import capture_from_env
+from lib.rag.cpu_placement import placement_from_env
+from lib.rag.vlm_result_cache import CacheHit, VLMResultCache, context_key, difference_hash, image_key
+from lib.rag.vlm_resolution import fit_size
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("vlm")
 
-MODEL_ID = "Qwen/Qwen2.5-VL-7B-Instruct"
+MODEL_ID = os.environ.get("VLM_MODEL", "Qwen/Qwen2.5-VL-7B-Instruct")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 TORCH_DTYPE = torch.float16 if torch.cuda.is_available() else torch.float32
 
+# Soğuk başlangıç
+# SNAPSHOT_AUTO: İlk açılışta yüklenen model (4-bit ise quantize edilmiş haliyle) lokal
+# diske yazılır; sonraki açılışlar shard okuma/quantization yapmadan snapshot'ı açar
+SNAPSHOT_ROOT = os.environ.get("VLM_SNAPSHOT_ROOT", "vlm_snapshots")
+SNAPSHOT_AUTO = os.environ.get("VLM_SNAPSHOT_AUTO", "1") == "1"
+# WARMUP: Hazır işaretlenmeden önce bu boyutlardaki (GENxYÜK) boş sayfa görselleriyle
+# kısa generate'ler çalıştırılır; ilk gerçek analiz ilk çağrı maliyetini ödemez
+WARMUP = os.environ.get("VLM_WARMUP", "1") == "1"
+WARMUP_SIZES = [
+    tuple(int(v) for v in size.lower().split("x"))
+    for size in os.environ.get("VLM_WARMUP_SIZES", "448x448").split(",") if size.strip()
+]
+
+# CPU yerleşimi (lib/rag/cpu_placement.py): VLM_CPUS ayarlıysa ("auto", "node1", "16-31")
+# process bu çekirdeklere sabitlenir ve torch thread sayısı çekirdek sayısına eşitlenir;
+# aynı makinedeki reranker / Next.js ile çekirdek paylaşımı böylece önlenir.
+# VLM_CPU_RESERVE kümenin başından boş bırakılan çekirdek sayısı, VLM_SMT=1 hyperthread'leri de kullanır
+
+# Generation kuyruğu
+# generate tek bir inference thread'inde sırayla çalışır; event loop (/health, yeni
+# istekler) bloklanmaz. MAX_QUEUE: Sırada bekleyebilecek en fazla istek - dolunca
+# 429 + Retry-After (tahmini bekleme) döner
+MAX_QUEUE = int(os.environ.get("VLM_MAX_QUEUE", "8"))
+# MAX_BATCH_SIZE: Kuyrukta bekleyen işlerden tek generate'e (pad'lenmiş batch) giren en
+# fazla görsel; ağırlıklar her decode adımında bir kez okunur, batch'teki görseller paylaşır
+MAX_BATCH_SIZE = int(os.environ.get("VLM_MAX_BATCH_SIZE", "4"))
+
+# Görev bazlı prompt'lar
+TASK_PROMPTS = {
+    "extract": "Bu görselde ne var? (Tablo, grafik, diyagram, metin?) Kısaca cevapla.",
+    "describe": "Bu görseli detaylı olarak Türkçe açıkla.",
+    "table": "Eğer bu görselde tablo varsa, Markdown formatında çıkar. Yoksa 'Tablo yok' de.",
+    "diagram": "Eğer bu görselde diyagram varsa, neyi gösterdiğini açıkla. Yoksa 'Diyagram yok' de."
+}
+
+# Çözünürlük bütçesi: görev başına en fazla vision token. Görsel, en-boy oranı korunarak
+# modelin patch ızgarasına (Qwen2.5-VL: 14px patch × 2×2 merge = 28px) oturacak şekilde
+# küçültülür; prefill maliyeti render DPI'ına değil görevin ihtiyacına göre ölçeklenir.
+# "extract" kısa bir sınıflandırma, "table" rakamları okuyabilmek için en yüksek bütçe
+TASK_VISION_TOKENS = {
+    task: int(tokens)
+    for task, tokens in (
+        item.split("=") for item in os.environ.get(
+            "VLM_VISION_TOKENS", "extract=256,describe=1024,table=1280,diagram=1024"
+        ).split(",") if item.strip()
+    )
+}
+MIN_VISION_TOKENS = int(os.environ.get("VLM_MIN_VISION_TOKENS", "4"))
+
+# Üretim bütçesi: görev başına en fazla yeni token ("extract" kısa cevap istiyor)
+TASK_MAX_NEW_TOKENS = {
+    task: int(tokens)
+    for task, tokens in (
+        item.split("=") for item in os.environ.get(
+            "VLM_MAX_NEW_TOKENS", "extract=64,describe=512,table=1024,diagram=384"
+        ).split(",") if item.strip()
+    )
+}
+# Erken durdurma: cevap bu olumsuz ifadeyle başlıyorsa ifade tamamlanınca üretim biter
+# (prompt'lar "Yoksa 'Tablo yok' de." diyor; devamı boş token harcar)
+TASK_STOP_PREFIXES = {
+    "table": ("Tablo yok",),
+    "diagram": ("Diyagram yok",),
+}
+# Olumsuz cevap bu kadar token içinde başlamadıysa artık kontrol edilmez
+STOP_CHECK_TOKENS = 16
+
+# Sonuç cache'i (lib/rag/vlm_result_cache.py): (model, görev, prompt, bütçe) + görselin
+# piksel hash'i → analiz sonucu. Tekrar yüklenen PDF'ler ve aynı slayt şablonları
+# generate edilmeden döner. CACHE_MAX_MB = 0 → kapalı; CACHE_PHASH_DISTANCE >= 0 ise
+# aynı görevde difference hash'i bu kadar bit yakın görseller de eşleşir (yakın kopya;
+# rakamları farklı iki tablo da eşleşebileceği için varsayılan kapalı)
+CACHE_PATH = os.environ.get("VLM_CACHE_PATH", "./vlm_cache/results.sqlite3")
+CACHE_MAX_MB = float(os.environ.get("VLM_CACHE_MAX_MB", "256"))
+CACHE_PHASH_DISTANCE = int(os.environ.get("VLM_CACHE_PHASH_DISTANCE", "-1"))
+
+# Trafik kaydı: VLM_CAPTURE_PATH ayarlıysa analiz istekleri JSONL'e yazılır
+# (görev + görsel boyutu + süre; VLM_CAPTURE_PAYLOADS=1 ise base64 görsel de).
+# /analyze/batch kaydında öğe başına boyut + sonuç durumu, /analyze/stream kaydında
+# akışın sonuna kadar geçen süre ve nasıl bittiği tutulur
+CAPTURED_ENDPOINTS = ("/analyze", "/analyze/batch", "/analyze/stream")
+traffic_capture = capture_from_env("VLM")
+result_cache = VLMResultCache(CACHE_PATH, CACHE_MAX_MB, CACHE_PHASH_DISTANCE)
+
 app = FastAPI(title="Qwen2.5-VL-7B (Lokal 4-bit)", version="1.0")
 
 class VLMRequest(BaseModel):
@@ -36,18 +137,118 @@ class VLMResponse(BaseModel):
     analysis: str
     confidence: float
     content_type: str
+    queue_position: Optional[int] = None  # Kuyruğa girerken önündeki iş sayısı
+    queue_wait_ms: Optional[float] = None  # Kuyrukta geçen süre
+    generation_ms: Optional[float] = None
+    batch_size: Optional[int] = None  # Birlikte generate edilen görsel sayısı
+    vision_tokens: Optional[int] = None  # Görselin LLM'e giren token sayısı (bütçeye göre)
+    image_size: Optional[List[int]] = None  # Modele giren görsel boyutu [genişlik, yükseklik]
+    cache: Optional[str] = None  # Cache'ten geldiyse "exact" / "perceptual"
+    output_tokens: Optional[int] = None  # Üretilen token sayısı
+    finish_reason: Optional[str] = None  # "stop" (EOS) / "negative" (olumsuz cevap) / "length" (bütçe)
+
+class VLMBatchRequest(BaseModel):
+    """Çoklu görsel analizi (her öğenin kendi görevi)"""
+    items: List[VLMRequest]
+
+class VLMBatchItemResult(BaseModel):
+    """Tek öğenin sonucu: başarılıysa result, değilse error + status"""
+    index: int
+    status: int = 200
+    result: Optional[VLMResponse] = None
+    error: Optional[str] = None
+
+class VLMBatchResponse(BaseModel):
+    """Çoklu görsel analizi yanıtı (istekteki öğe sırasıyla)"""
+    results: List[VLMBatchItemResult]
+    total_items: int
+    failed: int
+    elapsed_ms: float
 
 # Global yüklenen model
 model = None
 processor = None
+weights_source = None  # Modelin yüklendiği snapshot dizini (HF'den yüklendiyse None)
+cpu_placement = None  # VLM_CPUS ayarlıysa seçilen çekirdek kümesi
+
+# Yükleme durumu: loading → warmup → ready (ya da failed)
+# Model arka planda yüklenir; sunucu bu sırada /health/live ve /health/ready'ye cevap verir
+PROCESS_STARTED = time.time()
+load_state = "loading"
+load_error: Optional[str] = None
+load_seconds: Optional[float] = None
+warmup_seconds: Optional[float] = None
+time_to_ready: Optional[float] = None
+load_task: Optional[asyncio.Task] = None
 
 
 # --------------------------------------------------------
 # MODEL YÜKLEME (4-BIT QUANTIZATION İLE)
 # --------------------------------------------------------
+def snapshot_dir(variant: str) -> str:
+    """Snapshot dizini (ör. vlm_snapshots/Qwen--Qwen2.5-VL-7B-Instruct--nf4)"""
+    return os.path.join(SNAPSHOT_ROOT, f"{MODEL_ID.strip('/').replace('/', '--')}--{variant}")
+
+
+def load_snapshot() -> bool:
+    """Varsa önceki açılışta yazılmış snapshot'tan yükle (önce 4-bit, sonra tam hassasiyet)"""
+    global model, processor, weights_source
+    for variant in ("nf4", str(TORCH_DTYPE).replace("torch.", "")):
+        path = snapshot_dir(variant)
+        if not os.path.isdir(path):
+            continue
+        try:
+            logger.info(f"💾 Snapshot'tan yükleniyor: {path}")
+            processor = AutoProcessor.from_pretrained(path, trust_remote_code=True)
+            # Quantization ayarları snapshot'ın config'inde: yeniden quantize edilmez
+            model = AutoModelForVision2Seq.from_pretrained(
+                path,
+                torch_dtype=TORCH_DTYPE if variant != "nf4" else None,
+                device_map="auto" if DEVICE == "cuda" else "cpu",
+                trust_remote_code=True
+            )
+            weights_source = path
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot açılamadı ({path}): {e}")
+            model = None
+    return False
+
+
+def save_snapshot(variant: str):
+    """
+    Yüklenen modeli lokal diske yaz (safetensors)
+
+    Yazma önce geçici dizine yapılır, bitince rename edilir: yarım kalan bir
+    snapshot asla geçerli görünmez.
+    """
+    path = snapshot_dir(variant)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    started = time.time()
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        model.save_pretrained(tmp_path, safe_serialization=True)
+        processor.save_pretrained(tmp_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Snapshot yazıldı ({time.time() - started:.1f}s): {path} - sonraki açılış buradan")
+    except Exception as e:
+        # Disk dolu / 4-bit ağırlıklar serileştirilemiyor: sunucu yine de çalışır
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        logger.warning(f"⚠️ Snapshot yazılamadı ({path}): {e}")
+
+
 def init_model():
     """Model ve processor'ü 4-bit quantization'la yükle (CPU RAM optimizasyonu)"""
-    global model, processor
+    global model, processor, cpu_placement
+    try:
+        cpu_placement = placement_from_env("VLM")
+    except (ValueError, RuntimeError) as e:
+        logger.error(f"❌ CPU yerleşimi uygulanamadı (VLM_CPUS): {e}")
+        return False
+    if SNAPSHOT_AUTO and load_snapshot():
+        logger.info(f"✅ Model snapshot'tan yüklendi ve hazır")
+        return True
     try:
         logger.info(f"📥 Model indiriliyor / yükleniyor: {MODEL_ID}")
         logger.info(f"📟 Device: {DEVICE} | Dtype: {TORCH_DTYPE}")
@@ -71,6 +272,8 @@ def init_model():
         )
 
         logger.info(f"✅ Model yüklendi ve hazır (4-bit quantized)")
+        if SNAPSHOT_AUTO:
+            save_snapshot("nf4")
         return True
 
     except Exception as e:
@@ -87,76 +290,502 @@ def init_model():
             if DEVICE == "cpu":
                 model.to("cpu")
             logger.info(f"⚠️ Model yüklendi (quantization olmadan)")
+            if SNAPSHOT_AUTO:
+                save_snapshot(str(TORCH_DTYPE).replace("torch.", ""))
             return True
         except Exception as fallback_error:
             logger.error(f"❌ Fallback de başarısız: {fallback_error}")
             return False
 
 
+def warmup():
+    """WARMUP_SIZES boyutlarındaki boş sayfalarla kısa generate (kernel seçimi, allocator ısınması)"""
+    for width, height in WARMUP_SIZES:
+        started = time.time()
+        generate(Image.new("RGB", (width, height), "white"), "Bu görselde ne var?", max_new_tokens=4)
+        logger.info(f"🔥 Warmup {width}x{height}: {time.time() - started:.1f}s")
+
+
+async def load_in_background():
+    """Modeli yükle ve ısıt; bitince sunucu hazır (ready) olur"""
+    global load_state, load_error, load_seconds, warmup_seconds, time_to_ready
+    loop = asyncio.get_running_loop()
+
+    started = time.time()
+    loaded = await loop.run_in_executor(None, init_model)
+    load_seconds = time.time() - started
+    if not loaded:
+        load_state = "failed"
+        load_error = "Model yüklenemedi (ayrıntılar log'da)"
+        return
+
+    if WARMUP:
+        load_state = "warmup"
+        started = time.time()
+        try:
+            await loop.run_in_executor(None, warmup)
+        except Exception as e:
+            # Warmup başarısızsa ilk istek yavaş olur ama sunucu yine hizmet verir
+            logger.warning(f"⚠️ Warmup başarısız: {e}")
+        warmup_seconds = time.time() - started
+
+    generation_queue.start()
+    time_to_ready = time.time() - PROCESS_STARTED
+    load_state = "ready"
+    logger.info(f"🟢 VLM hazır (başlangıçtan {time_to_ready:.1f}s, yükleme {load_seconds:.1f}s)")
+
 
 @app.on_event("startup")
 async def startup():
+    global load_task
     logger.info("🚀 VLM Server başlıyor...")
-    init_model()
+    # Model arka planda yüklenir: sunucu hemen dinlemeye başlar (/health/live)
+    load_task = asyncio.create_task(load_in_background())
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await generation_queue.stop()
+    result_cache.close()
+
 
 # --------------------------------------------------------
-# INFERENCE FONKSİYONU
+# GENERATION KUYRUĞU
 # --------------------------------------------------------
-async def infer_with_model(image_base64: str, prompt: str) -> str:
-    """Base64 image + prompt -> model output"""
-    if model is None or processor is None:
-        raise ValueError("Model not loaded")
+class QueueFullError(Exception):
+    """Kuyruk dolu (retry_after_s: tahmini boşalma süresi)"""
 
-    try:
-        # Base64 görüntüyü çöz
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
-
-        logger.info(f"🔄 Qwen2.5-VL-7B çalışıyor ({DEVICE})...")
-
-        # Chat formatı
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": image},
-                    {"type": "text", "text": prompt}
-                ],
-            }
-        ]
-
-        # Chat template → text prompt
-        text_prompt = processor.apply_chat_template(
-            messages, add_generation_prompt=True
-        )
+    def __init__(self, message: str, retry_after_s: float):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class GenerationJob:
+    image: Image.Image
+    prompt: str
+    max_new_tokens: int
+    future: asyncio.Future
+    enqueued_at: float
+    position: int = 0  # Kuyruğa girerken önündeki iş sayısı (çalışan dahil)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    batch_size: int = 1
+    vision_tokens: Optional[int] = None
+    stop_prefixes: Tuple[str, ...] = ()
+    stream: Optional[asyncio.Queue] = None  # Akış isteyen işte metin parçaları (bitince None)
+    streamed_chars: int = 0  # İstemciye akıtılmış karakter sayısı
+    output_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
 
-        # Tek bir birleşik processor çağrısı yeterli
-        inputs = processor(
-            text=[text_prompt],
-            images=[image],
-            padding=True,
-            return_tensors="pt"
-        ).to(DEVICE)
-
-        # Generate
-        with torch.no_grad():
-            generated_ids = model.generate(
-                **inputs,
-                max_new_tokens=1024,
+
+class GenerationResult(NamedTuple):
+    text: str
+    vision_tokens: int
+    output_tokens: int
+    finish_reason: str
+
+
+class GenerationQueue:
+    """
+    generate çağrılarını sınırlı bir kuyrukla tek inference thread'inde çalıştırır
+
+    Endpoint işi kuyruğa atıp future'ını bekler; event loop generate sırasında
+    serbesttir. Sırası gelen işle birlikte kuyrukta bekleyen işler (en fazla
+    max_batch_size) tek bir pad'lenmiş generate'e alınır. Batch başarısız olursa
+    işler tek tek yeniden denenir: bir görselin hatası diğerlerini düşürmez.
+    İptal edilen (bağlantısı kopan) istekler sırası gelince atlanır.
+    Ortalama batch süresi (EWMA) kuyrukta bekleme tahmini için tutulur.
+    """
+
+    DURATION_ALPHA = 0.2
+
+    def __init__(self, max_queue: int, max_batch_size: int):
+        self.max_queue = max(1, max_queue)
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self._executor = None
+        self.in_flight = 0  # Şu an generate edilen görsel sayısı
+        self.batches = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.average_batch_s: Optional[float] = None
+
+    def start(self):
+        if self._task is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vlm-generate")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def busy(self) -> bool:
+        return self.in_flight > 0
+
+    def estimate_wait_s(self, ahead: int) -> Optional[float]:
+        """Önünde `ahead` iş olan yeni bir işin başlamasına kadar tahmini süre"""
+        if self.average_batch_s is None:
+            return None
+        return math.ceil(ahead / self.max_batch_size) * self.average_batch_s
+
+    def submit(
+        self, items: List[Tuple[Image.Image, str, int, Tuple[str, ...]]], stream: bool = False
+    ) -> List[GenerationJob]:
+        """
+        (görsel, prompt, max_new_tokens, olumsuz cevap önekleri) işlerini kuyruğa ekle
+
+        Ya hepsi kuyruğa girer ya hiçbiri: yer yoksa QueueFullError. stream=True ise
+        üretilen metin parçaları job.stream kuyruğuna da yazılır.
+        """
+        ahead = self.queue_size + self.in_flight
+        if self.queue_size + len(items) > self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Kuyruk dolu ({self.queue_size}/{self.max_queue} istek bekliyor, {len(items)} yer gerekli)",
+                self.estimate_wait_s(ahead) or 10.0,
             )
+        loop = asyncio.get_running_loop()
+        jobs = []
+        for offset, (image, prompt, max_new_tokens, stop_prefixes) in enumerate(items):
+            job = GenerationJob(image, prompt, max_new_tokens, loop.create_future(), loop.time(), ahead + offset,
+                                stop_prefixes=stop_prefixes, stream=asyncio.Queue() if stream else None)
+            self._queue.put_nowait(job)
+            jobs.append(job)
+        return jobs
 
-        result = processor.batch_decode(
-            generated_ids, skip_special_tokens=True
-        )[0]
+    def _collect_batch(self, first: GenerationJob) -> List[GenerationJob]:
+        """Sırası gelen işe kuyrukta hazır bekleyenleri ekle (beklemeden)"""
+        batch = [first]
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return [job for job in batch if not job.future.done()]  # İstemcisi vazgeçenler atlanır
 
-        logger.info(f"✅ Model çıktı: {result[:80]}...")
-        return result
+    def _generate_jobs(self, jobs: List[GenerationJob]) -> List[object]:
+        """Batch'i generate et (inference thread'inde); başarısızsa işleri tek tek dene"""
+        max_new_tokens = max(job.max_new_tokens for job in jobs)
+        try:
+            return generate_batch([job.image for job in jobs], [job.prompt for job in jobs], max_new_tokens, jobs)
+        except Exception as e:
+            if len(jobs) == 1:
+                return [e]
+            logger.warning(f"⚠️ {len(jobs)} görsellik batch başarısız ({e}), tek tek deneniyor")
+            results = []
+            for job in jobs:
+                if job.streamed_chars:
+                    # İstemci metnin bir kısmını aldı; baştan üretmek aynı metni tekrar akıtır
+                    results.append(RuntimeError(f"Akış sırasında batch başarısız: {e}"))
+                    continue
+                try:
+                    results.append(generate_batch([job.image], [job.prompt], job.max_new_tokens, [job])[0])
+                except Exception as item_error:
+                    results.append(item_error)
+            return results
 
-    except Exception as e:
-        logger.error(f"❌ Inference hatası: {e}")
-        raise
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collect_batch(await self._queue.get())
+            if not batch:
+                continue
+            started = loop.time()
+            for job in batch:
+                job.started_at = started
+                job.batch_size = len(batch)
+            self.in_flight = len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self._generate_jobs, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            finally:
+                self.in_flight = 0
+            finished = loop.time()
+            self.batches += 1
+            duration = finished - started
+            if self.average_batch_s is None:
+                self.average_batch_s = duration
+            else:
+                self.average_batch_s += self.DURATION_ALPHA * (duration - self.average_batch_s)
+            for job, result in zip(batch, results):
+                job.finished_at = finished
+                if job.stream is not None:
+                    job.stream.put_nowait(None)  # Akışın sonu
+                if job.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    job.future.set_exception(result)
+                else:
+                    self.completed += 1
+                    job.vision_tokens = result.vision_tokens
+                    job.output_tokens = result.output_tokens
+                    job.finish_reason = result.finish_reason
+                    job.future.set_result(result.text)
+
+    def stats(self) -> dict:
+        estimated = self.estimate_wait_s(self.queue_size + self.in_flight)
+        return {
+            "queue_size": self.queue_size,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "busy": self.busy,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "average_batch_s": round(self.average_batch_s, 2) if self.average_batch_s else None,
+            "estimated_wait_s": round(estimated, 2) if estimated is not None else None,
+        }
+
+
+generation_queue = GenerationQueue(MAX_QUEUE, MAX_BATCH_SIZE)
+
+
+def decode_image(image_base64: str) -> Image.Image:
+    """Base64 görseli RGB PIL görseline çevir"""
+    return Image.open(io.BytesIO(base64.b64decode(image_base64))).convert("RGB")
+
+
+def grid_factor() -> int:
+    """Bir vision token'ın kenar uzunluğu (piksel): patch_size × merge_size"""
+    image_processor = getattr(processor, "image_processor", None)
+    return getattr(image_processor, "patch_size", 14) * getattr(image_processor, "merge_size", 2)
+
+
+def fit_to_budget(image: Image.Image, task: str) -> Image.Image:
+    """
+    Görseli görevin vision token bütçesine sığdır
+
+    Kenarlar patch ızgarasının katına yuvarlanır (processor'ın kendi yeniden
+    boyutlandırması böylece devreye girmez); bütçeyi aşan görsel en-boy oranı
+    korunarak küçültülür, MIN_VISION_TOKENS altındaki büyütülür.
+    """
+    max_tokens = TASK_VISION_TOKENS.get(task, TASK_VISION_TOKENS.get("extract", 256))
+    new_width, new_height = fit_size(image.width, image.height, grid_factor(), max_tokens, MIN_VISION_TOKENS)
+
+    if (new_width, new_height) == image.size:
+        return image
+    return image.resize((new_width, new_height), Image.Resampling.BICUBIC)
+
+
+@dataclass
+class PreparedImage:
+    """Kuyruğa girmeye hazır görsel + cache anahtarları (hit doluysa generate gerekmez)"""
+    image: Optional[Image.Image]
+    prompt: str
+    max_new_tokens: int
+    context: bytes
+    key: bytes
+    stop_prefixes: Tuple[str, ...] = ()
+    phash: Optional[int] = None
+    hit: Optional[CacheHit] = None
+
+    def queue_item(self) -> Tuple[Image.Image, str, int, Tuple[str, ...]]:
+        return self.image, self.prompt, self.max_new_tokens, self.stop_prefixes
+
+
+def prepare_image(image_base64: str, task: str) -> PreparedImage:
+    """
+    Base64 görseli çöz, cache'e bak; cache'te yoksa görevin çözünürlük bütçesine sığdır
+
+    Anahtar küçültmeden önceki piksellerden hesaplanır: bütçe context'in parçasıdır.
+    """
+    image = decode_image(image_base64)
+    prompt = TASK_PROMPTS.get(task, TASK_PROMPTS["extract"])
+    max_new_tokens = TASK_MAX_NEW_TOKENS.get(task, TASK_MAX_NEW_TOKENS.get("extract", 64))
+    stop_prefixes = TASK_STOP_PREFIXES.get(task, ())
+    context = context_key(
+        MODEL_ID, prompt, max_new_tokens, "|".join(stop_prefixes), TASK_VISION_TOKENS.get(task), MIN_VISION_TOKENS
+    )
+    prepared = PreparedImage(image, prompt, max_new_tokens, context, image_key(context, image), stop_prefixes)
+    if not result_cache.enabled:
+        prepared.image = fit_to_budget(image, task)
+        return prepared
+    if result_cache.perceptual:
+        prepared.phash = difference_hash(image)
+    prepared.hit = result_cache.get(prepared.key, context, prepared.phash)
+    if prepared.hit is None:
+        prepared.image = fit_to_budget(image, task)
+    else:
+        prepared.image = None
+    return prepared
+
+
+def remember(prepared: PreparedImage, response: VLMResponse):
+    """Generate edilen sonucu cache'e yaz (senkron, executor'da çağrılır)"""
+    result_cache.put(prepared.key, prepared.context, prepared.phash, {
+        "analysis": response.analysis,
+        "content_type": response.content_type,
+        "vision_tokens": response.vision_tokens,
+        "image_size": response.image_size,
+        "output_tokens": response.output_tokens,
+        "finish_reason": response.finish_reason,
+    })
+
+
+def is_negative_answer(text: str, stop_prefixes: Tuple[str, ...], complete: bool = True) -> bool:
+    """
+    Cevap olumsuz bir ifadeyle mi başlıyor ("Tablo yok", "'Diyagram yok'." ...)
+
+    İfadeden sonra boşluk / noktalama ya da metnin sonu gelmeli: "Tablo yoklama..."
+    olumsuz değildir. complete=False (üretim sürerken) metin sonu sınır sayılmaz;
+    sınırı oluşturan token gelene kadar karar verilmez.
+    """
+    normalized = text.lstrip().lstrip("'\"*`").casefold()
+    boundary = r"(?=[\s.,;:!?'\"`*)])" if not complete else r"(?=[\s.,;:!?'\"`*)]|$)"
+    return any(re.match(re.escape(prefix.casefold()) + boundary, normalized) for prefix in stop_prefixes)
+
+
+class RowStoppingCriteria(StoppingCriteria):
+    """
+    Batch'in her satırını kendi işine göre durdurur
+
+    Satır; işin token bütçesi dolunca ("length"), cevap olumsuz önekle başlayınca
+    ("negative") ya da isteği iptal edilince ("cancelled") biter. Biten satır
+    generate'te pad ile devam eder; tüm satırlar bitince generate durur.
+    """
+
+    def __init__(self, jobs: List[GenerationJob], prompt_length: int, tokenizer, eos_ids: set):
+        self.jobs = jobs
+        self.prompt_length = prompt_length
+        self.tokenizer = tokenizer
+        self.eos_ids = eos_ids
+        self.reasons: List[Optional[str]] = [None] * len(jobs)
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        generated = input_ids[:, self.prompt_length:]
+        length = generated.shape[1]
+        for row, job in enumerate(self.jobs):
+            if self.reasons[row] is not None:
+                continue
+            if int(generated[row, -1]) in self.eos_ids:
+                self.reasons[row] = "stop"
+            elif job.future.cancelled():
+                self.reasons[row] = "cancelled"
+            elif length >= job.max_new_tokens:
+                self.reasons[row] = "length"
+            elif job.stop_prefixes and length <= STOP_CHECK_TOKENS and is_negative_answer(
+                self.tokenizer.decode(generated[row], skip_special_tokens=True), job.stop_prefixes, complete=False
+            ):
+                self.reasons[row] = "negative"
+        return torch.tensor([reason is not None for reason in self.reasons], device=input_ids.device)
+
+
+class TokenFanout(BaseStreamer):
+    """
+    generate'in her adımda ürettiği token'ları akış isteyen satırların kuyruğuna
+    metin parçası olarak iletir (inference thread'inden event loop'a)
+
+    Satırın token'ları her adımda baştan decode edilir; yarım UTF-8 karakterle
+    biten metin bir sonraki adımı bekler. Biten satırlara gelen pad token'ları
+    skip_special_tokens ile düşer.
+    """
+
+    def __init__(self, jobs: List[GenerationJob], tokenizer):
+        self.jobs = jobs
+        self.tokenizer = tokenizer
+        self.tokens: List[List[int]] = [[] for _ in jobs]
+        self.prompt_seen = False
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True  # İlk çağrı prompt'un kendisi
+            return
+        value = value.reshape(len(self.jobs), -1)
+        for row, job in enumerate(self.jobs):
+            if job.stream is None or job.future.cancelled():
+                continue
+            self.tokens[row].extend(value[row].tolist())
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            if len(text) <= job.streamed_chars or text.endswith("\ufffd"):
+                continue
+            delta = text[job.streamed_chars:]
+            job.streamed_chars = len(text)
+            job.future.get_loop().call_soon_threadsafe(job.stream.put_nowait, delta)
+
+    def end(self):
+        pass
+
+
+def generate_batch(
+    images: List[Image.Image], prompts: List[str], max_new_tokens: int = 1024,
+    jobs: Optional[List[GenerationJob]] = None
+) -> List[GenerationResult]:
+    """
+    Görsel + prompt çiftlerini tek pad'lenmiş model.generate ile üret (senkron)
+
+    Prompt'lar sola pad'lenir (decoder-only generate); çıktıdan prompt token'ları
+    atılır, sadece modelin cevabı döner. jobs verilirse her satır kendi token
+    bütçesi / olumsuz cevap / iptal kontrolüyle durur, akış isteyen satırların
+    token'ları üretildikçe iletilir.
+    """
+    text_prompts = [
+        # Chat formatı → text prompt
+        processor.apply_chat_template(
+            [{"role": "user", "content": [{"type": "image", "image": image}, {"type": "text", "text": prompt}]}],
+            add_generation_prompt=True
+        )
+        for image, prompt in zip(images, prompts)
+    ]
+
+    processor.tokenizer.padding_side = "left"
+    inputs = processor(
+        text=text_prompts,
+        images=images,
+        padding=True,
+        return_tensors="pt"
+    ).to(DEVICE)
+
+    prompt_length = inputs["input_ids"].shape[1]
+    eos_ids = model.generation_config.eos_token_id
+    eos_ids = set(eos_ids if isinstance(eos_ids, list) else [eos_ids] if eos_ids is not None else [])
+    stopping = RowStoppingCriteria(jobs, prompt_length, processor.tokenizer, eos_ids) if jobs else None
+    streamer = TokenFanout(jobs, processor.tokenizer) if jobs and any(job.stream for job in jobs) else None
+
+    # Generate
+    with torch.no_grad():
+        generated_ids = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=StoppingCriteriaList([stopping]) if stopping else None,
+            streamer=streamer,
+        )
+
+    new_tokens = generated_ids[:, prompt_length:]
+    texts = processor.batch_decode(new_tokens, skip_special_tokens=True)
+    # image_grid_thw: görsel başına (zaman, yükseklik, genişlik) patch sayısı; merge_size² patch = 1 token
+    merge = getattr(processor.image_processor, "merge_size", 2)
+    vision_tokens = [int(grid.prod()) // (merge * merge) for grid in inputs["image_grid_thw"]]
+    pad_id = processor.tokenizer.pad_token_id
+    results = []
+    for row, text in enumerate(texts):
+        output_tokens = int((new_tokens[row] != pad_id).sum()) if pad_id is not None else new_tokens.shape[1]
+        reason = stopping.reasons[row] if stopping else None
+        if reason is None:
+            reason = "length" if new_tokens.shape[1] >= max_new_tokens else "stop"
+        results.append(GenerationResult(text.strip(), vision_tokens[row], output_tokens, reason))
+    return results
+
+
+def generate(image: Image.Image, prompt: str, max_new_tokens: int = 1024) -> str:
+    """Tek görsel + prompt için model.generate (senkron)"""
+    return generate_batch([image], [prompt], max_new_tokens)[0].text
 
 
 
@@ -175,50 +804,339 @@ def detect_content_type(analysis: str) -> str:
 
 
 
+def request_shape(request: Union[VLMRequest, VLMBatchRequest], item_status: Optional[List[int]] = None) -> dict:
+    """Trafik kaydı için isteğin payload'sız boyut bilgisi (batch: öğe başına + sonuç durumu)"""
+    if isinstance(request, VLMBatchRequest):
+        items = [request_shape(item) for item in request.items]
+        for shape, status in zip(items, item_status or []):
+            shape["status"] = status
+        return {"items": items}
+    shape = {
+        "task": request.task,
+        "language": request.language,
+        "image_base64_chars": len(request.image_base64),
+    }
+    try:
+        # Sadece başlık okunur, piksel verisi çözülmez
+        image = Image.open(io.BytesIO(base64.b64decode(request.image_base64)))
+        shape.update(width=image.width, height=image.height, format=image.format)
+    except Exception:
+        pass
+    return shape
+
+
+@app.middleware("http")
+async def capture_traffic(request: Request, call_next):
+    """Açıksa analiz isteklerini süre ve durum koduyla kaydet"""
+    if traffic_capture is None or request.url.path not in CAPTURED_ENDPOINTS or not traffic_capture.sampled():
+        return await call_next(request)
+    started_at = time.time()
+    started = time.perf_counter()
+    response = await call_next(request)
+
+    def record():
+        # Endpoint çözümlenen gövdeyi request.state'e bırakır (doğrulama hatasında yok)
+        body = getattr(request.state, "capture", None)
+        shape = request_shape(body, getattr(request.state, "capture_items", None)) if body is not None else None
+        outcome = getattr(request.state, "capture_outcome", None)
+        if shape is not None and outcome is not None:
+            shape["outcome"] = outcome
+        traffic_capture.record(
+            request.url.path, started_at, (time.perf_counter() - started) * 1000, response.status_code,
+            shape, body.model_dump() if body is not None and traffic_capture.payloads else None,
+        )
+
+    if request.url.path != "/analyze/stream" or response.status_code != 200:
+        record()
+        return response
+
+    # Akış: call_next başlıklar gönderilince döner; kayıt akış bitince (ya da kopunca) yazılır
+    body_iterator = response.body_iterator
+
+    async def recorded_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            record()
+
+    response.body_iterator = recorded_body()
+    return response
+
+
+
 # --------------------------------------------------------
 # API ENDPOINTS
 # --------------------------------------------------------
+def _require_ready():
+    """Model hazır değilse 503 (yükleniyor) / 500 (yüklenemedi)"""
+    if load_state == "failed":
+        raise HTTPException(status_code=500, detail=load_error)
+    if load_state != "ready":
+        raise HTTPException(status_code=503, detail=f"Model henüz hazır değil ({load_state})",
+                            headers={"Retry-After": "10"})
+
+
+def _queue_full(error: QueueFullError) -> HTTPException:
+    """Kuyruk dolu → 429 + tahmini boşalma süresi"""
+    logger.warning(f"⏳ İstek reddedildi: {error}")
+    return HTTPException(
+        status_code=429,
+        detail={"error": str(error), **generation_queue.stats()},
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after_s)))}
+    )
+
+
+def build_response(request: VLMRequest, analysis: str, job: GenerationJob) -> VLMResponse:
+    """Model çıktısı + kuyruk zamanlamalarıyla yanıt"""
+    return VLMResponse(
+        task=request.task,
+        analysis=analysis,
+        confidence=0.95,
+        # "Tablo yok" gibi olumsuz cevap içerik tipi değil ("tablo" kelimesi geçse de)
+        content_type="text" if is_negative_answer(analysis, job.stop_prefixes) else detect_content_type(analysis),
+        queue_position=job.position,
+        queue_wait_ms=round((job.started_at - job.enqueued_at) * 1000, 2),
+        generation_ms=round((job.finished_at - job.started_at) * 1000, 2),
+        batch_size=job.batch_size,
+        vision_tokens=job.vision_tokens,
+        image_size=list(job.image.size),
+        output_tokens=job.output_tokens,
+        finish_reason=job.finish_reason
+    )
+
+
+def cached_response(request: VLMRequest, hit: CacheHit) -> VLMResponse:
+    """Cache'teki sonuçla yanıt (kuyruk / generate alanları boş)"""
+    return VLMResponse(
+        task=request.task,
+        analysis=hit.value["analysis"],
+        confidence=0.95,
+        content_type=hit.value["content_type"],
+        vision_tokens=hit.value.get("vision_tokens"),
+        image_size=hit.value.get("image_size"),
+        cache=hit.kind,
+        output_tokens=hit.value.get("output_tokens"),
+        finish_reason=hit.value.get("finish_reason")
+    )
+
+
 @app.post("/analyze", response_model=VLMResponse)
-async def analyze_image(request: VLMRequest) -> VLMResponse:
+async def analyze_image(request: VLMRequest, http_request: Request) -> VLMResponse:
+    http_request.state.capture = request
+    _require_ready()
+
+    logger.info(f"📥 Analiz isteği: task={request.task}")
+
+    loop = asyncio.get_running_loop()
     try:
-        logger.info(f"📥 Analiz isteği: task={request.task}")
-
-        # Görev bazlı prompt seçimi
-        prompts = {
-            "extract": "Bu görselde ne var? (Tablo, grafik, diyagram, metin?) Kısaca cevapla.",
-            "describe": "Bu görseli detaylı olarak Türkçe açıkla.",
-            "table": "Eğer bu görselde tablo varsa, Markdown formatında çıkar. Yoksa 'Tablo yok' de.",
-            "diagram": "Eğer bu görselde diyagram varsa, neyi gösterdiğini açıkla. Yoksa 'Diyagram yok' de."
-        }
+        prepared = await loop.run_in_executor(None, prepare_image, request.image_base64, request.task)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Görsel çözülemedi: {e}")
+    if prepared.hit is not None:
+        logger.info(f"💾 Cache'ten döndü ({prepared.hit.kind})")
+        return cached_response(request, prepared.hit)
 
-        prompt = prompts.get(request.task, prompts["extract"])
+    try:
+        job, = generation_queue.submit([prepared.queue_item()])
+    except QueueFullError as e:
+        raise _queue_full(e)
+    if job.position:
+        logger.info(f"🕒 Kuyrukta {job.position} iş önde")
 
-        # Modelden çıktı al
-        analysis = await infer_with_model(request.image_base64, prompt)
-        content_type = detect_content_type(analysis)
+    try:
+        # Modelden çıktı al (inference thread'inde; event loop serbest)
+        analysis = await job.future
+    except Exception as e:
+        logger.error(f"❌ Inference hatası: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        logger.info(f"✅ Analiz tamamlandı. type={content_type}")
+    response = build_response(request, analysis, job)
+    await loop.run_in_executor(None, remember, prepared, response)
+    logger.info(f"✅ Analiz tamamlandı. type={response.content_type}")
+    return response
 
-        return VLMResponse(
-            task=request.task,
-            analysis=analysis,
-            confidence=0.95,
-            content_type=content_type
-        )
 
+def sse_event(event: str, data: dict) -> str:
+    """Server-sent events formatında tek olay"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: VLMRequest, http_request: Request):
+    """
+    Görsel analizi, token'lar üretildikçe server-sent events olarak
+
+    Olaylar: queued (kuyruk sırası) → token (metin parçası, tekrarlı) → done
+    (VLMResponse) ya da error. İstemci bağlantıyı kapatırsa iş kuyruktan düşer,
+    generate ediliyorsa o satır bir sonraki adımda durur. Model hazır değil /
+    kuyruk dolu / görsel bozuk hataları akış başlamadan normal HTTP hatası döner.
+    """
+    http_request.state.capture = request
+    _require_ready()
+    logger.info(f"📥 Akışlı analiz isteği: task={request.task}")
+
+    loop = asyncio.get_running_loop()
+    try:
+        prepared = await loop.run_in_executor(None, prepare_image, request.image_base64, request.task)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Görsel çözülemedi: {e}")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    if prepared.hit is not None:
+        response = cached_response(request, prepared.hit)
+
+        async def cached_events():
+            http_request.state.capture_outcome = "cache"
+            yield sse_event("token", {"text": response.analysis})
+            yield sse_event("done", response.model_dump())
 
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+
+    try:
+        job, = generation_queue.submit([prepared.queue_item()], stream=True)
+    except QueueFullError as e:
+        raise _queue_full(e)
+
+    async def events():
+        try:
+            yield sse_event("queued", {
+                "queue_position": job.position,
+                "estimated_wait_s": generation_queue.estimate_wait_s(job.position),
+            })
+            while (delta := await job.stream.get()) is not None:
+                yield sse_event("token", {"text": delta})
+            try:
+                analysis = job.future.result()
+            except Exception as e:
+                logger.error(f"❌ Inference hatası: {e}")
+                http_request.state.capture_outcome = "error"
+                yield sse_event("error", {"status": 500, "detail": str(e)})
+                return
+            response = build_response(request, analysis, job)
+            await loop.run_in_executor(None, remember, prepared, response)
+            http_request.state.capture_outcome = "done"
+            logger.info(f"✅ Akışlı analiz tamamlandı. type={response.content_type}")
+            yield sse_event("done", response.model_dump())
+        finally:
+            if not job.future.done():
+                http_request.state.capture_outcome = "cancelled"
+                job.future.cancel()  # İstemci vazgeçti: kuyruktan düşer / generate'te satır durur
+                logger.info("🛑 Akışlı analiz istemci tarafından kesildi")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/analyze/batch", response_model=VLMBatchResponse)
+async def analyze_batch(request: VLMBatchRequest, http_request: Request) -> VLMBatchResponse:
+    """
+    Çoklu görsel analizi (ör. PDF sayfaları)
+
+    Öğeler kuyruğa birlikte girer ve pad'lenmiş batch'ler halinde generate edilir.
+    Çözülemeyen görsel (400) ya da generate hatası (500) sadece o öğenin sonucunda
+    döner; kuyrukta tüm öğelere yer yoksa istek bütünüyle 429 alır.
+    """
+    http_request.state.capture = request
+    _require_ready()
+    if not request.items:
+        raise HTTPException(status_code=400, detail="En az 1 öğe gerekli")
+    if len(request.items) > MAX_QUEUE:
+        raise HTTPException(status_code=400, detail=f"Tek istekte en fazla {MAX_QUEUE} öğe (VLM_MAX_QUEUE)")
+
+    started = time.perf_counter()
+    logger.info(f"📥 Toplu analiz isteği: {len(request.items)} görsel")
+    loop = asyncio.get_running_loop()
+    prepared_items = await asyncio.gather(
+        *(loop.run_in_executor(None, prepare_image, item.image_base64, item.task) for item in request.items),
+        return_exceptions=True
+    )
+
+    results: List[Optional[VLMBatchItemResult]] = [None] * len(request.items)
+    pending = []
+    for index, (item, prepared) in enumerate(zip(request.items, prepared_items)):
+        if isinstance(prepared, Exception):
+            results[index] = VLMBatchItemResult(index=index, status=400, error=f"Görsel çözülemedi: {prepared}")
+        elif prepared.hit is not None:
+            results[index] = VLMBatchItemResult(index=index, result=cached_response(item, prepared.hit))
+        else:
+            pending.append((index, item, prepared))
+
+    if pending:
+        try:
+            jobs = generation_queue.submit([prepared.queue_item() for _, _, prepared in pending])
+        except QueueFullError as e:
+            raise _queue_full(e)
+        analyses = await asyncio.gather(*(job.future for job in jobs), return_exceptions=True)
+        for (index, item, prepared), job, analysis in zip(pending, jobs, analyses):
+            if isinstance(analysis, Exception):
+                logger.error(f"❌ Öğe {index} inference hatası: {analysis}")
+                results[index] = VLMBatchItemResult(index=index, status=500, error=str(analysis))
+            else:
+                response = build_response(item, analysis, job)
+                await loop.run_in_executor(None, remember, prepared, response)
+                results[index] = VLMBatchItemResult(index=index, result=response)
+
+    http_request.state.capture_items = [result.status for result in results]
+    failed = sum(1 for result in results if result.error is not None)
+    cached = sum(1 for result in results if result.result is not None and result.result.cache)
+    logger.info(f"✅ Toplu analiz tamamlandı: {len(results) - failed}/{len(results)} başarılı ({cached} cache'ten)")
+    return VLMBatchResponse(
+        results=results,
+        total_items=len(results),
+        failed=failed,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2)
+    )
+
+
+@app.get("/queue")
+async def queue_status():
+    """Kuyruk durumu: bekleyen / çalışan iş, ortalama generate süresi, tahmini bekleme"""
+    return generation_queue.stats()
+
+
+@app.get("/cache")
+async def cache_status():
+    """Sonuç cache'i: kayıt sayısı, boyut, birebir / yakın kopya isabetleri, hit rate"""
+    return result_cache.stats()
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: process ayakta (model yüklenirken de 200)"""
+    if load_state == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed", "error": load_error})
+    return {"status": "alive", "state": load_state, "uptime_s": round(time.time() - PROCESS_STARTED, 2)}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: model yüklendi, ısındı, /analyze istek kabul ediyor"""
+    if load_state != "ready":
+        return JSONResponse(
+            status_code=503,
+            content={"status": load_state, "uptime_s": round(time.time() - PROCESS_STARTED, 2), "error": load_error},
+            headers={"Retry-After": "10"}
+        )
+    return {"status": "ready", "time_to_ready_s": round(time_to_ready, 2)}
 
 
 @app.get("/health")
 async def health():
     return {
-        "status": "healthy" if model is not None else "loading",
+        "status": "healthy" if load_state == "ready" else load_state,
         "model": MODEL_ID,
         "device": DEVICE,
         "dtype": str(TORCH_DTYPE),
-        "model_loaded": model is not None
+        "model_loaded": model is not None,
+        "weights": weights_source or "huggingface",
+        "load_seconds": round(load_seconds, 2) if load_seconds is not None else None,
+        "warmup_seconds": round(warmup_seconds, 2) if warmup_seconds is not None else None,
+        "time_to_ready_s": round(time_to_ready, 2) if time_to_ready is not None else None,
+        "queue": generation_queue.stats(),
+        "vision_tokens": TASK_VISION_TOKENS,
+        "result_cache": result_cache.stats(),
+        "placement": cpu_placement.report() if cpu_placement is not None else None,
+        "capture": traffic_capture.stats() if traffic_capture is not None else None
     }
 
 
@@ -227,7 +1145,7 @@ async def health():
 async def root():
     return {
         "name": "Qwen2.5-VL-7B-Instruct (Lokal Transformers)",
-        "endpoints": ["/analyze", "/health"],
+        "endpoints": ["/analyze", "/analyze/batch", "/analyze/stream", "/queue", "/cache", "/health", "/health/live", "/health/ready"],
         "device": DEVICE
     }
 